@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+    Times discovering generated test modules with thousands of tests, fixtures and groups.
+    Each namespace (module, group class) used to be scanned with dir() and getattr() once per
+    fixture type and again for tests, scoped fixtures and groups
+
+    Run from the repo root: python benchmarks/discovery_scan.py
+"""
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from end2 import discovery
+from end2.constants import RunMode
+from end2.fixtures import (
+    fixture,
+    on_failures_in_module,
+    setup,
+    setup_test,
+    teardown,
+    teardown_test
+)
+from end2.models.testing_containers import (
+    TestModule,
+    TestPackage
+)
+from end2.pattern_matchers import DefaultTestCasePatternMatcher
+
+
+_GROUPS = 10
+_RUNS = 3
+
+
+def create_namespace(namespace, tests: int) -> None:
+    def create_test(name: str):
+        def test(logger):
+            pass
+        test.__name__ = name
+        return test
+    for i in range(tests):
+        setattr(namespace, f'test_{i}', create_test(f'test_{i}'))
+        # Helpers that aren't tests still get looked at
+        setattr(namespace, f'helper_{i}', create_test(f'helper_{i}'))
+    for decorator in (setup, setup_test, teardown, teardown_test):
+        setattr(namespace, f'my_{decorator.__name__}', decorator(create_test(f'my_{decorator.__name__}')))
+    setattr(namespace, 'my_fixture', fixture()(create_test('my_fixture')))
+
+
+def create_module(name: str, tests: int) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__file__ = __file__
+    module.__run_mode__ = RunMode.PARALLEL
+    create_namespace(module, tests // (_GROUPS + 1))
+    module.on_failures = on_failures_in_module(lambda logger: None)
+    for i in range(_GROUPS):
+        group = type(f'Group{i}', (), {})
+        create_namespace(group, tests // (_GROUPS + 1))
+        setattr(module, group.__name__, group)
+    return module
+
+
+def discover(tests: int) -> float:
+    seconds = 0.0
+    for run in range(_RUNS):
+        # New modules every run so nothing discovered before is reused
+        package = types.ModuleType(f'benchmark_package_{tests}_{run}')
+        module = create_module(f'{package.__name__}.benchmark_module', tests)
+        start = time.perf_counter()
+        TestPackage(package)
+        groups = discovery.discover_groups(module, DefaultTestCasePatternMatcher([], '', True))
+        TestModule(module, groups)
+        seconds += time.perf_counter() - start
+    return seconds / _RUNS
+
+
+if __name__ == '__main__':
+    for tests in (1000, 5000, 20000):
+        print(f'{tests:>6} tests: {discover(tests):.3f}s')
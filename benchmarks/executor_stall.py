@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+    Runs more parallel modules than --max-workers and reports how long each run takes. Before
+    module runs got their own coordinating threads every pool thread ended up waiting on tests that
+    could never get a thread so the run stalled forever
+
+    Run from the repo root: python benchmarks/executor_stall.py
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from end2 import discovery
+from end2.arg_parser import default_parser
+from end2.constants import RunMode
+from end2.logger import SuiteLogManager
+from end2.models.testing_containers import (
+    TestModule,
+    TestPackage
+)
+from end2.pattern_matchers import DefaultTestCasePatternMatcher
+from end2.runner import (
+    SuiteRun,
+    default_test_parameters
+)
+
+
+_MODULES = 8
+_TESTS_PER_MODULE = 10
+_TEST_SECONDS = 0.02
+_STALL_SECONDS = 30.0
+
+
+def create_test_module(name: str) -> TestModule:
+    module = types.ModuleType(name)
+    module.__file__ = __file__
+    module.__run_mode__ = RunMode.PARALLEL
+    for i in range(_TESTS_PER_MODULE):
+        def test(logger):
+            time.sleep(_TEST_SECONDS)
+        test.__name__ = f'test_{i}'
+        setattr(module, test.__name__, test)
+    return TestModule(module, discovery.discover_groups(module, DefaultTestCasePatternMatcher([], '', True)))
+
+
+def run(max_workers: int, log_folder: str) -> float:
+    package = TestPackage(types.ModuleType('benchmark_package'))
+    for i in range(_MODULES):
+        package.append_module(create_test_module(f'benchmark_module_{i}'))
+    args = default_parser().parse_args(['--max-workers', str(max_workers)])
+    log_manager = SuiteLogManager(f'benchmark_{max_workers}', base_folder=os.path.join(log_folder, str(max_workers)))
+    suite_run = SuiteRun(args, default_test_parameters, None, log_manager)
+    start = time.monotonic()
+    thread = threading.Thread(target=suite_run.run_packages, args=([package],), daemon=True)
+    thread.start()
+    thread.join(_STALL_SECONDS)
+    log_manager.close()
+    return None if thread.is_alive() else time.monotonic() - start
+
+
+if __name__ == '__main__':
+    ideal = _MODULES * _TESTS_PER_MODULE * _TEST_SECONDS
+    with tempfile.TemporaryDirectory() as log_folder:
+        for max_workers in (1, 2, 4, _MODULES, _MODULES * 2):
+            seconds = run(max_workers, log_folder)
+            if seconds is None:
+                print(f'--max-workers {max_workers:>2}: STALLED (no progress after {_STALL_SECONDS:.0f}s)')
+                # Pool threads that are stuck can't be joined so exit without waiting on them
+                os._exit(1)
+            print(f'--max-workers {max_workers:>2}: {seconds:.2f}s (ideal {ideal / max_workers:.2f}s)')
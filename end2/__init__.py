@@ -5,6 +5,7 @@ from .exceptions import (
     SkipTestException
 )
 from .fixtures import (
+    fixture,
     on_failures_in_module,
     on_test_failure,
     metadata,
@@ -16,7 +17,7 @@ from .fixtures import (
 )
 
 __all__ = [
-    'IgnoreTestException', 'on_failures_in_module', 'on_test_failure',
+    'fixture', 'IgnoreTestException', 'on_failures_in_module', 'on_test_failure',
     'metadata', 'parameterize', 'RunMode', 'setup', 'setup_test',
     'SkipTestException', 'teardown', 'teardown_test'
 ]
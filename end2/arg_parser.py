@@ -4,6 +4,7 @@ from typing import (
     List,
     Set
 )
+from end2.constants import Order
 from end2.models.testing_containers import Importable
 
 from end2.resource_profile import (
@@ -50,14 +51,45 @@ excluding - anything on the right side of a '\!' will be excluded:
                                help="List of regex expression to search for tests")
     parent_parser.add_argument('--max-workers', type=int, default=rc['settings'].getint('max-workers'),
                                help='Total number of workers allowed to run concurrently')
+    parent_parser.add_argument('--adaptive-concurrency', action='store_true', default=rc['settings'].getboolean('adaptive-concurrency'),
+                               help='Grow or shrink the number of tests running at once between --min-workers and '
+                                    '--max-workers based on how healthy and fast tests are')
+    parent_parser.add_argument('--min-workers', type=int, default=rc['settings'].getint('min-workers'),
+                               help='Fewest number of tests adaptive concurrency will run at once')
+    parent_parser.add_argument('--max-async-tasks', type=int, default=rc['settings'].getint('max-async-tasks'),
+                               help='Total number of async tests allowed to run concurrently in a module; 0 means no limit')
     parent_parser.add_argument('--max-log-folders', type=int, default=rc['settings'].getint('max-log-folders'),
                                help='Total number of max log folders')
     parent_parser.add_argument('--no-concurrency', action='store_true', default=rc['settings'].getboolean('no-concurrency'),
                                help='Make all tests run sequentially')
+    parent_parser.add_argument('--executor', choices=['thread', 'process'], default=rc['settings'].get('executor'),
+                               help='Run parallel modules in a thread pool or in a pool of processes forked after discovery')
+    parent_parser.add_argument('--order', choices=[x.value for x in Order], default=rc['settings'].get('order'),
+                               help='Order modules and tests are started in; longest-first uses durations from previous runs and '
+                                    'fast-feedback starts recently failed tests then modified modules first')
+    parent_parser.add_argument('--lazy-import', action='store_true', default=rc['settings'].getboolean('lazy-import'),
+                               help='Discover test modules by reading their source and only import them right before they run; '
+                                    'modules defining tests dynamically are still imported during discovery')
     parent_parser.add_argument('--stop-on-fail', action='store_true', default=rc['settings'].getboolean('stop-on-fail'),
-                               help='Make all tests run sequentially')
+                               help='Stop the whole run at the 1st failed test; tests that have not started are skipped')
+    parent_parser.add_argument('--reruns', type=int, default=rc['settings'].getint('reruns'),
+                               help='Number of times failed tests are ran again in the same run')
     parent_parser.add_argument('--event-timeout', type=float, default=rc['settings'].getfloat('event-timeout'),
                                help='Timeout value in seconds used if end() is not called in time')
+    parent_parser.add_argument('--test-timeout', type=float, default=rc['settings'].getfloat('test-timeout'),
+                               help='Timeout value in seconds for each test and test fixture; 0 means no timeout. '
+                                    '@metadata(timeout=...) overrides it')
+    parent_parser.add_argument('--shard-index', type=int, default=0,
+                               help='Index (starting at 0) of the shard to run out of --shard-count shards')
+    parent_parser.add_argument('--shard-count', type=int, default=1,
+                               help='Total number of shards the suite is split into; balanced by durations in --shard-history')
+    parent_parser.add_argument('--shard-history', metavar='PATH',
+                               help='Run history file every shard balances by; without it shards are only balanced by test count')
+    distributed_group = parent_parser.add_mutually_exclusive_group()
+    distributed_group.add_argument('--coordinator', metavar='ADDRESS',
+                                   help='Serve modules to --worker processes on host:port or a Unix socket path')
+    distributed_group.add_argument('--worker', metavar='ADDRESS',
+                                   help='Pull modules from the --coordinator at host:port or a Unix socket path and run them')
     parent_parser.add_argument('--watch', action='store_true', help='Watches files matched in suite arg')
     return parent_parser
 
@@ -71,16 +103,20 @@ class SuiteArg:
         self.excluded_paths = []
         rc = get_rc()
         disabled_suites = list(rc[self.rc_disabled].keys())
+        split_paths = []
         for path in self._resolve_paths(set(paths), rc[self.rc_alias], disabled_suites):
             paths_str, tests_str = path, ''
             if '::' in path:
                 paths_str, tests_str = path.split('::')
-            module_matcher = module_class.parse_str(paths_str)
+            split_paths.append((paths_str, tests_str))
+        # All at once so matchers that search the file system only do it once
+        module_matchers = module_class.parse_strs([x[0] for x in split_paths])
+        for (paths_str, tests_str), module_matcher in zip(split_paths, module_matchers):
             if module_matcher.included_items:
                 for path in module_matcher.included_items:
-                    self.paths.append(
-                        Importable(path, module_matcher, test_class.parse_str(tests_str))
-                    )
+                    test_matcher = test_class.parse_str(tests_str)
+                    module_matcher.bind(test_matcher)
+                    self.paths.append(Importable(path, module_matcher, test_matcher))
             else:
                 self.excluded_paths.extend(module_matcher.excluded_items)
         self.excluded_paths.extend(disabled_suites)
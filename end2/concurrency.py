@@ -0,0 +1,90 @@
+"""
+    Adaptive concurrency: instead of always dispatching up to --max-workers tests at once, the
+    number of tests in flight grows by 1 each time a full round of tests finishes healthy and is
+    halved when too many tests in a row time out, fail or run much slower than they used to (AIMD)
+"""
+import asyncio
+from collections import deque
+from logging import Logger
+import threading
+from time import monotonic
+from typing import (
+    Callable,
+    List,
+    Tuple
+)
+
+from end2.constants import Status
+from end2.models.result import TestMethodResult
+
+
+_POLL_SECONDS = 0.05
+
+
+class AdaptiveConcurrency:
+    def __init__(self, min_limit: int, max_limit: int, logger: Logger
+                 , expected_seconds: Callable[[str, str], float] = None, window: int = 10
+                 , unhealthy_ratio: float = 0.3, slow_factor: float = 2.0) -> None:
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.logger = logger
+        self.expected_seconds = expected_seconds or (lambda module_name, test_name: None)
+        self.unhealthy_ratio = unhealthy_ratio
+        self.slow_factor = slow_factor
+        self.limit = float(self.min_limit)
+        self.in_flight = 0
+        # (seconds since start, limit) every time the limit changes
+        self.history: List[Tuple[float, int]] = [(0.0, self.min_limit)]
+        self._outcomes = deque(maxlen=window)
+        self._start = monotonic()
+        self._condition = threading.Condition()
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    def try_acquire(self) -> bool:
+        with self._condition:
+            if self.in_flight >= self.current_limit:
+                return False
+            self.in_flight += 1
+        return True
+
+    def acquire(self) -> None:
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_flight < self.current_limit)
+            self.in_flight += 1
+
+    async def acquire_async(self) -> None:
+        while not self.try_acquire():
+            await asyncio.sleep(_POLL_SECONDS)
+
+    def release(self, module_name: str, result: TestMethodResult = None) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            if result is not None and result.status is not Status.SKIPPED:
+                self._update(self._is_unhealthy(module_name, result))
+            self._condition.notify_all()
+
+    def _is_unhealthy(self, module_name: str, result: TestMethodResult) -> bool:
+        if result.status is Status.FAILED:
+            return True
+        expected = self.expected_seconds(module_name, result.name)
+        return bool(expected) and result.total_seconds > expected * self.slow_factor
+
+    def _update(self, unhealthy: bool) -> None:
+        previous = self.current_limit
+        self._outcomes.append(unhealthy)
+        if len(self._outcomes) == self._outcomes.maxlen and sum(self._outcomes) / len(self._outcomes) >= self.unhealthy_ratio:
+            self.limit = max(float(self.min_limit), self.limit / 2)
+            # Start a fresh window so 1 bad stretch only halves the limit once
+            self._outcomes.clear()
+            reason = 'too many slow or failed tests'
+        elif not unhealthy:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.current_limit)
+            reason = 'tests are healthy'
+        else:
+            return
+        if self.current_limit != previous:
+            self.history.append((monotonic() - self._start, self.current_limit))
+            self.logger.info(f'Adaptive concurrency: {previous} -> {self.current_limit} tests at once ({reason})')
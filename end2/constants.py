@@ -7,9 +7,24 @@ from enum import Enum
 
 
 FUNCTION_TYPE = type(lambda: None)
+RESOURCES = '__resources__'
 TAGS = '__tags__'
 
 
+class FixtureScope(Enum):
+    GROUP = 'group'
+    MODULE = 'module'
+    PACKAGE = 'package'
+    SUITE = 'suite'
+    TEST = 'test'
+
+
+class Order(Enum):
+    FAST_FEEDBACK = 'fast-feedback'
+    LONGEST_FIRST = 'longest-first'
+    RANDOM = 'random'
+
+
 class RunMode(Enum):
     PARALLEL = 'parallel'
     SEQUENTIAL = 'sequential'
@@ -1,7 +1,8 @@
+import functools
 import importlib
-import inspect
 import os
 from random import shuffle
+import types
 from typing import (
     List,
     Tuple,
@@ -9,18 +10,21 @@ from typing import (
 )
 
 from end2.fixtures import (
-    empty_func,
-    get_fixture,
+    get_namespace_contents,
     setup,
     setup_test,
     teardown,
     teardown_test
 )
 from end2.constants import (
-    FUNCTION_TYPE,
-    RunMode
+    RESOURCES,
+    RunMode,
+    TAGS
+)
+from end2.exceptions import (
+    MoreThan1SameFixtureException,
+    TestCodeException
 )
-from end2.exceptions import MoreThan1SameFixtureException
 from end2.models.testing_containers import (
     Importable,
     TestGroups,
@@ -33,6 +37,13 @@ from end2.pattern_matchers import (
     DefaultModulePatternMatcher,
     DefaultTestCasePatternMatcher
 )
+from end2.resource_profile import DISCOVERY_INDEX_PATH
+from end2.static_discovery import (
+    RUN_MODE,
+    DiscoveryIndex,
+    StaticGroup,
+    parse_test_module
+)
 
 
 def _shuffle_dict(dict_: dict) -> dict:
@@ -41,7 +52,12 @@ def _shuffle_dict(dict_: dict) -> dict:
     return dict(list_)
 
 
-def discover_suite(importables: List[Importable]) -> Tuple[TestPackageTree, set]:    
+def discover_suite(importables: List[Importable], lazy_import: bool = False) -> Tuple[TestPackageTree, set]:
+    """
+    lazy_import reads test modules with ast and only imports them right before they run; modules
+    that can't be read that way are imported like usual. What was read is kept in DISCOVERY_INDEX_PATH
+    """
+    index = DiscoveryIndex.load(DISCOVERY_INDEX_PATH) if lazy_import else None
     shuffle(importables)
     failed_imports = set()
     package_tree = TestPackageTree()
@@ -49,7 +65,7 @@ def discover_suite(importables: List[Importable]) -> Tuple[TestPackageTree, set]
         package_name = importable.path.replace(os.sep, '.')
         package = package_tree.find_by_str(package_name)
         if os.path.isdir(importable.path):
-            p, f = discover_packages(importable.path, importable.module_matcher, importable.test_matcher, package)
+            p, f = discover_packages(importable.path, importable.module_matcher, importable.test_matcher, package, index)
             if p:
                 package_tree.append(p)
             failed_imports |= f
@@ -66,16 +82,19 @@ def discover_suite(importables: List[Importable]) -> Tuple[TestPackageTree, set]
                 for package_name in package_names[1:-1]:
                     new_package = importlib.import_module(package_name)
                     package.tail(new_package)
-            m, f = discover_module(importable.path, importable.module_matcher, importable.test_matcher)
+            m, f = _discover_module(importable.path, importable.module_matcher, importable.test_matcher, index)
             if m:
                 package.append_module(m)
             elif f:
                 failed_imports.add(f)
             package_tree.append(package)
+    if index is not None:
+        index.save()
     return package_tree, failed_imports
 
 
-def discover_packages(importable: str, module_pattern_matcher: DefaultModulePatternMatcher, test_pattern_matcher: DefaultTestCasePatternMatcher, test_package: TestPackage = None) -> tuple:
+def discover_packages(importable: str, module_pattern_matcher: DefaultModulePatternMatcher, test_pattern_matcher: DefaultTestCasePatternMatcher, test_package: TestPackage = None
+                      , index: DiscoveryIndex = None) -> tuple:
     names = importable.replace(os.sep, '.').split('.')
     package_names = []
     package_ = None
@@ -106,10 +125,10 @@ def discover_packages(importable: str, module_pattern_matcher: DefaultModulePatt
     for item in items:
         full_path = os.path.join(importable, item)
         if os.path.isdir(full_path):
-            _, f = discover_packages(full_path, module_pattern_matcher, test_pattern_matcher, end_package)
+            _, f = discover_packages(full_path, module_pattern_matcher, test_pattern_matcher, end_package, index)
             failed_imports |= f
         else:
-            m, f = discover_module(full_path, module_pattern_matcher, test_pattern_matcher)
+            m, f = _discover_module(full_path, module_pattern_matcher, test_pattern_matcher, index)
             if m:
                 end_package.append_module(m)
             elif f:
@@ -117,102 +136,167 @@ def discover_packages(importable: str, module_pattern_matcher: DefaultModulePatt
     return package_, failed_imports
 
 
+def _discover_module(importable: str, module_pattern_matcher: DefaultModulePatternMatcher, test_pattern_matcher: DefaultTestCasePatternMatcher
+                     , index: DiscoveryIndex = None) -> Tuple[TestModule, str]:
+    # Modules are only read statically when there is an index to read them through
+    if index is None:
+        return discover_module(importable, module_pattern_matcher, test_pattern_matcher)
+    return discover_module_statically(importable, module_pattern_matcher, test_pattern_matcher, index)
+
+
 def discover_module(importable: str, module_pattern_matcher: DefaultModulePatternMatcher, test_pattern_matcher: DefaultTestCasePatternMatcher) -> Tuple[TestModule, str]:
     test_module, error_str = None, ''
-    module_str = importable.replace('.py', '').replace(os.sep, '.')
     try:
-        module = importlib.import_module(module_str)
-        if module_pattern_matcher.module_included(module):
-            groups = discover_groups(module, test_pattern_matcher)
-            if groups.has_tests():
-                test_module = TestModule(module, groups, ignored_tests=set(test_pattern_matcher.excluded_items))
-                if test_module.run_mode not in RunMode:
-                    error = f'{test_module.run_mode} is not a valid RunMode'
-                    raise Exception(error)
-    except ModuleNotFoundError as me:
-        if me.name == module_str:
-            error_str = f"Module doesn't exist - {module_str}"
-        else:
-            error_str = f"Failed to load {importable} - {me}"
-    except MoreThan1SameFixtureException as mt1fe:
-        error_str = mt1fe.message
+        test_module = import_test_module(importable, module_pattern_matcher, test_pattern_matcher)
     except Exception as e:
-        error_str = f'Failed to load {importable} - {e}'
+        error_str = _import_error_str(importable, e)
     return test_module, error_str
 
 
+def import_test_module(importable: str, module_pattern_matcher: DefaultModulePatternMatcher, test_pattern_matcher: DefaultTestCasePatternMatcher) -> TestModule:
+    """
+    Same as discover_module but raises instead of returning the error
+    """
+    test_module = None
+    module = importlib.import_module(_get_module_str(importable))
+    if module_pattern_matcher.module_included(module):
+        groups = discover_groups(module, test_pattern_matcher)
+        if groups.has_tests():
+            test_module = TestModule(module, groups, ignored_tests=set(test_pattern_matcher.excluded_items))
+            if test_module.run_mode not in RunMode:
+                error = f'{test_module.run_mode} is not a valid RunMode'
+                raise Exception(error)
+    return test_module
+
+
+def _get_module_str(importable: str) -> str:
+    return importable.replace('.py', '').replace(os.sep, '.')
+
+
+def _import_error_str(importable: str, error: Exception) -> str:
+    if isinstance(error, ModuleNotFoundError):
+        if error.name == _get_module_str(importable):
+            return f"Module doesn't exist - {error.name}"
+    elif isinstance(error, MoreThan1SameFixtureException):
+        return error.message
+    return f'Failed to load {importable} - {error}'
+
+
+def discover_module_statically(importable: str, module_pattern_matcher: DefaultModulePatternMatcher, test_pattern_matcher: DefaultTestCasePatternMatcher
+                               , index: DiscoveryIndex = None) -> Tuple[TestModule, str]:
+    """
+    Builds the TestModule from the module's source without importing it; TestModule.load()
+    imports it when it is about to run
+    """
+    module_str = _get_module_str(importable)
+    file_path = os.path.abspath(importable if importable.endswith('.py') else f'{importable}.py')
+    parse = parse_test_module if index is None else index.parse_test_module
+    static_module = parse(file_path, module_str)
+    if static_module is None:
+        return discover_module(importable, module_pattern_matcher, test_pattern_matcher)
+    # Stands in for the module so pattern matchers and TestModule can read it like the real 1
+    module = types.ModuleType(module_str, static_module.description)
+    module.__file__ = file_path
+    setattr(module, RUN_MODE, static_module.run_mode)
+    if static_module.tags is not None:
+        setattr(module, TAGS, static_module.tags)
+    if static_module.resources is not None:
+        setattr(module, RESOURCES, static_module.resources)
+    if not module_pattern_matcher.module_included(module):
+        return None, ''
+    groups = _create_static_groups(static_module.groups, module_str, test_pattern_matcher)
+    if not groups.has_tests():
+        return None, ''
+    test_module = TestModule(module, groups, ignored_tests=set(test_pattern_matcher.excluded_items))
+    test_module.loader = functools.partial(import_test_module, importable, module_pattern_matcher, test_pattern_matcher)
+    return test_module, ''
+
+
+def _create_static_groups(static_group: StaticGroup, module_str: str, test_pattern_matcher: DefaultTestCasePatternMatcher) -> TestGroups:
+    tests = {}
+    for static_test in static_group.tests:
+        func = _create_placeholder(static_test.name, module_str, static_test.description)
+        if static_test.metadata is not None:
+            func.metadata = static_test.metadata
+        if not test_pattern_matcher.func_included(func):
+            continue
+        if static_test.parameterized_count is None:
+            tests[static_test.name] = TestMethod(func)
+        else:
+            # Same keys discover_tests gives each case
+            for i in discover_parameterized_test_range(static_test.name, [None] * static_test.parameterized_count):
+                tests[f'{static_test.name}[{i}]'] = TestMethod(func)
+    group = TestGroups(static_group.name, _shuffle_dict(tests))
+    for child in static_group.children:
+        group.append(_create_static_groups(child, module_str, test_pattern_matcher))
+    return group
+
+
+def _create_placeholder(name: str, module_str: str, description: str) -> Callable:
+    def placeholder(*args, **kwargs):
+        raise TestCodeException(f'{module_str} has not been imported yet')
+    placeholder.__name__ = placeholder.__qualname__ = name
+    placeholder.__module__ = module_str
+    placeholder.__doc__ = description
+    return placeholder
+
+
 def discover_groups(test_group, test_pattern_matcher: DefaultTestCasePatternMatcher) -> TestGroups:
-    setup_fixture, _, _, teardown_fixture = discover_group_fixtures(test_group)
-    group = TestGroups(test_group.__name__, discover_tests(test_group, test_pattern_matcher), setup_fixture, teardown_fixture)
-    for name in dir(test_group):
-        attribute = getattr(test_group, name)
-        if inspect.isclass(attribute) and name.startswith('Group'):
-            group.append(discover_groups(attribute, test_pattern_matcher))
+    contents = get_namespace_contents(test_group)
+    setup_fixture, _, teardown_fixture, _ = discover_group_fixtures(test_group)
+    group = TestGroups(test_group.__name__, discover_tests(test_group, test_pattern_matcher), setup_fixture, teardown_fixture
+                       , dict(contents.scoped_fixtures))
+    for attribute in contents.groups.values():
+        group.append(discover_groups(attribute, test_pattern_matcher))
     return group
 
 
 def discover_group_fixtures(group) -> Tuple[Callable]:
-    setup_fixture = empty_func
-    setup_test_fixture = empty_func
-    teardown_fixture = empty_func
-    teardown_test_fixture = empty_func
-    found_map = {}
-
-    def check_if_found_already(fixture: Callable):
-        nonlocal found_map
-        if found_map.get(fixture.__name__):
-            try:
-                raise MoreThan1SameFixtureException(fixture.__name__, group.__name__)
-            except:
-                print(dir(group), group.__name__)
-                raise
-        if fixture != empty_func:
-            found_map[fixture.__name__] = True
-    
-    for key in dir(group):
-        attribute = getattr(group, key)
-        if type(attribute) is FUNCTION_TYPE:
-            setup_fixture, setup_test_fixture, \
-            teardown_test_fixture, teardown_fixture = \
-                discover_func_fixtures(attribute, setup, setup_test, teardown_test, teardown, default=empty_func)
-            check_if_found_already(setup_fixture)
-            check_if_found_already(setup_test_fixture)
-            check_if_found_already(teardown_test_fixture)
-            check_if_found_already(teardown_fixture)
-    return setup_fixture, setup_test_fixture, teardown_fixture, teardown_test_fixture
-
-
-def discover_func_fixtures(func, *fixtures, default=empty_func) -> List[Callable]:
-    fixture_names = [x.__name__ for x in fixtures]
-    discovered_fixtures = [default] * len(fixtures)
-    found_map = {}
-    for i, fixture_name in enumerate(fixture_names):
-        if hasattr(func, fixture_name):
-            if found_map.get(fixture_name):
-                raise MoreThan1SameFixtureException(fixture_name, func.__name__)
-            discovered_fixtures[i] = fixtures[i]
-            found_map[fixture_name] = True
-    return discovered_fixtures
+    contents = get_namespace_contents(group)
+    return tuple(contents.get_fixture(x.__name__) for x in (setup, setup_test, teardown, teardown_test))
 
 
 def discover_tests(module, test_pattern_matcher: DefaultTestCasePatternMatcher) -> dict:
     tests = {}
-    setup_test_ = get_fixture(module, setup_test.__name__)
-    teardown_test_ = get_fixture(module, teardown_test.__name__)
-    for name in dir(module):
-        attribute = getattr(module, name)
-        if type(attribute) is FUNCTION_TYPE and name.startswith('test_'):
-            if test_pattern_matcher.func_included(attribute):
-                if hasattr(attribute, 'parameterized_list'):
-                    range_ = discover_parameterized_test_range(name, attribute.parameterized_list)
-                    for i in range_:
-                        attribute.range = range_
-                        tests[f'{name}[{i}]'] = TestMethod(attribute, setup_test_, teardown_test_, attribute.parameterized_list[i])
-                else:
-                    tests[name] = TestMethod(attribute, setup_test_, teardown_test_)
+    contents = get_namespace_contents(module)
+    setup_test_ = contents.get_fixture(setup_test.__name__)
+    teardown_test_ = contents.get_fixture(teardown_test.__name__)
+    for name, attribute in contents.tests.items():
+        if test_pattern_matcher.func_included(attribute):
+            if hasattr(attribute, 'parameterized_source'):
+                tests[name] = TestMethod(attribute, setup_test_, teardown_test_)
+                tests[name].parameterized_slice = discover_parameterized_test_slice(name)
+            elif hasattr(attribute, 'parameterized_list'):
+                range_ = discover_parameterized_test_range(name, attribute.parameterized_list)
+                for i in range_:
+                    attribute.range = range_
+                    tests[f'{name}[{i}]'] = TestMethod(attribute, setup_test_, teardown_test_, attribute.parameterized_list[i])
+            else:
+                tests[name] = TestMethod(attribute, setup_test_, teardown_test_)
     return _shuffle_dict(tests)
 
 
+def discover_parameterized_test_slice(test_name: str) -> slice:
+    """
+    Same [start:stop:step] selection as discover_parameterized_test_range but for lazy parameters
+    whose length isn't known; counting from the end (negative indexes) selects nothing
+    """
+    open_bracket_index = test_name.find('[') + 1
+    if not open_bracket_index:
+        return slice(None)
+    try:
+        if not test_name.endswith(']'):
+            raise ValueError(test_name)
+        segments = [int(x) if x else None for x in test_name[open_bracket_index:-1].split(':')]
+    except ValueError:
+        return slice(0)
+    if any(x is not None and x < 0 for x in segments) or not 1 <= len(segments) <= 3 or segments[2:] == [0]:
+        return slice(0)
+    if len(segments) == 1:
+        return slice(0) if segments[0] is None else slice(segments[0], segments[0] + 1)
+    return slice(*segments)
+
+
 def discover_parameterized_test_range(test_name: str, parameterized_list: list) -> range:
     open_bracket_index = test_name.find('[') + 1
     close_bracket_index = -1
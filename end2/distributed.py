@@ -0,0 +1,256 @@
+"""
+    Coordinator/worker mode: a coordinator serves module names from a queue over a socket and
+    workers running the same run.py (and the same suite args) pull them, run them and send back
+    the results. Workers ask for the next module as soon as they have room so no worker sits idle
+    while the queue still has modules
+"""
+from collections import deque
+import concurrent.futures
+import os
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import (
+    Client,
+    Connection,
+    Listener
+)
+import threading
+from time import (
+    monotonic,
+    sleep
+)
+from typing import (
+    Dict,
+    List,
+    Tuple,
+    Union
+)
+
+from end2.exceptions import StopTestRunException
+from end2.models.result import TestModuleResult
+from end2.models.testing_containers import (
+    TestModule,
+    TestPackage
+)
+from end2.ordering import order_modules
+
+
+AUTHKEY_ENV = 'END2_AUTHKEY'
+_DEFAULT_AUTHKEY = b'end2'
+_LOCAL_HOSTS = frozenset(('localhost', '127.0.0.1', '::1'))
+_CONNECT_TIMEOUT = 30.0
+_WAIT_SECONDS = 0.2
+
+
+def parse_address(address: str) -> Union[Tuple[str, int], str]:
+    """
+    'host:port' is a TCP address anything else is the path of a Unix socket
+    """
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def get_authkey(address: Union[Tuple[str, int], str] = None) -> bytes:
+    """
+    Connections are only authenticated by this key and everything sent over them is unpickled so
+    a key everyone knows is only used for a Unix socket or localhost
+    """
+    authkey = os.environ.get(AUTHKEY_ENV, '').encode()
+    if authkey:
+        return authkey
+    if isinstance(address, tuple) and address[0] not in _LOCAL_HOSTS:
+        raise StopTestRunException(f'Set {AUTHKEY_ENV} to the same secret on the coordinator and workers to use {address[0]}:{address[1]}')
+    return _DEFAULT_AUTHKEY
+
+
+def _walk_packages(packages: List[TestPackage], parent: TestPackage = None):
+    for package in packages:
+        yield package, parent
+        yield from _walk_packages(package.sub_packages, package)
+
+
+class Coordinator:
+    def __init__(self, suite_run, address: str, authkey: bytes = None) -> None:
+        self.suite_run = suite_run
+        self.address = parse_address(address)
+        self.authkey = authkey or get_authkey(self.address)
+        modules = [
+            module
+            for package, _ in _walk_packages(suite_run.test_packages.packages)
+            for module in list(package.sequential_modules) + list(package.parallel_modules)
+        ]
+        self.queue = deque(x.name for x in order_modules(modules, suite_run.order, suite_run.run_history))
+        self.total = len(self.queue)
+        self.finished = 0
+        self.results: List[TestModuleResult] = []
+        self._stopped = False
+        self._condition = threading.Condition()
+
+    @property
+    def logger(self):
+        return self.suite_run.logger
+
+    @property
+    def done(self) -> bool:
+        return self.finished >= self.total
+
+    def run(self) -> List[TestModuleResult]:
+        listener = Listener(self.address, authkey=self.authkey)
+        self.logger.info(f'Coordinator serving {self.total} modules on {listener.address}')
+        accept_thread = threading.Thread(target=self._accept, args=(listener,), daemon=True)
+        accept_thread.start()
+        try:
+            with self._condition:
+                while not self.done:
+                    self._condition.wait()
+        finally:
+            self._stopped = True
+            try:
+                # Unblocks accept() so the listener can be closed
+                Client(listener.address, authkey=self.authkey).close()
+            except OSError:
+                pass
+            accept_thread.join()
+            listener.close()
+        return self.results
+
+    def _accept(self, listener: Listener) -> None:
+        while not self._stopped:
+            try:
+                connection = listener.accept()
+            except (AuthenticationError, EOFError, OSError):
+                # A client with the wrong authkey or that hung up during the handshake
+                continue
+            if self._stopped:
+                connection.close()
+                break
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _next_job(self) -> tuple:
+        with self._condition:
+            if self.queue:
+                return ('job', self.queue.popleft())
+            return ('done',) if self.done else ('wait',)
+
+    def _finish_job(self, module_name: str, result: TestModuleResult = None) -> None:
+        with self._condition:
+            self.finished += 1
+            if result is not None:
+                self.results.append(result)
+                self.logger.info(str(result))
+                # A module with skipped tests ends as FAILED too so only actual failures stop handing out modules
+                if self.suite_run.parsed_args.stop_on_fail and result.failed_count:
+                    self.logger.critical(f'{module_name} failed; no more modules will be handed out')
+                    self.finished += len(self.queue)
+                    self.queue.clear()
+            self._condition.notify_all()
+
+    def _serve(self, connection: Connection) -> None:
+        outstanding = None
+        try:
+            with connection:
+                while True:
+                    message = connection.recv()
+                    if message[0] == 'next':
+                        reply = self._next_job()
+                        outstanding = reply[1] if reply[0] == 'job' else None
+                        connection.send(reply)
+                    elif message[0] == 'result':
+                        outstanding = None
+                        self._finish_job(message[1], message[2])
+                    elif message[0] == 'missing':
+                        outstanding = None
+                        self.logger.error(f'Worker could not find module {message[1]}; make sure it runs the same suite')
+                        self._finish_job(message[1])
+        except (EOFError, OSError):
+            if outstanding is not None:
+                # The worker went away in the middle of a module so another worker gets it
+                with self._condition:
+                    self.logger.warning(f'Lost worker while running {outstanding}; queueing it again')
+                    self.queue.appendleft(outstanding)
+                    self._condition.notify_all()
+
+
+class Worker:
+    def __init__(self, suite_run, address: str, authkey: bytes = None) -> None:
+        self.suite_run = suite_run
+        self.address = parse_address(address)
+        self.authkey = authkey or get_authkey(self.address)
+        self.modules: Dict[str, Tuple[TestPackage, TestModule]] = {}
+        self.parents: Dict[int, TestPackage] = {}
+        for package, parent in _walk_packages(suite_run.test_packages.packages):
+            self.parents[id(package)] = parent
+            for module in list(package.sequential_modules) + list(package.parallel_modules):
+                self.modules[module.name] = (package, module)
+        self.results: List[TestModuleResult] = []
+        self._set_up_packages: List[TestPackage] = []
+        self._package_lock = threading.Lock()
+        self._connected = threading.Event()
+
+    def run(self) -> List[TestModuleResult]:
+        slots = max(1, self.suite_run.parsed_args.max_workers)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=slots, initializer=self.suite_run.event_loops.use) as executor:
+                threads = [threading.Thread(target=self._work, args=(executor,)) for _ in range(slots)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        finally:
+            for package in reversed(self._set_up_packages):
+                self.suite_run.close_package_fixture_values(package)
+                package.teardown()
+        return self.results
+
+    def _connect(self) -> Connection:
+        deadline = monotonic() + _CONNECT_TIMEOUT
+        while True:
+            try:
+                connection = Client(self.address, authkey=self.authkey)
+                self._connected.set()
+                return connection
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Once connected, a refused connection means the coordinator is already done
+                if self._connected.is_set() or monotonic() > deadline:
+                    raise
+                sleep(_WAIT_SECONDS)
+
+    def _set_up(self, package: TestPackage) -> None:
+        # Packages are only set up the 1st time 1 of their modules is handed to this worker
+        with self._package_lock:
+            chain = []
+            while package is not None and package not in self._set_up_packages:
+                chain.append(package)
+                package = self.parents[id(package)]
+            for package_ in reversed(chain):
+                package_.setup()
+                self.suite_run.open_package_fixture_values(package_)
+                self._set_up_packages.append(package_)
+
+    def _work(self, executor: concurrent.futures.ThreadPoolExecutor) -> None:
+        self.suite_run.event_loops.use()
+        try:
+            connection = self._connect()
+        except OSError as e:
+            if not self._connected.is_set():
+                self.suite_run.logger.error(f'Could not connect to coordinator at {self.address}: {e}')
+            return
+        with connection:
+            while True:
+                connection.send(('next',))
+                message = connection.recv()
+                if message[0] == 'done':
+                    break
+                elif message[0] == 'wait':
+                    sleep(_WAIT_SECONDS)
+                    continue
+                module_name = message[1]
+                if module_name not in self.modules:
+                    connection.send(('missing', module_name))
+                    continue
+                package, module = self.modules[module_name]
+                self._set_up(package)
+                result = self.suite_run.create_module_run(package, module, executor).run()
+                self.results.append(result)
+                connection.send(('result', module_name, result))
@@ -0,0 +1,104 @@
+"""
+    Values of @fixture functions. There is 1 FixtureValues per scope that is running (the suite
+    run, each package, module, group and test) chained to the scope it runs in. A fixture is
+    looked up by name through that chain, worked out once, cached in the closest scope of the
+    kind it was declared with and finalized when that scope is over
+"""
+import inspect
+from logging import Logger
+import os
+import threading
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Tuple,
+    Union
+)
+
+from end2.constants import FixtureScope
+from end2.exceptions import TestCodeException
+
+
+class FailedFixture:
+    """
+    Stands in for the value of a fixture that raised so the test using it fails with that exception
+    """
+    def __init__(self, exception: Exception) -> None:
+        self.exception = exception
+
+
+def raise_failed_fixtures(kwargs: dict) -> None:
+    for value in kwargs.values():
+        if isinstance(value, FailedFixture):
+            raise value.exception
+
+
+class FixtureValues:
+    def __init__(self, scope: FixtureScope, fixtures: Dict[str, Callable] = None
+                 , parent: 'FixtureValues' = None) -> None:
+        self.scope = scope
+        self.fixtures = fixtures or {}
+        self.parent = parent
+        self._values: Dict[Callable, object] = {}
+        # (pid, fixture name, generator or callable) so forked workers only finalize what they created
+        self._finalizers: List[Tuple[int, str, Union[Iterator, Callable[[], None]]]] = []
+        self._lock = threading.RLock()
+
+    def chain(self) -> Iterator['FixtureValues']:
+        values = self
+        while values is not None:
+            yield values
+            values = values.parent
+
+    def child(self, scope: FixtureScope, fixtures: Dict[str, Callable] = None) -> 'FixtureValues':
+        return FixtureValues(scope, fixtures, self)
+
+    def get(self, name: str, create: Callable[[Callable, 'FixtureValues'], object]
+            , within: 'FixtureValues' = None):
+        """
+        create(fixture, owner) works out the value when it isn't cached yet. within is the scope of
+        the fixture asking for this 1; a fixture can't use a fixture that ends before it does
+        """
+        fixture = next((x.fixtures[name] for x in self.chain() if name in x.fixtures), None)
+        if fixture is None:
+            raise TestCodeException(f'No fixture named {name}')
+        owner = next((x for x in self.chain() if x.scope is fixture.fixture_scope), self)
+        if within is not None and owner not in within.chain():
+            raise TestCodeException(f'{within.scope.value} scoped fixtures can not use {name} '
+                                    f'since it is {fixture.fixture_scope.value} scoped')
+        with owner._lock:
+            if fixture not in owner._values:
+                value = create(fixture, owner)
+                if inspect.isgenerator(value):
+                    generator, value = value, next(value)
+                    owner._finalizers.append((os.getpid(), name, generator))
+                owner._values[fixture] = value
+            return owner._values[fixture]
+
+    def add_finalizer(self, name: str, finalizer: Callable[[], None]) -> None:
+        """
+        finalizer is called when this scope is over, after everything added later is finalized
+        """
+        with self._lock:
+            self._finalizers.append((os.getpid(), name, finalizer))
+
+    def close(self, logger: Logger) -> None:
+        with self._lock:
+            finalizers, self._finalizers = self._finalizers, []
+            self._values.clear()
+        pid = os.getpid()
+        for pid_, name, finalizer in reversed(finalizers):
+            if pid_ != pid:
+                continue
+            try:
+                if not inspect.isgenerator(finalizer):
+                    finalizer()
+                    continue
+                next(finalizer)
+                logger.error(f'Fixture {name} yielded more than once')
+            except StopIteration:
+                pass
+            except Exception as e:
+                logger.error(f'Fixture {name} failed to finalize: {e}')
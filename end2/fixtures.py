@@ -1,7 +1,25 @@
 import functools
-
-from end2.constants import FUNCTION_TYPE
-from end2.exceptions import MoreThan1SameFixtureException
+import inspect
+import itertools
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Tuple,
+    Union
+)
+from weakref import WeakKeyDictionary
+
+from end2.constants import (
+    FixtureScope,
+    FUNCTION_TYPE
+)
+from end2.exceptions import (
+    MoreThan1SameFixtureException,
+    TestCodeException
+)
 
 
 def setup_module(func):
@@ -54,6 +72,22 @@ def package_test_parameters(func):
     return func
 
 
+def fixture(scope: Union[str, FixtureScope] = FixtureScope.TEST):
+    """
+    Makes func a fixture that returns a value; tests and other fixtures ask for it with a keyword
+    only arg of the same name. The value is worked out once per scope and cached until the scope
+    is over; if func is a generator the code after its yield runs then
+    """
+    scope = FixtureScope(scope)
+
+    def wrapper(func):
+        if inspect.iscoroutinefunction(func) or inspect.isasyncgenfunction(func):
+            raise TestCodeException(f'Fixture {func.__name__} can not be async')
+        func.fixture_scope = scope
+        return func
+    return wrapper
+
+
 def metadata(**kwargs):
     def inner(func):
         func.metadata = kwargs
@@ -61,9 +95,17 @@ def metadata(**kwargs):
     return inner
 
 
-def parameterize(parameters_list: list, first_arg_is_name: bool = False):
+def parameterize(parameters_list: Union[list, Iterable, Callable[[], Iterable]], first_arg_is_name: bool = False):
+    """
+    parameters_list can be a list/tuple or, for large data sets, an iterable or a callable that
+    returns 1; those are only iterated when the test runs and 1 case at a time. Pass a callable
+    (like a generator function) if the test can be ran more than once (watch mode or --reruns)
+    """
     def wrapper(func):
-        if first_arg_is_name:
+        if not isinstance(parameters_list, (list, tuple)):
+            func.parameterized_source = parameters_list
+            func.first_arg_is_name = first_arg_is_name
+        elif first_arg_is_name:
             func.names = [f'{func.__name__}[{i}] {args[0]}' for i, args in enumerate(parameters_list)]
             func.parameterized_list = tuple(p[1:] for p in parameters_list)
         else:
@@ -73,18 +115,84 @@ def parameterize(parameters_list: list, first_arg_is_name: bool = False):
     return wrapper
 
 
+def iter_parameters(func, slice_: slice = None) -> Iterator[Tuple[int, tuple]]:
+    """
+    Yields the index and arguments of each case of a lazily parameterized func; cases outside
+    of slice_ are skipped without being kept
+    """
+    source = func.parameterized_source
+    parameters = source() if callable(source) else source
+    slice_ = slice_ or slice(None)
+    for i, args in itertools.islice(enumerate(parameters), slice_.start, slice_.stop, slice_.step):
+        args = tuple(args)
+        yield i, args[1:] if func.first_arg_is_name else args
+
+
 def empty_func(*args, **kwargs) -> None:
     return
 
 
+# Attributes the fixture decorators above mark functions with
+_FIXTURE_MARKERS = frozenset((
+    'on_failures_in_module', 'package_test_parameters', 'setup', 'setup_module', 'setup_test',
+    'teardown', 'teardown_module', 'teardown_test'
+))
+
+
+class NamespaceContents:
+    """
+    Tests, fixtures and Group classes of a module or group class sorted out in 1 pass over dir()
+    """
+    def __init__(self, namespace) -> None:
+        self.name = namespace.__name__
+        self.tests: Dict[str, Callable] = {}
+        self.scoped_fixtures: Dict[str, Callable] = {}
+        self.groups: Dict[str, type] = {}
+        self.functions: List[Callable] = []
+        self._fixtures: Dict[str, List[Callable]] = {}
+        for key in dir(namespace):
+            attribute = getattr(namespace, key)
+            if type(attribute) is FUNCTION_TYPE:
+                self.functions.append(attribute)
+                for marker in _FIXTURE_MARKERS & attribute.__dict__.keys():
+                    self._fixtures.setdefault(marker, []).append(attribute)
+                if hasattr(attribute, 'fixture_scope'):
+                    self.scoped_fixtures[key] = attribute
+                elif key.startswith('test_'):
+                    self.tests[key] = attribute
+            elif inspect.isclass(attribute) and key.startswith('Group'):
+                self.groups[key] = attribute
+
+    def get_fixture(self, name: str, default=empty_func) -> Callable:
+        if name in _FIXTURE_MARKERS:
+            fixtures = self._fixtures.get(name, [])
+        else:
+            fixtures = [x for x in self.functions if hasattr(x, name)]
+        if len(fixtures) > 1:
+            raise MoreThan1SameFixtureException(name, self.name)
+        return fixtures[0] if fixtures else default
+
+
+# module or group class -> its NamespaceContents; discovery and TestPackage ask for it many times
+_namespace_contents_cache: 'WeakKeyDictionary[object, NamespaceContents]' = WeakKeyDictionary()
+
+
+def get_namespace_contents(namespace) -> NamespaceContents:
+    try:
+        return _namespace_contents_cache[namespace]
+    except KeyError:
+        pass
+    except TypeError:
+        # Not weak referenceable so it can't be cached
+        return NamespaceContents(namespace)
+    contents = NamespaceContents(namespace)
+    _namespace_contents_cache[namespace] = contents
+    return contents
+
+
 def get_fixture(module, name: str, default=empty_func):
-    fixture = default
-    found = False
-    for key in dir(module):
-        attribute = getattr(module, key)
-        if type(attribute) is FUNCTION_TYPE and hasattr(attribute, name):
-            if found:
-                raise MoreThan1SameFixtureException(name, module.__name__)
-            fixture = attribute
-            found = True
-    return fixture
+    return get_namespace_contents(module).get_fixture(name, default)
+
+
+def get_scoped_fixtures(module) -> Dict[str, Callable]:
+    return dict(get_namespace_contents(module).scoped_fixtures)
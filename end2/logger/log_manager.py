@@ -164,8 +164,12 @@ class LogManager:
             if isinstance(handler, logging.FileHandler):
                 handler.flush()
                 handler.close()
-                if os.path.exists(handler.baseFilename) and os.stat(handler.baseFilename).st_size == 0:
-                    os.remove(handler.baseFilename)
+                try:
+                    if os.stat(handler.baseFilename).st_size == 0:
+                        os.remove(handler.baseFilename)
+                except FileNotFoundError:
+                    # Tests with the same name in different groups share a log file
+                    pass
                 handler_ = handler
         logger.removeHandler(handler_)
 
@@ -72,6 +72,10 @@ class TestMethodResult(Result):
         self.metadata = metadata or {}
         self.description = description
         self.steps = []
+        # Unique within its module (group path and parameterized index); name alone is not
+        self.key = name
+        # Earlier failed attempts when the test was rerun
+        self.attempts: List['TestMethodResult'] = []
 
     def to_base(self) -> Result:
         result = Result(self.name, self.status, self.record)
@@ -86,6 +90,8 @@ class TestModuleResult(Result):
                  , record: str = "") -> None:
         super().__init__(module.name, status, record)
         self.file_name = module.file_name
+        # mtime of the module when it was discovered
+        self.last_modified: float = getattr(module, 'last_modified', None)
         self.setups = setups or []
         self.teardowns = teardowns or []
         self.description = module.description
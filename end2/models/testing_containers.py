@@ -1,17 +1,33 @@
-from inspect import getmro
+from inspect import (
+    getfullargspec,
+    getmro
+)
 import os
 import pathlib
+import sys
 from typing import (
+    Callable,
     Dict,
+    FrozenSet,
     Iterator,
     List,
-    Set
+    Set,
+    Tuple
+)
+from weakref import WeakKeyDictionary
+
+from end2 import exceptions
+from end2.constants import (
+    FUNCTION_TYPE,
+    RESOURCES,
+    ReservedWords,
+    RunMode
 )
-
-from end2.constants import RunMode
 from end2.fixtures import (
     empty_func,
     get_fixture,
+    get_scoped_fixtures,
+    iter_parameters,
     on_failures_in_module,
     package_test_parameters,
     setup,
@@ -25,10 +41,65 @@ from end2.pattern_matchers import (
 )
 
 
+def _get_package_names(module_name: str) -> Iterator[str]:
+    names = module_name.split('.')[:-1]
+    for i in range(len(names)):
+        yield '.'.join(names[:i + 1])
+
+
 def build_full_name(module_name: str, test_name: str) -> str:
     return f'{module_name}::{test_name}'
 
 
+# func -> (reserved words, fixture names) it asks for as keyword only args
+_keyword_only_args_cache: 'WeakKeyDictionary[Callable, Tuple[FrozenSet[str], FrozenSet[str]]]' = WeakKeyDictionary()
+_RESERVED_WORDS = frozenset(x.value for x in ReservedWords)
+
+
+def _get_keyword_only_args(func: Callable) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    try:
+        return _keyword_only_args_cache[func]
+    except KeyError:
+        pass
+    except TypeError:
+        # Not weak referenceable so it can't be cached
+        return _split_keyword_only_args(func)
+    keyword_only_args = _split_keyword_only_args(func)
+    _keyword_only_args_cache[func] = keyword_only_args
+    return keyword_only_args
+
+
+def _split_keyword_only_args(func: Callable) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    if type(func) is FUNCTION_TYPE and not hasattr(func, '__signature__'):
+        # What getfullargspec would say without building a Signature; discovery does this for every test
+        code = func.__code__
+        kwonlyargs = frozenset(code.co_varnames[code.co_argcount:code.co_argcount + code.co_kwonlyargcount])
+    else:
+        kwonlyargs = frozenset(getfullargspec(func).kwonlyargs)
+    return kwonlyargs & _RESERVED_WORDS, kwonlyargs - _RESERVED_WORDS
+
+
+def get_reserved_words(func: Callable) -> FrozenSet[str]:
+    """
+    The reserved words func asks for as keyword only args; worked out once per function
+    """
+    return _get_keyword_only_args(func)[0]
+
+
+def get_fixture_names(func: Callable) -> FrozenSet[str]:
+    """
+    The @fixture values func asks for; every keyword only arg that isn't a reserved word
+    """
+    return _get_keyword_only_args(func)[1]
+
+
+def check_keyword_only_args(func: Callable, fixture_names: Set[str]) -> None:
+    unknown = sorted(get_fixture_names(func) - fixture_names)
+    if unknown:
+        raise exceptions.TestCodeException(f"Unknown reserved words or fixtures found or possibly typos in {func.__name__}: {unknown}"
+                                           f"\npossible reserved keywords: {[[x.name for x in ReservedWords]]}")
+
+
 class Importable:
     def __init__(self, path: str, module_pattern_matcher: DefaultModulePatternMatcher, test_pattern_matcher: DefaultTestCasePatternMatcher) -> None:
         self.path = os.path.normpath(path)
@@ -50,6 +121,13 @@ class TestMethod:
         self.teardown_func = teardown_func
         self.parameterized_tuple = parameterized_tuple or tuple()
         self.metadata = getattr(func, 'metadata', {})
+        # Lazily parameterized tests stay 1 TestMethod until they run; see expand()
+        self.is_lazy = parameterized_tuple is None and hasattr(func, 'parameterized_source')
+        self.parameterized_slice: slice = None
+
+    def expand(self, key: str) -> Iterator[Tuple[str, 'TestMethod']]:
+        for i, args in iter_parameters(self.func, self.parameterized_slice):
+            yield f'{key}[{i}]', TestMethod(self.func, self.setup_func, self.teardown_func, args)
 
     def __eq__(self, rhs: 'TestMethod') -> bool:
         return self.full_name == rhs.full_name
@@ -60,11 +138,12 @@ class TestMethod:
 
 class TestGroups:
     def __init__(self, name: str, tests: Dict[str, TestMethod]
-                 , setup_func=empty_func, teardown_func=empty_func) -> None:
+                 , setup_func=empty_func, teardown_func=empty_func, fixtures: Dict[str, Callable] = None) -> None:
         self.name = name
         self.setup_func = setup_func
         self.tests = tests
         self.teardown_func = teardown_func
+        self.fixtures = fixtures or {}
         self.children: List[TestGroups] = []
 
     def append(self, group: 'TestGroups') -> None:
@@ -74,6 +153,7 @@ class TestGroups:
         for ignored in same_group.ignored_tests:
             self.tests.pop(ignored, None)
         self.tests.update(same_group.tests)
+        self.fixtures.update(same_group.fixtures)
         self.ignored_tests.update(same_group.ignored_tests)
 
     def has_tests(self) -> bool:
@@ -130,15 +210,54 @@ class TestModule:
         self.run_mode: RunMode = module.__run_mode__
         self.is_parallel = self.run_mode is RunMode.PARALLEL
         self.description = module.__doc__
+        self.resources = set(getattr(module, RESOURCES, ()))
         self.groups = groups
         self.ignored_tests = ignored_tests or set()
         self.on_failures_in_module = get_fixture(self.module, on_failures_in_module.__name__)
+        # Set when the module was discovered without importing it; see load()
+        self.loader: Callable[[], 'TestModule'] = None
+        # Checked here so typos in reserved words and fixture names fail the module at discovery
+        fixture_names = set()
+        for package in (sys.modules.get(x) for x in _get_package_names(self.name)):
+            if package is not None:
+                fixture_names.update(get_scoped_fixtures(package))
+        check_keyword_only_args(self.on_failures_in_module, fixture_names | set(groups.fixtures))
+        self._check_keyword_only_args(groups, fixture_names)
+
+    def _check_keyword_only_args(self, group: TestGroups, fixture_names: Set[str]) -> None:
+        fixture_names = fixture_names | set(group.fixtures)
+        funcs = [group.setup_func, group.teardown_func, *group.fixtures.values()]
+        for test in group.tests.values():
+            funcs.extend((test.func, test.setup_func, test.teardown_func, getattr(test.func, 'on_test_failure', empty_func)))
+        # Every test shares its group's setup_test and teardown_test so each is only checked once
+        for func in dict.fromkeys(funcs):
+            check_keyword_only_args(func, fixture_names)
+        for child in group.children:
+            self._check_keyword_only_args(child, fixture_names)
+
+    def load(self) -> None:
+        """
+        Imports a module that was discovered statically. Its groups are filled in place so
+        anything holding on to them (order and selection of tests, shards) stays valid
+        """
+        if self.loader is None:
+            return
+        loader, self.loader = self.loader, None
+        loaded = loader()
+        if loaded is None:
+            raise exceptions.TestCodeException(f'{self.name} has no tests once imported')
+        self.module = loaded.module
+        self.description = loaded.description
+        self.resources = loaded.resources
+        self.on_failures_in_module = loaded.on_failures_in_module
+        _fill_group(self.groups, loaded.groups)
 
     def __eq__(self, rhs: 'TestModule') -> bool:
         return self.name == rhs.name
 
     def __hash__(self) -> int:
-        return id(self.module)
+        # Not id(self.module) since load() replaces it while the module is in sets
+        return hash(self.name)
 
     def update(self, same_module: 'TestModule') -> None:
         for ignored in same_module.ignored_tests:
@@ -151,6 +270,18 @@ class TestModule:
         self.ignored_tests.update(same_module.ignored_tests)
 
 
+def _fill_group(group: TestGroups, loaded: TestGroups) -> None:
+    group.setup_func = loaded.setup_func
+    group.teardown_func = loaded.teardown_func
+    group.fixtures = loaded.fixtures
+    # Only the tests that were discovered (and maybe filtered since) run
+    group.tests = {k: loaded.tests[k] for k in group.tests if k in loaded.tests}
+    loaded_children = {x.name: x for x in loaded.children}
+    group.children = [x for x in group.children if x.name in loaded_children]
+    for child in group.children:
+        _fill_group(child, loaded_children[child.name])
+
+
 class TestPackage:
     def __init__(self, package, sequential_modules: set = None, parallel_modules: set = None
                  , package_object: DynamicMroMixin = None) -> None:
@@ -160,6 +291,7 @@ class TestPackage:
         self.setup_module_func = get_fixture(self.package, setup_module.__name__)
         self.teardown_module_func = get_fixture(self.package, teardown_module.__name__)
         self.package_test_parameters_func = get_fixture(self.package, package_test_parameters.__name__, default=None)
+        self.fixtures = get_scoped_fixtures(self.package)
         self.name: str = self.package.__name__
         self.description = self.package.__doc__
         self.package_object = package_object or DynamicMroMixin()
@@ -0,0 +1,80 @@
+from math import (
+    floor,
+    inf,
+    log2
+)
+from random import shuffle
+from typing import (
+    Callable,
+    Dict,
+    List
+)
+
+from end2.constants import Order
+from end2.models.testing_containers import (
+    TestMethod,
+    TestModule
+)
+from end2.resource_profile import RunHistory
+
+
+def duration_tier(seconds: float) -> float:
+    # Tiers double in size: <1s, 1-3s, 3-7s, ... Unknown durations are treated as the longest
+    if seconds is None:
+        return inf
+    return floor(log2(seconds + 1))
+
+
+def order_longest_first(items: list, get_seconds: Callable) -> list:
+    tiers = {}
+    for item in items:
+        tiers.setdefault(duration_tier(get_seconds(item)), []).append(item)
+    ordered = []
+    for tier in sorted(tiers, reverse=True):
+        # Shuffling inside a tier so tests still can't depend on order
+        shuffle(tiers[tier])
+        ordered.extend(tiers[tier])
+    return ordered
+
+
+def order_by_rank(items: list, get_rank: Callable) -> list:
+    # Lowest rank first; shuffled within a rank so tests still can't depend on order
+    ranks = {}
+    for item in items:
+        ranks.setdefault(get_rank(item), []).append(item)
+    ordered = []
+    for rank in sorted(ranks):
+        shuffle(ranks[rank])
+        ordered.extend(ranks[rank])
+    return ordered
+
+
+def fast_feedback_rank(module: TestModule, history: RunHistory) -> tuple:
+    """
+    Modules with tests that failed recently go 1st (most recent 1st), then modules modified since
+    they last ran, then everything else
+    """
+    failures = history.recent_failures(module.name)
+    if failures:
+        return 0, min(failures.values())
+    return (1, 0) if history.module_modified(module.name, module.last_modified) else (2, 0)
+
+
+def order_modules(modules: List[TestModule], order: Order, history: RunHistory) -> List[TestModule]:
+    if order is Order.LONGEST_FIRST:
+        return order_longest_first(modules, lambda module: history.module_seconds(module.name))
+    elif order is Order.FAST_FEEDBACK:
+        return order_by_rank(modules, lambda module: fast_feedback_rank(module, history))
+    # Sequential modules go first so their long serial runs start as early as possible
+    return [module for module in modules if not module.is_parallel] + [module for module in modules if module.is_parallel]
+
+
+def order_tests(module_name: str, tests: Dict[str, TestMethod], order: Order, history: RunHistory) -> Dict[str, TestMethod]:
+    if order is Order.LONGEST_FIRST:
+        items = order_longest_first(list(tests.items()), lambda item: history.test_seconds(module_name, item[1].name))
+        return dict(items)
+    elif order is Order.FAST_FEEDBACK:
+        failures = history.recent_failures(module_name)
+        items = order_by_rank(list(tests.items()), lambda item: failures.get(item[1].name, inf))
+        return dict(items)
+    return tests
@@ -21,6 +21,13 @@ class PatternMatcherBase:
             include = False
         return cls(pattern[index:].split(cls.delimiter) if pattern else [], pattern, include)
 
+    @classmethod
+    def parse_strs(cls, patterns: List[str]) -> list:
+        """
+        1 matcher per pattern; matchers that search the file system override it to do it once for all of them
+        """
+        return [cls.parse_str(x) for x in patterns]
+
     def __str__(self) -> str:
         return f"{'include' if self._include else 'exclude'}: {self._items}"
 
@@ -48,6 +55,12 @@ class PatternMatcherBase:
 class DefaultModulePatternMatcher(PatternMatcherBase):
     delimiter = ';'
 
+    def bind(self, test_matcher: 'DefaultTestCasePatternMatcher') -> None:
+        """
+        Called with the test matcher that goes with it for each path it includes
+        """
+        pass
+
     def module_included(self, module) -> bool:
         return True
 
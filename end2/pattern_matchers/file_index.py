@@ -0,0 +1,150 @@
+"""
+    Index of the files and folders under the current folder for the glob and regex module pattern
+    matchers. It is built with os.scandir once per suite arg and leaves out what those matchers
+    should never have to look at: names starting with a dot, __pycache__, node_modules, virtual
+    environments and anything the folder's .gitignore ignores
+"""
+import os
+import re
+from typing import (
+    FrozenSet,
+    List,
+    Pattern,
+    Tuple
+)
+
+
+_SEP = re.escape(os.sep)
+_SKIPPED_FOLDERS = frozenset(('__pycache__', 'node_modules'))
+# Every virtual environment has 1 at its root
+_VIRTUAL_ENV_FILE = 'pyvenv.cfg'
+
+
+def translate_glob(pattern: str) -> str:
+    """
+    Regex matching the same relative paths glob(pattern, recursive=True) does; names starting
+    with a dot aren't special since the index has none
+    """
+    # / works on Windows too like it does for glob()
+    components = (pattern.replace(os.altsep, os.sep) if os.altsep else pattern).split(os.sep)
+    regex = ''
+    for i, component in enumerate(components):
+        last = i == len(components) - 1
+        if component == '**' and last and i:
+            # The folder itself matches too
+            regex = regex[:-len(_SEP)] + f'(?:{_SEP}.*)?'
+        elif component == '**':
+            regex += '.*' if last else f'(?:[^{_SEP}]+{_SEP})*'
+        else:
+            regex += _translate_glob_component(component) + ('' if last else _SEP)
+    return regex
+
+
+def _translate_glob_component(component: str) -> str:
+    regex = ''
+    i = 0
+    while i < len(component):
+        char = component[i]
+        i += 1
+        if char == '*':
+            regex += f'[^{_SEP}]*'
+        elif char == '?':
+            regex += f'[^{_SEP}]'
+        elif char == '[':
+            # Like fnmatch a ] right after [ or [! is part of the set
+            j = i + 1 if component[i:i + 1] == '!' else i
+            j = j + 1 if component[j:j + 1] == ']' else j
+            end = component.find(']', j)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                chars = component[i:end].replace('\\', '\\\\')
+                regex += f"[{'^' + chars[1:] if chars.startswith('!') else chars}]"
+                i = end + 1
+        else:
+            regex += re.escape(char)
+    return regex
+
+
+class IgnoreRules:
+    """
+    The .gitignore patterns the index follows: blank lines and # comments are skipped, ! includes
+    again, a trailing / only matches folders and a pattern with a / anywhere else is relative to
+    the folder the .gitignore is in instead of matching a name at any depth
+    """
+    def __init__(self, lines: List[str] = None) -> None:
+        # (regex, matched against the whole path, only matches folders, includes again)
+        self.rules: List[Tuple[Pattern, bool, bool, bool]] = []
+        for line in lines or []:
+            line = line.rstrip('\n').rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            line = line[1:] if negate else line
+            folders_only = line.endswith('/')
+            line = line.strip('/') if folders_only else line
+            anchored = '/' in line
+            line = line.lstrip('/').replace('/', os.sep)
+            self.rules.append((re.compile(translate_glob(line)), anchored, folders_only, negate))
+
+    @classmethod
+    def load(cls, path: str) -> 'IgnoreRules':
+        try:
+            with open(path) as ignore_file:
+                return cls(ignore_file.readlines())
+        except OSError:
+            return cls()
+
+    def ignored(self, path: str, is_folder: bool) -> bool:
+        ignored = False
+        for regex, anchored, folders_only, negate in self.rules:
+            if folders_only and not is_folder:
+                continue
+            if regex.fullmatch(path if anchored else os.path.basename(path)):
+                # The last rule that matches wins
+                ignored = not negate
+        return ignored
+
+
+class FileIndex:
+    def __init__(self, root: str = os.curdir) -> None:
+        self.root = root
+        self.ignore_rules = IgnoreRules.load(os.path.join(root, '.gitignore'))
+        # (path relative to root, is a folder) sorted by path
+        self.entries: List[Tuple[str, bool]] = []
+        self._scan(root, '', frozenset())
+
+    def _scan(self, folder: str, relative_folder: str, ancestors: FrozenSet[Tuple[int, int]]) -> None:
+        try:
+            stat = os.stat(folder)
+        except OSError:
+            return
+        # (device, inode) of the folders it is in so a link back to 1 of them can't make the scan go around in circles
+        if (stat.st_dev, stat.st_ino) in ancestors:
+            return
+        ancestors = ancestors | {(stat.st_dev, stat.st_ino)}
+        try:
+            with os.scandir(folder) as iterator:
+                entries = sorted(iterator, key=lambda x: x.name)
+        except OSError:
+            return
+        if relative_folder and any(x.name == _VIRTUAL_ENV_FILE for x in entries):
+            return
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            path = os.path.join(relative_folder, entry.name) if relative_folder else entry.name
+            try:
+                is_folder = entry.is_dir()
+            except OSError:
+                continue
+            if (is_folder and entry.name in _SKIPPED_FOLDERS) or self.ignore_rules.ignored(path, is_folder):
+                continue
+            self.entries.append((path, is_folder))
+            if is_folder:
+                # Links to folders are followed like glob() does
+                self._scan(entry.path, path, ancestors)
+
+    @property
+    def files(self) -> List[str]:
+        return [path for path, is_folder in self.entries if not is_folder]
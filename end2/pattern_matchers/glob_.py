@@ -1,23 +1,82 @@
-from glob import glob
+from glob import (
+    glob,
+    has_magic
+)
+import os
 import re
+from typing import (
+    List,
+    Pattern,
+    Tuple
+)
 
 from end2.pattern_matchers.default import (
     DefaultModulePatternMatcher,
     DefaultTestCasePatternMatcher
 )
+from end2.pattern_matchers.file_index import (
+    FileIndex,
+    translate_glob
+)
+
+
+def _to_index_regex(pattern: str) -> Tuple[str, bool, Pattern]:
+    """
+    (prefix to put back on matched paths, only matches folders, regex) or None when glob has to
+    look for pattern itself: absolute paths, parent or hidden folders and paths without wildcards
+    """
+    if not has_magic(pattern) or os.path.isabs(pattern):
+        return None
+    # / works on Windows too like it does for glob()
+    components = (pattern.replace(os.altsep, os.sep) if os.altsep else pattern).split(os.sep)
+    prefix = ''
+    while len(components) > 1 and components[0] == os.curdir:
+        prefix += components.pop(0) + os.sep
+    folders_only = components[-1] == ''
+    if folders_only:
+        components.pop()
+    if any(x.startswith('.') for x in components):
+        return None
+    return prefix, folders_only, re.compile(translate_glob(os.sep.join(components)))
 
 
 class GlobModulePatternMatcher(DefaultModulePatternMatcher):
     @classmethod
     def parse_str(cls, pattern: str, include: bool = True):
-        return cls(glob(pattern, recursive=True), pattern, include)
+        return cls(cls._glob([pattern])[0], pattern, include)
+
+    @classmethod
+    def parse_strs(cls, patterns: List[str]) -> list:
+        return [cls(items, pattern, True) for items, pattern in zip(cls._glob(patterns), patterns)]
+
+    @staticmethod
+    def _glob(patterns: List[str]) -> List[List[str]]:
+        items = [[] for _ in patterns]
+        index_regexes = []
+        for i, pattern in enumerate(patterns):
+            index_regex = _to_index_regex(pattern)
+            if index_regex is None:
+                items[i] = glob(pattern, recursive=True)
+            else:
+                index_regexes.append((i, *index_regex))
+        if index_regexes:
+            # 1 pass over the index for all patterns
+            for path, is_folder in FileIndex().entries:
+                for i, prefix, folders_only, regex in index_regexes:
+                    if (is_folder or not folders_only) and regex.fullmatch(path):
+                        items[i].append(f'{prefix}{path}{os.sep if folders_only else ""}')
+        return items
 
 
 class GlobTestCasePatternMatcher(DefaultTestCasePatternMatcher):
+    def __init__(self, items: List[str], pattern: str, include: bool):
+        super().__init__(items, pattern, include)
+        self._regex = re.compile(pattern)
+
     @classmethod
     def parse_str(cls, pattern: str, include: bool = True):
         pattern_ = pattern.replace('?', '.').replace('*', '.*')
         return cls([], pattern_, True)
 
     def included(self, func) -> bool:
-        return True if re.match(self._pattern, func.__name__) else False
+        return True if self._regex.match(func.__name__) else False
@@ -1,30 +1,63 @@
-from glob import glob
 import os
 import re
+from typing import (
+    List,
+    Pattern
+)
 
 from end2.pattern_matchers.default import (
     DefaultModulePatternMatcher,
     DefaultTestCasePatternMatcher
 )
+from end2.pattern_matchers.file_index import FileIndex
+
+
+# Group numbers change once regexes are joined so these can't be
+_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+
+
+def _join_regexes(regexes: List[Pattern]) -> Pattern:
+    """
+    1 regex that matches whenever any of them does so most paths are turned down with 1 match
+    """
+    if len(regexes) < 2 or any(_BACKREFERENCE.search(x.pattern) for x in regexes):
+        return None
+    try:
+        return re.compile('|'.join(f'(?:{x.pattern})' for x in regexes))
+    except re.error:
+        return None
 
 
 class RegexModulePatternMatcher(DefaultModulePatternMatcher):
     @classmethod
     def parse_str(cls, pattern: str, include: bool = True):
-        items = []
-        include = False
-        for module in filter(lambda x: not x.endswith('__init__.py'),
-                             glob(f'.{os.sep}**{os.sep}*.py', recursive=True)):
-            if re.match(pattern, module):
-                items.append(module)
-                include = True
-        return cls(items, pattern, include)
+        return cls.parse_strs([pattern])[0]
+
+    @classmethod
+    def parse_strs(cls, patterns: List[str]) -> list:
+        regexes = [re.compile(x) for x in patterns]
+        any_regex = _join_regexes(regexes)
+        items = [[] for _ in patterns]
+        for path in FileIndex().files:
+            if not path.endswith('.py') or path.endswith('__init__.py'):
+                continue
+            module = f'.{os.sep}{path}'
+            if any_regex is None or any_regex.match(module):
+                for i, regex in enumerate(regexes):
+                    if regex.match(module):
+                        items[i].append(module)
+        # Only including when something matched
+        return [cls(items_, pattern, bool(items_)) for items_, pattern in zip(items, patterns)]
 
 
 class RegexTestCasePatternMatcher(DefaultTestCasePatternMatcher):
+    def __init__(self, items: List[str], pattern: str, include: bool):
+        super().__init__(items, pattern, include)
+        self._regex = re.compile(pattern)
+
     @classmethod
     def parse_str(cls, pattern: str, include: bool = True):
         return cls([], pattern, True)
 
     def included(self, func) -> bool:
-        return True if re.match(self._pattern, func.__name__) else False
+        return True if self._regex.match(func.__name__) else False
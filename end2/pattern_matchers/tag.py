@@ -1,58 +1,174 @@
+"""
+    --suite-tag selects tests with a tag expression: tags joined with and, or, not and
+    parentheses where a comma is the same as or and a leading ! negates the whole expression,
+    e.g. smoke,regression or (smoke or regression) and not slow. A test's tags are its module's
+    __tags__ plus the tags in its metadata. Each pair of matchers keeps its own TagIndex of module
+    tags so several suites can be selected at the same time
+"""
 import os
-from typing import Callable
+import re
+import threading
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List
+)
 
 from end2 import constants
 from end2.pattern_matchers.default import (
-    PatternMatcherBase,
     DefaultModulePatternMatcher,
     DefaultTestCasePatternMatcher
 )
 
-module_tags_matcher = None
-module_tags_dict = {}
+
+_TOKENS = re.compile(r'\s*(\(|\)|,|[^\s(),]+)')
+_OPERATORS = frozenset(('and', 'or', 'not'))
+
+
+class TagIndex:
+    """
+    Module name -> its __tags__ for the test matcher to add to each test's own tags
+    """
+    def __init__(self) -> None:
+        self._tags: Dict[str, FrozenSet[str]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, module_name: str, tags: Iterable[str]) -> None:
+        with self._lock:
+            self._tags[module_name] = frozenset(tags)
+
+    def tags(self, module_name: str) -> FrozenSet[str]:
+        with self._lock:
+            return self._tags.get(module_name, frozenset())
+
+
+class TagExpression:
+    """
+    Parsed tag expression; or binds looser than and which binds looser than not
+    """
+    def __init__(self, pattern: str) -> None:
+        self.pattern = pattern
+        negate = pattern.startswith('!')
+        self._tokens = _TOKENS.findall(pattern[1:] if negate else pattern)
+        self._position = 0
+        # ('tags', frozenset) is true when any of the tags is there, the others are
+        # ('and' | 'or', [operands]) and ('not', operand)
+        self.tree = self._parse_or() if self._tokens else ('tags', frozenset())
+        if self._position < len(self._tokens):
+            raise ValueError(f'Unexpected {self._tokens[self._position]!r} in tag expression {pattern!r}')
+        if negate:
+            self.tree = ('not', self.tree)
+
+    def __str__(self) -> str:
+        return self.pattern
+
+    def _next(self) -> str:
+        token = self._tokens[self._position] if self._position < len(self._tokens) else None
+        self._position += 1
+        return token
+
+    def _peek(self) -> str:
+        return self._tokens[self._position] if self._position < len(self._tokens) else None
+
+    def _parse_or(self) -> tuple:
+        operands = [self._parse_and()]
+        while self._peek() in ('or', ','):
+            # A trailing comma is how a single tag is told apart from a folder
+            if self._next() == ',' and self._peek() in (None, ')'):
+                break
+            operands.append(self._parse_and())
+        # Tags that are just or'ed together are checked with 1 set operation
+        if all(x[0] == 'tags' for x in operands):
+            return 'tags', frozenset().union(*(x[1] for x in operands))
+        return ('or', operands) if len(operands) > 1 else operands[0]
+
+    def _parse_and(self) -> tuple:
+        operands = [self._parse_not()]
+        while self._peek() == 'and':
+            self._next()
+            operands.append(self._parse_not())
+        return ('and', operands) if len(operands) > 1 else operands[0]
+
+    def _parse_not(self) -> tuple:
+        if self._peek() == 'not':
+            self._next()
+            return 'not', self._parse_not()
+        token = self._next()
+        if token == '(':
+            tree = self._parse_or()
+            if self._next() != ')':
+                raise ValueError(f'Missing ) in tag expression {self.pattern!r}')
+            return tree
+        if token is None or token in _OPERATORS or token in (')', ','):
+            raise ValueError(f'Expected a tag instead of {token!r} in tag expression {self.pattern!r}')
+        return 'tags', frozenset((token,))
+
+    def matches(self, tags: FrozenSet[str]) -> bool:
+        return self._matches(self.tree, tags)
+
+    def _matches(self, tree: tuple, tags: FrozenSet[str]) -> bool:
+        kind, operand = tree
+        if kind == 'tags':
+            return not operand.isdisjoint(tags)
+        elif kind == 'not':
+            return not self._matches(operand, tags)
+        elif kind == 'and':
+            return all(self._matches(x, tags) for x in operand)
+        return any(self._matches(x, tags) for x in operand)
+
+
+def is_tag_expression(pattern: str) -> bool:
+    """
+    A comma, a parenthesis or an operator tells a tag expression apart from a folder name
+    """
+    tokens = _TOKENS.findall(pattern)
+    return ',' in tokens or '(' in tokens or (len(tokens) > 1 and not _OPERATORS.isdisjoint(tokens))
 
 
 class TagModulePatternMatcher(DefaultModulePatternMatcher):
     tag_delimiter = ','
 
+    def __init__(self, items: List[str], pattern: str, include: bool):
+        super().__init__(items, pattern, include)
+        self.tag_expression: TagExpression = None
+        self.tag_index = TagIndex()
+
     @classmethod
     def parse_str(cls, pattern: str, include: bool = True):
-        global module_tags_matcher
         pattern_list = pattern.split(os.sep)
-        if cls.tag_delimiter in pattern_list[-1]:
-            if pattern_list[-1].endswith(cls.tag_delimiter):
-                module_tags_matcher = PatternMatcherBase.parse_str(pattern_list[-1][:-1], include)
-            else:
-                module_tags_matcher = PatternMatcherBase.parse_str(pattern_list[-1], include)
+        tag_expression = None
+        if is_tag_expression(pattern_list[-1]):
+            tag_expression = TagExpression(pattern_list[-1])
             pattern_list = pattern_list[:-1]
         matcher = super(TagModulePatternMatcher, cls).parse_str(os.sep.join(pattern_list), include)
+        matcher.tag_expression = tag_expression
         return matcher
 
+    def bind(self, test_matcher: 'TagTestCasePatternMatcher') -> None:
+        test_matcher.tag_index = self.tag_index
+        test_matcher.module_tag_expression = self.tag_expression
+
     def module_included(self, module) -> bool:
-        include = True
-        if module_tags_matcher and hasattr(module, constants.TAGS):
-            for tag in module.__tags__:
-                include = module_tags_matcher.included(tag)
-                if include:
-                    break
-        if include:
-            module_tags_dict[module.__name__] = getattr(module, constants.TAGS, [])
-        return include
+        # Tests are selected by their module's tags and their own so a module is only left out
+        # when none of its tests are
+        self.tag_index.add(module.__name__, getattr(module, constants.TAGS, []))
+        return True
 
 
 class TagTestCasePatternMatcher(DefaultTestCasePatternMatcher):
-    delimiter = ','
+    def __init__(self, items: List[str], pattern: str, include: bool):
+        super().__init__(items, pattern, include)
+        self.tag_expression = TagExpression(pattern) if pattern else None
+        # Replaced by the ones of the module matcher it is bound to
+        self.tag_index = TagIndex()
+        self.module_tag_expression: TagExpression = None
 
     def func_included(self, func: Callable) -> bool:
-        include = not module_tags_matcher._include if module_tags_matcher else self._include
-        matcher = module_tags_matcher or self
-        tags = set(module_tags_dict[func.__module__])
+        tags = self.tag_index.tags(func.__module__)
         try:
-            tags |= set(func.metadata.get('tags', []))
+            tags |= frozenset(func.metadata.get('tags', []))
         except AttributeError:
             pass
-        for tag in tags:
-                include = matcher.included(tag)
-                if include:
-                    break
-        return include
+        return all(x.matches(tags) for x in (self.module_tag_expression, self.tag_expression) if x)
@@ -0,0 +1,96 @@
+"""
+    Pooled test parameters: instead of building new test parameters (clients, connections) for
+    every fixture and test, they are checked out of a pool, rebound to the logger of whoever is
+    checking them out and returned to the pool when that fixture or test is done
+"""
+from collections import deque
+from logging import Logger
+import threading
+from typing import (
+    Callable,
+    Deque,
+    Dict,
+    Tuple
+)
+
+
+TestParameters = Tuple[tuple, dict]
+
+
+class TestParametersPool:
+    """
+    Can be used anywhere a test_parameters_func can; the test parameters are only built when
+    the pool has none left so there are never more than the number of tests running at once.
+    At most size of them are kept between checkouts; extra ones are closed
+    """
+    def __init__(self, test_parameters_func: Callable[[Logger, object], TestParameters], size: int = 8
+                 , on_acquire: Callable = None, on_release: Callable = None, on_close: Callable = None) -> None:
+        self.test_parameters_func = test_parameters_func
+        self.size = max(0, size)
+        self.on_acquire = on_acquire
+        self.on_release = on_release
+        self.on_close = on_close
+        self.created = 0
+        # Test parameters get built with a package object so they are only shared within a package
+        self._idle: Dict[int, Deque[TestParameters]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, logger: Logger, package_object) -> TestParameters:
+        return self.test_parameters_func(logger, package_object)
+
+    def acquire(self, logger: Logger, package_object) -> TestParameters:
+        with self._lock:
+            idle = self._idle.get(id(package_object))
+            parameters = idle.pop() if idle else None
+        if parameters is None:
+            parameters = self.test_parameters_func(logger, package_object)
+            with self._lock:
+                self.created += 1
+        if self.on_acquire:
+            try:
+                self.on_acquire(logger, *parameters[0], **parameters[1])
+            except Exception:
+                self._close(parameters)
+                raise
+        return parameters
+
+    def release(self, parameters: TestParameters, package_object) -> None:
+        if self.on_release:
+            try:
+                self.on_release(*parameters[0], **parameters[1])
+            except Exception:
+                # Can't be trusted by the next test anymore
+                self._close(parameters)
+                return
+        with self._lock:
+            idle = self._idle.setdefault(id(package_object), deque())
+            if len(idle) < self.size:
+                idle.append(parameters)
+                return
+        self._close(parameters)
+
+    def close(self) -> None:
+        with self._lock:
+            idle = [x for parameters in self._idle.values() for x in parameters]
+            self._idle.clear()
+        for parameters in idle:
+            self._close(parameters)
+
+    def _close(self, parameters: TestParameters) -> None:
+        if self.on_close:
+            try:
+                self.on_close(*parameters[0], **parameters[1])
+            except Exception:
+                pass
+
+
+def pooled_test_parameters(size: int = 8, on_acquire: Callable = None, on_release: Callable = None
+                           , on_close: Callable = None) -> Callable[[Callable], TestParametersPool]:
+    """
+    on_acquire(logger, *args, **kwargs) is called every time the test parameters are checked out
+    on_release(*args, **kwargs) every time they are returned; if it raises they are closed instead
+    on_close(*args, **kwargs) when they are not kept anymore or the run is over
+    """
+    def wrapper(func: Callable[[Logger, object], TestParameters]) -> TestParametersPool:
+        return TestParametersPool(func, size, on_acquire, on_release, on_close)
+    return wrapper
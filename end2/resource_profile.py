@@ -1,5 +1,7 @@
 from configparser import ConfigParser
+import json
 import os
+from typing import Dict
 
 from end2.constants import Status
 from end2.models.result import TestSuiteResult
@@ -8,6 +10,8 @@ from end2.models.result import TestSuiteResult
 _PRODUCT_NAME = 'end2'
 _FILE_NAME = f'.{_PRODUCT_NAME}rc'
 LAST_RUN_PATH = os.path.join('logs', f'.{_PRODUCT_NAME}lastrunrc')
+RUN_HISTORY_PATH = os.path.join('logs', f'.{_PRODUCT_NAME}history')
+DISCOVERY_INDEX_PATH = os.path.join('logs', f'.{_PRODUCT_NAME}discoveryindex')
 
 
 def get_rc() -> ConfigParser:
@@ -30,16 +34,29 @@ def get_rc() -> ConfigParser:
 _default_rc_dict = {
     'settings': {
         'max-workers': (int, 20),
+        'min-workers': (int, 2),
+        'adaptive-concurrency': (bool, False),
+        'max-async-tasks': (int, 20),
         'max-log-folders': (int, 10),
         'no-concurrency': (bool, False),
+        'executor': (str, 'thread'),
         'stop-on-fail': (bool, False),
-        'event-timeout': (float, 20.0)
+        'reruns': (int, 0),
+        'order': (str, 'random'),
+        'lazy-import': (bool, False),
+        'event-timeout': (float, 20.0),
+        'test-timeout': (float, 0.0)
     },
     'suite-alias': {
         '# Examples': (str, ''),
         '# short_suite_name': (str, 'path/to/suite1.py path/to/another/suite2.py'),
         '# super_suite': (str, 'short_suite_name path/to/suite3.py')
     },
+    'resource-limits': {
+        '# Examples': (str, ''),
+        '# payments_sandbox': (int, 2),
+        '# search_api': (int, 50)
+    },
     'suite-disabled': {
         '# Examples': (str, ''),
         '# path/to/suite3.py': (str, 'BUG-1234'),
@@ -82,6 +99,13 @@ def _check_for_corruption(file_name: str) -> ConfigParser:
     return rc
 
 
+def get_resource_limits(rc: ConfigParser = None) -> Dict[str, int]:
+    rc = rc or get_rc()
+    if 'resource-limits' not in rc:
+        return {}
+    return {k: rc['resource-limits'].getint(k) for k in rc['resource-limits']}
+
+
 def create_last_run_rc(results: TestSuiteResult) -> None:
     failed_test_dict = {}
     for module in results:
@@ -107,3 +131,74 @@ def get_last_run_rc() -> ConfigParser:
     if not rc.read(LAST_RUN_PATH):
         raise FileNotFoundError(LAST_RUN_PATH)
     return rc
+
+
+class RunHistory:
+    """
+    Durations (in seconds) of modules and tests, tests that failed recently and when modules were
+    last modified from previous runs; used for ordering runs
+    """
+    # A test counts as recently failed until its module ran this many times since it last failed
+    RECENT_RUNS = 5
+
+    def __init__(self, path: str = RUN_HISTORY_PATH) -> None:
+        self.path = path
+        self.modules: Dict[str, dict] = {}
+
+    @classmethod
+    def load(cls, path: str = RUN_HISTORY_PATH) -> 'RunHistory':
+        history = cls(path)
+        try:
+            with open(path) as history_file:
+                history.modules = json.load(history_file).get('modules', {})
+        except (OSError, ValueError, AttributeError):
+            # A missing or corrupted history just means there is nothing to order by yet
+            history.modules = {}
+        return history
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'w') as history_file:
+            json.dump({'modules': self.modules}, history_file, indent=1)
+
+    def module_seconds(self, module_name: str) -> float:
+        return self.modules.get(module_name, {}).get('duration')
+
+    def test_seconds(self, module_name: str, test_name: str) -> float:
+        return self.modules.get(module_name, {}).get('tests', {}).get(test_name)
+
+    def recent_failures(self, module_name: str) -> Dict[str, int]:
+        """
+        Test name -> how many runs of its module ago it last failed (0 is the last run)
+        """
+        return self.modules.get(module_name, {}).get('failures', {})
+
+    def module_modified(self, module_name: str, last_modified: float) -> bool:
+        # Modules that never ran before count as modified
+        return self.modules.get(module_name, {}).get('last_modified') != last_modified
+
+    @staticmethod
+    def _smooth(previous: float, current: float) -> float:
+        return current if previous is None else (previous + current) / 2
+
+    def update(self, results: TestSuiteResult) -> None:
+        for module in results:
+            module_history = self.modules.setdefault(module.name, {'duration': None, 'tests': {}})
+            module_history['duration'] = self._smooth(module_history.get('duration'), module.total_seconds)
+            tests = module_history.setdefault('tests', {})
+            failures = module_history.setdefault('failures', {})
+            failed = set()
+            for test in module:
+                if test.status is not Status.SKIPPED:
+                    tests[test.name] = self._smooth(tests.get(test.name), test.total_seconds)
+                if test.status is Status.FAILED:
+                    failed.add(test.name)
+            # Every run of the module counts, even the ones the test was skipped or left out of
+            for name in list(failures):
+                if name not in failed:
+                    failures[name] += 1
+                    if failures[name] >= self.RECENT_RUNS:
+                        del failures[name]
+            failures.update(dict.fromkeys(failed, 0))
+            if module.last_modified is not None:
+                module_history['last_modified'] = module.last_modified
@@ -0,0 +1,55 @@
+"""
+    Named resource slots shared by every module in a run. A test that uses a resource only starts
+    once a slot for every resource it uses is free; resources without a limit are never waited on
+"""
+import asyncio
+from collections import Counter
+import threading
+from typing import (
+    Dict,
+    Iterable
+)
+
+
+_POLL_SECONDS = 0.05
+
+
+class ResourcePool:
+    def __init__(self, limits: Dict[str, int] = None) -> None:
+        self.limits = dict(limits or {})
+        self._in_use = Counter()
+        self._condition = threading.Condition()
+
+    def __bool__(self) -> bool:
+        return bool(self.limits)
+
+    def _limited(self, resources: Iterable[str]) -> list:
+        return [x for x in resources if x in self.limits]
+
+    def _available(self, resources: list) -> bool:
+        return all(self._in_use[x] < self.limits[x] for x in resources)
+
+    def try_acquire(self, resources: Iterable[str]) -> bool:
+        # All or nothing so 2 tests that need the same resources can't each hold half of them
+        resources = self._limited(resources)
+        with self._condition:
+            if not self._available(resources):
+                return False
+            self._in_use.update(resources)
+        return True
+
+    def acquire(self, resources: Iterable[str]) -> None:
+        resources = self._limited(resources)
+        with self._condition:
+            self._condition.wait_for(lambda: self._available(resources))
+            self._in_use.update(resources)
+
+    async def acquire_async(self, resources: Iterable[str]) -> None:
+        while not self.try_acquire(resources):
+            await asyncio.sleep(_POLL_SECONDS)
+
+    def release(self, resources: Iterable[str]) -> None:
+        resources = self._limited(resources)
+        with self._condition:
+            self._in_use.subtract(resources)
+            self._condition.notify_all()
@@ -2,8 +2,13 @@ from argparse import Namespace
 import asyncio
 from cmd import Cmd
 import concurrent.futures
+from contextlib import contextmanager
+import copy
+import functools
 import inspect
+import itertools
 from logging import Logger
+import multiprocessing
 import pathlib
 import threading
 from time import sleep
@@ -11,13 +16,27 @@ import traceback
 import sys
 from typing import (
     Callable,
+    Dict,
+    Iterable,
+    Iterator,
     List,
+    Set,
     Tuple
 )
 
 from end2 import exceptions
+from end2.concurrency import AdaptiveConcurrency
 from end2.discovery import discover_suite
-from end2.constants import ReservedWords, Status
+from end2.distributed import (
+    Coordinator,
+    Worker
+)
+from end2.constants import FixtureScope, Order, ReservedWords, Status
+from end2.fixture_values import (
+    FailedFixture,
+    FixtureValues,
+    raise_failed_fixtures
+)
 from end2.logger import SuiteLogManager
 from end2.models.result import (
     Result,
@@ -28,23 +47,108 @@ from end2.models.result import (
 )
 from end2.models.testing_containers import (
     DynamicMroMixin,
+    get_fixture_names,
+    get_reserved_words,
     TestGroups,
     TestMethod,
     TestModule,
     TestPackage,
     TestPackageTree
 )
-from end2.resource_profile import create_last_run_rc
+from end2.ordering import (
+    order_modules,
+    order_tests
+)
+from end2.pooling import TestParametersPool
+from end2.resource_profile import (
+    create_last_run_rc,
+    get_resource_limits,
+    RunHistory
+)
+from end2.resources import ResourcePool
+from end2.sharding import (
+    load_shard_history,
+    Shard,
+    shard_package_tree,
+    write_shard_report
+)
+
+
+_thread_local = threading.local()
+# Module runs that forked worker processes look up by module name
+_forked_module_runs: Dict[str, 'TestModuleRun'] = {}
+_DISPATCH_POLL_SECONDS = 0.05
 
 
 def default_test_parameters(logger, package_object) -> Tuple[tuple, dict]:
     return (logger,), {}
 
 
+class EventLoops:
+    """
+    The event loops made on threads a run uses so that run only closes its own loops; threads
+    not used by any run add theirs to the module level 1 closed by close_event_loops()
+    """
+    def __init__(self) -> None:
+        self._loops: List[asyncio.AbstractEventLoop] = []
+        self._lock = threading.Lock()
+
+    def use(self) -> None:
+        # Also used as a thread pool initializer
+        _thread_local.event_loops = self
+
+    def add(self, loop: asyncio.AbstractEventLoop) -> None:
+        with self._lock:
+            self._loops.append(loop)
+
+    def close(self) -> None:
+        with self._lock:
+            loops = self._loops
+            # Still running on a thread that isn't done yet so kept to be closed next time
+            self._loops = [x for x in loops if x.is_running()]
+        for loop in loops:
+            if loop.is_closed() or loop.is_running():
+                continue
+            try:
+                pending = asyncio.all_tasks(loop)
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                loop.close()
+
+
+_event_loops = EventLoops()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Gets the event loop that belongs to the current thread; creating it on first use. The loop is
+    kept alive and reused by every test and fixture ran on this thread until the EventLoops of the
+    run using this thread is closed or else close_event_loops()
+    """
+    loop = getattr(_thread_local, 'loop', None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        _thread_local.loop = loop
+        (getattr(_thread_local, 'event_loops', None) or _event_loops).add(loop)
+    return loop
+
+
+def close_event_loops() -> None:
+    _event_loops.close()
+
+
 def create_test_run(parsed_args: Namespace, test_parameters_func=default_test_parameters
                     , log_manager: SuiteLogManager = None) -> Tuple['SuiteRun', Tuple[str]]:
-    test_packages, failed_imports = discover_suite(parsed_args.suite.paths)
+    test_packages, failed_imports = discover_suite(parsed_args.suite.paths, parsed_args.lazy_import)
     suite_run = SuiteRun(parsed_args, test_parameters_func, test_packages, log_manager)
+    if parsed_args.shard_count > 1:
+        suite_run.shard = shard_package_tree(test_packages, parsed_args.shard_index, parsed_args.shard_count
+                                             , load_shard_history(parsed_args.shard_history))
     return suite_run, failed_imports
 
 
@@ -56,59 +160,352 @@ def start_test_run(parsed_args: Namespace, test_parameters_func=default_test_par
     return results, failed_imports
 
 
+def can_fork() -> bool:
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def _reset_forked_event_loops() -> None:
+    # The parent's loops were copied by fork() and must not be used by the child
+    _thread_local.loop = None
+    _thread_local.event_loops = None
+
+
+def _run_forked_module(module_name: str) -> 'TestModuleResult':
+    module_run = _forked_module_runs[module_name]
+    event_loops = EventLoops()
+    event_loops.use()
+    try:
+        if module_run.module.is_parallel:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=module_run.parsed_args.max_workers
+                                                       , initializer=event_loops.use) as executor:
+                module_run.concurrent_executor = executor
+                return module_run.run()
+        return module_run.run()
+    finally:
+        event_loops.close()
+        # Package and suite scoped values this worker made can't outlive the module it ran
+        for fixture_values in module_run.fixture_values.chain():
+            fixture_values.close(module_run.log_manager.logger)
+
+
+def _walk_packages(packages: List[TestPackage]) -> Iterator[TestPackage]:
+    for package in packages:
+        yield package
+        yield from _walk_packages(package.sub_packages)
+
+
+def _walk_group_paths(group: TestGroups, path: str = None) -> Iterator[Tuple[str, TestGroups]]:
+    path = path or group.name
+    yield path, group
+    for child in group.children:
+        yield from _walk_group_paths(child, f'{path}.{child.name}')
+
+
+def _expand_tests(tests: Dict[str, TestMethod]) -> Iterator[Tuple[str, TestMethod]]:
+    for key, test in tests.items():
+        if test.is_lazy:
+            yield from test.expand(key)
+        else:
+            yield key, test
+
+
+def _filter_groups(group: TestGroups, keys: Set[str], path: str = None) -> TestGroups:
+    path = path or group.name
+    group_ = copy.copy(group)
+    group_.tests = {}
+    for k, test in group.tests.items():
+        if test.is_lazy and any(x.startswith(f'{path}::{k}[') for x in keys):
+            # Only the failed cases are kept out of the lazy parameters
+            group_.tests.update((key, test_) for key, test_ in test.expand(k) if f'{path}::{key}' in keys)
+        elif f'{path}::{k}' in keys:
+            group_.tests[k] = test
+    group_.children = [
+        x for x in (_filter_groups(child, keys, f'{path}.{child.name}') for child in group.children)
+        if x is not None
+    ]
+    return group_ if group_.tests or group_.children else None
+
+
+class CancellationToken:
+    """
+    Shared by every module in a run; once cancelled no new tests are started, tests waiting in
+    the pool or on the event loop are cancelled and tests that never started are marked SKIPPED.
+    Given a multiprocessing event it is also shared with forked workers; the reason is not
+    """
+    def __init__(self, event=None) -> None:
+        self.reason = ''
+        self._event = event or threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str) -> None:
+        # A forked worker may have set the event without the reason being seen here
+        if not self.reason:
+            self.reason = reason
+        self._event.set()
+
+
+class _Executors:
+    def __init__(self, tests: concurrent.futures.ThreadPoolExecutor, modules: concurrent.futures.ThreadPoolExecutor
+                 , packages: concurrent.futures.ThreadPoolExecutor) -> None:
+        self.tests = tests
+        self.modules = modules
+        self.packages = packages
+
+
 class SuiteRun:
-    def __init__(self, parsed_args: Namespace, test_parameters_func: Callable, test_packages: Tuple[TestPackageTree], log_manager: SuiteLogManager = None) -> None:
+    def __init__(self, parsed_args: Namespace, test_parameters_func: Callable, test_packages: TestPackageTree, log_manager: SuiteLogManager = None) -> None:
         self.parsed_args = parsed_args
         self.test_parameters_func = test_parameters_func
         self.test_packages = test_packages
         self.allow_concurrency = not self.parsed_args.no_concurrency
+        self.use_processes = self.parsed_args.executor == 'process'
+        if self.use_processes and not can_fork():
+            self.use_processes = False
         self.name = 'suite_run' if not self.parsed_args.watch else 'suite_watch'
+        self.order = Order(self.parsed_args.order)
+        self.run_history = RunHistory.load()
+        self.shard: Shard = None
+        self.resource_pool = ResourcePool(get_resource_limits())
+        self.cancellation = self.create_cancellation()
+        self.fixture_values = FixtureValues(FixtureScope.SUITE)
+        self.event_loops = EventLoops()
+        self._package_fixture_values: Dict[str, FixtureValues] = {}
         self.results = None
         self.log_manager = log_manager or SuiteLogManager(logger_name=self.name, max_folders=self.parsed_args.max_log_folders)
+        if self.parsed_args.executor == 'process' and not self.use_processes:
+            self.logger.warning('fork is not supported on this platform; falling back to thread executor')
+        if self.use_processes and self.allow_concurrency and self.resource_pool:
+            self.logger.warning('[resource-limits] are enforced in each worker process on its own with --executor process')
+        self.concurrency: AdaptiveConcurrency = None
+        if self.parsed_args.adaptive_concurrency and self.allow_concurrency:
+            self.concurrency = AdaptiveConcurrency(self.parsed_args.min_workers, self.parsed_args.max_workers
+                                                   , self.logger, self.run_history.test_seconds)
 
     @property
     def logger(self):
         return self.log_manager.logger
 
+    def create_cancellation(self) -> CancellationToken:
+        # Forked workers share the event so --stop-on-fail stops modules running in other workers too
+        if self.use_processes and self.allow_concurrency:
+            return CancellationToken(multiprocessing.get_context('fork').Event())
+        return CancellationToken()
+
     def run(self) -> TestSuiteResult:
         self.log_manager.on_suite_start(self.name)
         self.results = TestSuiteResult(self.name)
+        previous_event_loops = getattr(_thread_local, 'event_loops', None)
+        self.event_loops.use()
+        if self.shard:
+            self.logger.info(f'Running shard {self.shard.index} of {self.shard.count}: {len(self.shard.units)} '
+                             f'of {len(self.shard.total_units)} units; estimated {self.shard.seconds:.1f}s')
         try:
             if self.parsed_args.watch:
                 self.run_watched()
+            elif self.parsed_args.coordinator:
+                self.results.extend(Coordinator(self, self.parsed_args.coordinator).run())
+            elif self.parsed_args.worker:
+                self.results.extend(Worker(self, self.parsed_args.worker).run())
             else:
-                for package in self.test_packages:
-                    self.results.extend(self.run_modules(package))
+                self.results.extend(self.run_packages(self.test_packages.packages))
+                self.rerun_failed_tests(self.test_packages.packages)
         except exceptions.StopTestRunException as stre:
             self.logger.critical(stre)
+        finally:
+            self.event_loops.close()
+            _thread_local.event_loops = previous_event_loops
+            self.fixture_values.close(self.logger)
+            self.close_test_parameters_pools()
+        if self.cancellation.cancelled:
+            self.logger.critical(f'Run stopped early: {self.cancellation.reason}')
         self.results.end()
+        if self.concurrency:
+            limits = ', '.join(f'{seconds:.1f}s: {limit}' for seconds, limit in self.concurrency.history)
+            self.logger.info(f'Adaptive concurrency limits over time: {limits}')
         self.log_manager.on_suite_stop(self.results)
         create_last_run_rc(self.results)
+        self.run_history.update(self.results)
+        self.run_history.save()
+        if self.shard:
+            write_shard_report(self.log_manager.folder, self.shard, self.results)
         return self.results
 
-    def run_modules(self, package: TestPackage) -> List[TestModuleResult]:
-        test_parameters_func = package.package_test_parameters_func or self.test_parameters_func 
-        package.setup()
+    def close_test_parameters_pools(self) -> None:
+        test_parameters_funcs = [self.test_parameters_func]
+        test_parameters_funcs.extend(x.package_test_parameters_func for x in _walk_packages(self.test_packages.packages))
+        for pool in {id(x): x for x in test_parameters_funcs if isinstance(x, TestParametersPool)}.values():
+            pool.close()
+
+    def rerun_failed_tests(self, packages: List[TestPackage]) -> None:
+        """
+        Reruns failed tests in this process with the already discovered packages; only the groups
+        (and their setup/teardown) that lead to failed tests are ran again
+        """
+        for attempt in range(1, self.parsed_args.reruns + 1):
+            failed: Dict[str, Set[str]] = {}
+            for module_result in self.results:
+                for test_result in module_result:
+                    if test_result.status is Status.FAILED:
+                        failed.setdefault(module_result.name, set()).add(test_result.key)
+            if not failed or self.cancellation.cancelled:
+                break
+            self.logger.info(f'Rerun {attempt} of {self.parsed_args.reruns}: {sum(len(x) for x in failed.values())} failed tests')
+            rerun_results = self.run_packages(self._create_rerun_packages(packages, failed))
+            self._merge_rerun_results(rerun_results)
+
+    def _create_rerun_packages(self, packages: List[TestPackage], failed: Dict[str, Set[str]]) -> List[TestPackage]:
+        def rerun_modules(modules: Set[TestModule]) -> Set[TestModule]:
+            rerun_modules_ = set()
+            for module in modules:
+                groups = _filter_groups(module.groups, failed[module.name]) if module.name in failed else None
+                if groups:
+                    module_ = copy.copy(module)
+                    module_.groups = groups
+                    rerun_modules_.add(module_)
+            return rerun_modules_
+
+        rerun_packages = []
+        for package in packages:
+            package_ = copy.copy(package)
+            package_.sequential_modules = rerun_modules(package.sequential_modules)
+            package_.parallel_modules = rerun_modules(package.parallel_modules)
+            package_.sub_packages = self._create_rerun_packages(package.sub_packages, failed)
+            if package_.sequential_modules or package_.parallel_modules or package_.sub_packages:
+                rerun_packages.append(package_)
+        return rerun_packages
+
+    def _merge_rerun_results(self, rerun_results: List[TestModuleResult]) -> None:
+        module_results = {x.name: x for x in self.results}
+        for rerun_result in rerun_results:
+            module_result = module_results[rerun_result.name]
+            reruns = {x.key: x for x in rerun_result}
+            for i, test_result in enumerate(module_result.test_results):
+                rerun = reruns.get(test_result.key)
+                if rerun is not None and test_result.status is Status.FAILED:
+                    rerun.attempts = test_result.attempts + [test_result]
+                    module_result.test_results[i] = rerun
+            module_result.end()
+
+    def run_packages(self, packages: List[TestPackage]) -> List[TestModuleResult]:
         test_module_results = []
-        if self.allow_concurrency:
-            sequential_modules = package.sequential_modules
-            parallel_modules = package.parallel_modules
+        if self.allow_concurrency and not self.use_processes:
+            # Tests from every package share 1 pool bounded by --max-workers. Packages and modules
+            # coordinate (setup, wait on their tests, teardown) on their own pools, also bounded by
+            # --max-workers; if they took threads from the test pool they could all end up waiting
+            # on tests that never get a thread
+            max_workers = max(1, self.parsed_args.max_workers)
+            package_count = sum(1 for _ in _walk_packages(packages))
+            module_count = sum(len(x.sequential_modules) + len(x.parallel_modules) for x in _walk_packages(packages))
+            initializer = self.event_loops.use
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, initializer=initializer) as executor, \
+                    concurrent.futures.ThreadPoolExecutor(max_workers=min(module_count, max_workers) or 1
+                                                          , initializer=initializer) as module_executor, \
+                    concurrent.futures.ThreadPoolExecutor(max_workers=min(package_count, max_workers) or 1
+                                                          , initializer=initializer) as package_executor:
+                executors = _Executors(executor, module_executor, package_executor)
+                futures = [package_executor.submit(self.run_package, package, executors) for package in packages]
+                for future in futures:
+                    test_module_results.extend(future.result())
         else:
-            sequential_modules = sequential_modules + parallel_modules
-            parallel_modules = tuple()
-        for test_module in sequential_modules:
-            module_run = TestModuleRun(test_parameters_func, test_module, self.log_manager, package.package_object, self.parsed_args)
-            test_module_results.append(module_run.run())
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.parsed_args.max_workers) as executor:
-            futures = [
-                executor.submit(
-                    TestModuleRun(test_parameters_func, test_module, self.log_manager, package.package_object, self.parsed_args, executor).run)
-                for test_module in parallel_modules
+            for package in packages:
+                test_module_results.extend(self.run_package(package))
+        return test_module_results
+
+    def run_package(self, package: TestPackage, executors: '_Executors' = None) -> List[TestModuleResult]:
+        # Once the run is cancelled modules still report their tests as skipped but packages aren't set up anymore
+        set_up = not self.cancellation.cancelled
+        if set_up:
+            package.setup()
+            self.open_package_fixture_values(package)
+        if executors:
+            module_futures = self._submit_modules(package, executors)
+            sub_package_futures = [
+                executors.packages.submit(self.run_package, sub_package, executors)
+                for sub_package in package.sub_packages
             ]
-            for future in futures:
-                test_module_results.append(future.result())
-        package.teardown()
+            test_module_results = [future.result() for future in module_futures]
+            for sub_package, future in zip(package.sub_packages, sub_package_futures):
+                if future.cancel():
+                    # Still queued behind packages that wait on their own sub packages so it runs
+                    # here; otherwise a tree deeper than the pool could wait on itself forever
+                    test_module_results.extend(self.run_package(sub_package, executors))
+                else:
+                    test_module_results.extend(future.result())
+        else:
+            test_module_results = self._run_modules_without_pool(package)
+            for sub_package in package.sub_packages:
+                test_module_results.extend(self.run_package(sub_package))
+        if set_up:
+            self.close_package_fixture_values(package)
+            package.teardown()
+        return test_module_results
+
+    def open_package_fixture_values(self, package: TestPackage) -> None:
+        parent = self._package_fixture_values.get(package.name.rpartition('.')[0], self.fixture_values)
+        self._package_fixture_values[package.name] = parent.child(FixtureScope.PACKAGE, package.fixtures)
+
+    def close_package_fixture_values(self, package: TestPackage) -> None:
+        fixture_values = self._package_fixture_values.pop(package.name, None)
+        if fixture_values:
+            fixture_values.close(self.logger)
+
+    def create_module_run(self, package: TestPackage, test_module: TestModule
+                          , executor: concurrent.futures.ThreadPoolExecutor = None) -> 'TestModuleRun':
+        test_parameters_func = package.package_test_parameters_func or self.test_parameters_func
+        return TestModuleRun(test_parameters_func, test_module, self.log_manager, package.package_object, self.parsed_args
+                             , executor, self.resource_pool, self.concurrency
+                             , self.cancellation, self._package_fixture_values.get(package.name, self.fixture_values))
+
+    def _get_ordered_modules(self, package: TestPackage) -> List[TestModule]:
+        test_modules = order_modules(list(package.sequential_modules) + list(package.parallel_modules), self.order, self.run_history)
+        for test_module in test_modules:
+            self._order_group_tests(test_module.name, test_module.groups)
+        return test_modules
+
+    def _order_group_tests(self, module_name: str, group: TestGroups) -> None:
+        group.tests = order_tests(module_name, group.tests, self.order, self.run_history)
+        for child in group.children:
+            self._order_group_tests(module_name, child)
+
+    def _submit_modules(self, package: TestPackage, executors: '_Executors') -> List[concurrent.futures.Future]:
+        # Sequential modules submit their tests to the pool 1 at a time instead of running them on a pool
+        # thread; blocked there on resources they could hold every thread while the tests holding
+        # those resources are still queued
+        return [
+            executors.modules.submit(self.create_module_run(package, test_module, executors.tests).run)
+            for test_module in self._get_ordered_modules(package)
+        ]
+
+    def _run_modules_without_pool(self, package: TestPackage) -> List[TestModuleResult]:
+        test_modules = self._get_ordered_modules(package)
+        if self.use_processes and self.allow_concurrency and test_modules:
+            return self._run_modules_in_processes(package, test_modules)
+        return [self.create_module_run(package, test_module).run() for test_module in test_modules]
+
+    def _run_modules_in_processes(self, package: TestPackage, modules: List[TestModule]) -> List[TestModuleResult]:
+        # Workers are forked after discovery and package setup so they share the already imported
+        # modules copy-on-write; only module names are sent to workers and only results come back
+        global _forked_module_runs
+        _forked_module_runs = {test_module.name: self.create_module_run(package, test_module) for test_module in modules}
+        test_module_results = []
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(self.parsed_args.max_workers, len(modules))
+                                                        , mp_context=multiprocessing.get_context('fork')
+                                                        , initializer=_reset_forked_event_loops) as executor:
+                futures = {module_name: executor.submit(_run_forked_module, module_name) for module_name in _forked_module_runs}
+                for module_name, future in futures.items():
+                    if self.cancellation.cancelled and future.cancel():
+                        # Never started so running it here only reports its tests as skipped
+                        test_module_results.append(_forked_module_runs[module_name].run())
+                        continue
+                    test_module_results.append(future.result())
+                    if self.parsed_args.stop_on_fail and test_module_results[-1].failed_count:
+                        self.cancellation.cancel(f'{module_name} failed')
+        finally:
+            _forked_module_runs = {}
         return test_module_results
 
     def run_watched(self) -> None:
@@ -150,7 +547,8 @@ class _SuiteWatchCmd(Cmd):
             if package_.parallel_modules or package_.parallel_modules:
                 if self.ran_at_least_once:
                     self.suite_run.log_manager = self.suite_run.log_manager.new_instance()
-                self.suite_run.run_modules(package_)
+                self.suite_run.cancellation = self.suite_run.create_cancellation()
+                self.suite_run.run_packages([package_])
                 self.suite_run.log_manager.on_suite_stop(TestSuiteResult(self.suite_run.name))
                 self.suite_run.log_manager.close()
                 self.stdout.write(self.intro)
@@ -171,19 +569,47 @@ class _SuiteWatchCmd(Cmd):
 class TestModuleRun:
     def __init__(self, test_parameters_func, module: TestModule, log_manager: SuiteLogManager
                  , package_object: DynamicMroMixin, parsed_args: Namespace
-                 , concurrent_executor: concurrent.futures.ThreadPoolExecutor = None) -> None:
+                 , concurrent_executor: concurrent.futures.ThreadPoolExecutor = None
+                 , resource_pool: ResourcePool = None, concurrency: AdaptiveConcurrency = None
+                 , cancellation: CancellationToken = None, fixture_values: FixtureValues = None) -> None:
         self.test_parameters_func = test_parameters_func
         self.module = module
         self.log_manager = log_manager
         self.package_object = package_object
         self.parsed_args = parsed_args
         self.stop_on_fail = parsed_args.stop_on_fail
+        # Tests of a sequential module go through concurrent_executor too but 1 at a time
+        self.max_async_tasks = parsed_args.max_async_tasks if module.is_parallel else 1
+        self.max_workers = max(1, parsed_args.max_workers) if module.is_parallel else 1
         self.concurrent_executor = concurrent_executor
-        self.parameters_resolver = ParametersResolver(test_parameters_func, self.package_object, self.parsed_args.event_timeout)
+        self.resource_pool = resource_pool or ResourcePool()
+        self.concurrency = concurrency
+        self.cancellation = cancellation or CancellationToken()
+        # The package's (or suite's) fixture values; module, group and test ones are chained to it
+        self.fixture_values = fixture_values or FixtureValues(FixtureScope.SUITE)
+        self._group_fixture_values: Dict[int, FixtureValues] = {}
+        self._group_paths = {id(group): path for path, group in _walk_group_paths(module.groups)}
+        self.parameters_resolver = ParametersResolver(test_parameters_func, self.package_object, self.parsed_args.event_timeout
+                                                      , self.parsed_args.test_timeout)
 
     def run(self) -> TestModuleResult:
+        load_record = None
+        if not self.cancellation.cancelled:
+            # Statically discovered modules are imported here so imports overlap with other modules' tests
+            try:
+                self.module.load()
+            except Exception as e:
+                load_record = f'Failed to load {self.module.file_name} - {e}'
+                self.log_manager.logger.error(load_record)
         result = TestModuleResult(self.module)
-        setup_results, test_results, teardown_results = self.run_group(self.module.groups)
+        if load_record:
+            setup_results, test_results, teardown_results = [], self._create_skipped_results(self.module.groups, load_record, Status.FAILED), []
+        else:
+            module_fixture_values = self.fixture_values.child(FixtureScope.MODULE)
+            try:
+                setup_results, test_results, teardown_results = self.run_group(self.module.groups, module_fixture_values)
+            finally:
+                module_fixture_values.close(self.log_manager.logger)
         result.setups = setup_results
         result.test_results = test_results
         result.teardowns = teardown_results
@@ -191,138 +617,260 @@ class TestModuleRun:
         self.log_manager.on_module_done(result)
         return result
 
-    def run_group(self, group: TestGroups) -> Tuple[List[Result], List[TestMethodResult], List[Result]]:
-        setup_results = [self.setup(group.setup_func)]
-        teardown_results = []
-        if setup_results[0].status is Status.FAILED:
-            test_results = self._create_skipped_results(group, setup_results[0].record)
-        else:
-            test_results = self.run_tests(group)
-            for group_ in group.children:
-                sr, tr, trr = self.run_group(group_)
-                setup_results.extend(sr)
-                test_results.extend(tr)
-                teardown_results.extend(trr)
-            teardown_results.append(self.teardown(group.teardown_func))
-        if any(x.status is Status.FAILED for x in test_results):
-            self._run_on_failures_in_module()
+    def run_group(self, group: TestGroups, fixture_values: FixtureValues = None) -> Tuple[List[Result], List[TestMethodResult], List[Result]]:
+        if self.cancellation.cancelled:
+            return [], self._create_skipped_results(group, self._cancelled_record), []
+        fixture_values = (fixture_values or self.fixture_values).child(FixtureScope.GROUP, group.fixtures)
+        self._group_fixture_values[id(group)] = fixture_values
+        try:
+            setup_results = [self.setup(group.setup_func, fixture_values)]
+            teardown_results = []
+            if setup_results[0].status is Status.FAILED:
+                test_results = self._create_skipped_results(group, setup_results[0].record)
+            else:
+                test_results = self.run_tests(group)
+                for group_ in group.children:
+                    sr, tr, trr = self.run_group(group_, fixture_values)
+                    setup_results.extend(sr)
+                    test_results.extend(tr)
+                    teardown_results.extend(trr)
+                teardown_results.append(self.teardown(group.teardown_func, fixture_values))
+            if any(x.status is Status.FAILED for x in test_results):
+                self._run_on_failures_in_module(fixture_values)
+        finally:
+            del self._group_fixture_values[id(group)]
+            fixture_values.close(self.log_manager.logger)
         return setup_results, test_results, teardown_results
 
-    def _run_on_failures_in_module(self):
+    def _run_on_failures_in_module(self, fixture_values: FixtureValues = None):
         teardown_logger = self.log_manager.get_teardown_logger(self.module.name)
-        args, kwargs, ender = self.parameters_resolver.resolve(self.module.on_failures_in_module, teardown_logger)
-        if inspect.iscoroutinefunction(self.module.on_failures_in_module):
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(run_async_test_func(teardown_logger, ender, self.module.on_failures_in_module, *args, **kwargs))
-            loop.close()
-        else:
-            run_test_func(teardown_logger, ender, self.module.on_failures_in_module, *args, **kwargs)
+        with self.parameters_resolver.resolved(self.module.on_failures_in_module, teardown_logger
+                                               , fixture_values=fixture_values) as (args, kwargs, ender):
+            if inspect.iscoroutinefunction(self.module.on_failures_in_module):
+                get_event_loop().run_until_complete(run_async_test_func(teardown_logger, ender, self.module.on_failures_in_module, *args, **kwargs))
+            else:
+                run_test_func(teardown_logger, ender, self.module.on_failures_in_module, *args, **kwargs)
 
-    def _create_skipped_results(self, group: TestGroups, record: str) -> List[TestMethodResult]:
-        test_results = [
-            TestMethodResult(v.name, status=Status.SKIPPED, record=record, description=v.__doc__, metadata=v.metadata)
-            for _, v in group.tests.items()
-        ]
+    @property
+    def _cancelled_record(self) -> str:
+        return f'Run was cancelled: {self.cancellation.reason}'
+
+    def _stop_if_failed(self, result: TestMethodResult) -> None:
+        if self.stop_on_fail and result.status is Status.FAILED:
+            self.cancellation.cancel(f'{self.module.name}::{result.name} failed: {result.record}')
+
+    def _create_skipped_results(self, group: TestGroups, record: str, status: Status = Status.SKIPPED) -> List[TestMethodResult]:
+        path = self._group_paths[id(group)]
+        test_results = []
+        for key, test in _expand_tests(group.tests):
+            test_result = TestMethodResult(test.name, status=status, record=record, description=test.__doc__, metadata=test.metadata)
+            # Same key as when the test runs so reruns find it
+            test_result.key = f'{path}::{key}'
+            test_results.append(test_result)
         for g in group.children:
-            test_results.extend(self._create_skipped_results(g, record))
+            test_results.extend(self._create_skipped_results(g, record, status))
         return test_results
 
-    def setup(self, setup_func: Callable) -> Result:
+    def setup(self, setup_func: Callable, fixture_values: FixtureValues = None) -> Result:
         setup_logger = self.log_manager.get_setup_logger(self.module.name)
-        args, kwargs, ender = self.parameters_resolver.resolve(setup_func, setup_logger)
-        if inspect.iscoroutinefunction(setup_func):
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(run_async_test_func(setup_logger, ender, setup_func, *args, **kwargs))
-            loop.close()
-        else:
-            result = run_test_func(setup_logger, ender, setup_func, *args, **kwargs)
+        with self.parameters_resolver.resolved(setup_func, setup_logger, fixture_values=fixture_values) as (args, kwargs, ender):
+            setup_func_ = self.parameters_resolver.time_limited(setup_func)
+            if inspect.iscoroutinefunction(setup_func):
+                result = get_event_loop().run_until_complete(run_async_test_func(setup_logger, ender, setup_func_, *args, **kwargs))
+            else:
+                result = run_test_func(setup_logger, ender, setup_func_, *args, **kwargs)
         self.log_manager.on_setup_module_done(self.module.name, result.to_base())
         return result
 
-    def run_tests(self, group: TestGroups) -> List[TestMethodResult]:        
-        async def as_completed(coroutines_, results_, stop_on_first_fail_):
-            for fs in coroutines_:
-                try:
-                    result = await fs.run_async()
-                    results_.append(result)
-                    if result.status is Status.FAILED and stop_on_first_fail_:
-                        [f.cancel() for f in coroutines_]
-                except exceptions.IgnoreTestException:
-                    pass
-        
-        routines, coroutines = [], []
-        for k, test in group.tests.items():
-            test_run = TestMethodRun(test, self.parameters_resolver, self.log_manager, self.module.name)
-            if inspect.iscoroutinefunction(test.func):
-                coroutines.append(test_run)
-            else:
-                routines.append(test_run)
+    def run_tests(self, group: TestGroups) -> List[TestMethodResult]:
+        # Test runs are created as they are pulled so lazy parameters are expanded while running
+        created = []
+        routines = self._create_test_runs(group, created, coroutines=False)
+        coroutines = self._create_test_runs(group, created, coroutines=True)
         results = []
-        loop = None
-        try:
-            if self.concurrent_executor:
-                future_results = [
-                    self.concurrent_executor.submit(test.run)
-                    for test in routines
-                ]
-                try:
-                    for future_result in concurrent.futures.as_completed(future_results):
+        if self.concurrent_executor:
+            try:
+                for future_result in self._submit_when_resources_free(routines):
+                    if future_result.cancelled():
+                        continue
+                    try:
+                        result = future_result.result()
+                        results.append(result)
+                        self._stop_if_failed(result)
+                    except exceptions.IgnoreTestException:
+                        pass
+            except:
+                self.log_manager.logger.error(traceback.format_exc())
+            if not self.cancellation.cancelled:
+                get_event_loop().run_until_complete(self._run_coroutines_concurrently(coroutines, results))
+        else:
+            try:
+                for test in routines:
+                    if self.cancellation.cancelled:
+                        break
+                    try:
+                        self._acquire(test)
+                        results.append(self._run_and_release(test))
+                        self._stop_if_failed(results[-1])
+                    except exceptions.IgnoreTestException:
+                        pass
+                for test in coroutines:
+                    if self.cancellation.cancelled:
+                        break
+                    try:
+                        self._acquire(test)
+                        result = None
                         try:
-                            result = future_result.result()
+                            result = get_event_loop().run_until_complete(test.run_async())
                             results.append(result)
-                            if self.stop_on_fail and result.status is Status.FAILED:
-                                raise exceptions.StopTestRunException(result.record)
-                        except exceptions.IgnoreTestException:
-                            pass
-                except exceptions.StopTestRunException as stre:
-                    raise
-                except:
-                    self.log_manager.logger.error(traceback.format_exc())
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                loop.run_until_complete(as_completed(coroutines, results, self.stop_on_fail))
-                loop.close()
-            else:
-                try:
-                    for test in routines:
-                        try:
-                            results.append(test.run())
-                            if self.stop_on_fail and results[-1].status is Status.FAILED:
-                                raise exceptions.StopTestRunException(results[-1].record)
-                        except exceptions.IgnoreTestException:
-                            pass
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    for test in coroutines:
-                        try:
-                            results.append(loop.run_until_complete(test.run_async()))
-                            if self.stop_on_fail and results[-1].status is Status.FAILED:
-                                raise exceptions.StopTestRunException(results[-1].record)
-                        except exceptions.IgnoreTestException:
-                            pass
-                    loop.close()
-                except exceptions.StopTestRunException as stre:
-                    raise
-                except:
-                    self.log_manager.logger.error(traceback.format_exc())
-            return results
+                        finally:
+                            self._release(test, result)
+                        self._stop_if_failed(result)
+                    except exceptions.IgnoreTestException:
+                        pass
+            except:
+                self.log_manager.logger.error(traceback.format_exc())
+        # Whatever was never pulled is created now only to be reported as skipped
+        for _ in itertools.chain(routines, coroutines):
+            pass
+        for test_run in created:
+            if not test_run.started:
+                result = TestMethodResult(test_run.test_method.name, status=Status.SKIPPED, record=self._cancelled_record
+                                          , description=test_run.test_method.description, metadata=test_run.test_method.metadata)
+                result.key = test_run.key
+                results.append(result)
+        return results
+
+    def _create_test_runs(self, group: TestGroups, created: List['TestMethodRun'], coroutines: bool) -> Iterator['TestMethodRun']:
+        path = self._group_paths[id(group)]
+        tests = {k: v for k, v in group.tests.items() if inspect.iscoroutinefunction(v.func) is coroutines}
+        for key, test in _expand_tests(tests):
+            test_run = TestMethodRun(test, self.parameters_resolver, self.log_manager, self.module.name
+                                     , self.module.resources | set(test.metadata.get('resources', ())), f'{path}::{key}'
+                                     , self._group_fixture_values.get(id(group), self.fixture_values))
+            created.append(test_run)
+            yield test_run
+
+    def _submit_when_resources_free(self, test_runs: Iterable['TestMethodRun']) -> Iterator[concurrent.futures.Future]:
+        """
+        Yields futures as they complete. A test is only submitted once its resources (and a slot
+        from adaptive concurrency) are free so it never holds a pool worker while waiting on them.
+        Only up to --max-workers tests of this module are pulled from test_runs at a time
+        """
+        test_runs = iter(test_runs)
+        waiting = []
+        running: Dict[concurrent.futures.Future, 'TestMethodRun'] = {}
+        exhausted = False
+        while True:
+            if self.cancellation.cancelled:
+                # Only futures still queued in the pool can be cancelled; started tests run to the end
+                exhausted = True
+                waiting.clear()
+                for future, test_run in running.items():
+                    if future.cancel():
+                        # _run_and_release never runs for it so its slots are given back here
+                        self._release(test_run, None)
+            for test_run in list(waiting):
+                if self._try_acquire(test_run):
+                    waiting.remove(test_run)
+                    running[self.concurrent_executor.submit(self._run_and_release, test_run)] = test_run
+            while not exhausted and len(running) + len(waiting) < self.max_workers:
+                test_run = next(test_runs, None)
+                if test_run is None:
+                    exhausted = True
+                elif self._try_acquire(test_run):
+                    running[self.concurrent_executor.submit(self._run_and_release, test_run)] = test_run
+                else:
+                    waiting.append(test_run)
+            if not running and not waiting:
+                break
+            # Slots can be released and the run cancelled by other modules so this is checked periodically
+            done, _ = concurrent.futures.wait(running, timeout=_DISPATCH_POLL_SECONDS
+                                              , return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+            yield from done
+
+    def _run_and_release(self, test_run: 'TestMethodRun') -> TestMethodResult:
+        result = None
+        try:
+            result = test_run.run()
+            return result
         finally:
-            if loop is not None and loop.is_running():
-                loop.close()
+            self._release(test_run, result)
+
+    def _try_acquire(self, test_run: 'TestMethodRun') -> bool:
+        if not self.resource_pool.try_acquire(test_run.resources):
+            return False
+        if self.concurrency and not self.concurrency.try_acquire():
+            self.resource_pool.release(test_run.resources)
+            return False
+        return True
+
+    def _acquire(self, test_run: 'TestMethodRun') -> None:
+        self.resource_pool.acquire(test_run.resources)
+        if self.concurrency:
+            self.concurrency.acquire()
+
+    async def _acquire_async(self, test_run: 'TestMethodRun') -> None:
+        await self.resource_pool.acquire_async(test_run.resources)
+        if self.concurrency:
+            await self.concurrency.acquire_async()
+
+    def _release(self, test_run: 'TestMethodRun', result: TestMethodResult = None) -> None:
+        self.resource_pool.release(test_run.resources)
+        if self.concurrency:
+            self.concurrency.release(self.module.name, result)
+
+    async def _run_coroutines_concurrently(self, test_runs: Iterable['TestMethodRun'], results: List[TestMethodResult]) -> None:
+        # A max_async_tasks of 0 or less means there is no cap on in-flight tasks
+        limit = self.max_async_tasks if self.max_async_tasks and self.max_async_tasks > 0 else None
+        test_runs = iter(test_runs)
+
+        async def run_with_resources(test_run: TestMethodRun) -> TestMethodResult:
+            await self._acquire_async(test_run)
+            result = None
+            try:
+                result = await test_run.run_async()
+                return result
+            finally:
+                self._release(test_run, result)
+
+        pending = set()
+        try:
+            while True:
+                while not self.cancellation.cancelled and (limit is None or len(pending) < limit):
+                    test_run = next(test_runs, None)
+                    if test_run is None:
+                        break
+                    pending.add(asyncio.ensure_future(run_with_resources(test_run)))
+                if not pending:
+                    break
+                # The run can be cancelled by other modules so this is checked periodically
+                done, pending = await asyncio.wait(pending, timeout=_DISPATCH_POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        result = task.result()
+                    except (exceptions.IgnoreTestException, asyncio.CancelledError):
+                        continue
+                    results.append(result)
+                    self._stop_if_failed(result)
+                if self.cancellation.cancelled:
+                    for task in pending:
+                        task.cancel()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
 
-    def teardown(self, teardown_func: Callable) -> Result:
+    def teardown(self, teardown_func: Callable, fixture_values: FixtureValues = None) -> Result:
         teardown_logger = self.log_manager.get_teardown_logger(self.module.name)
-        args, kwargs = self.test_parameters_func(teardown_logger, self.package_object)
-        args, kwargs, ender = self.parameters_resolver.resolve(teardown_func, teardown_logger)
-        if inspect.iscoroutinefunction(teardown_func):
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(run_async_test_func(teardown_logger, ender, teardown_func, *args, **kwargs))
-            loop.close()
-        else:
-            result = run_test_func(teardown_logger, ender, teardown_func, *args, **kwargs)
+        with self.parameters_resolver.resolved(teardown_func, teardown_logger, fixture_values=fixture_values) as (args, kwargs, ender):
+            teardown_func_ = self.parameters_resolver.time_limited(teardown_func)
+            if inspect.iscoroutinefunction(teardown_func):
+                result = get_event_loop().run_until_complete(run_async_test_func(teardown_logger, ender, teardown_func_, *args, **kwargs))
+            else:
+                result = run_test_func(teardown_logger, ender, teardown_func_, *args, **kwargs)
         self.log_manager.on_teardown_module_done(self.module.name, result.to_base())
         return result
 
@@ -331,68 +879,229 @@ class Ender:
     def __init__(self, time_out: float = 15.0) -> None:
         self.time_out = time_out
         self.event = threading.Event()
-        
+        self.remaining = 1
+        self.calls = 0
+        self.failure = None
+        self._lock = threading.Lock()
+
     def create(self) -> Callable:
         self.event = threading.Event()
-        return Ender.end_wrapper(self.event)
+        self.remaining = 1
+        self.calls = 0
+        self.failure = None
+        return self.end_wrapper()
 
-    @staticmethod
-    def end_wrapper(event: threading.Event) -> Callable:
+    def end_wrapper(self) -> Callable:
         def end() -> None:
-            event.set()
+            self.count_down()
         def fail(x: str) -> None:
-            event.set()
+            self.failure = x
+            self.set()
             raise exceptions.OnEventFailedException(x)
+        def expect(count: int) -> None:
+            # Use when the test needs end() to be called n times before it is done
+            if count < 1:
+                raise ValueError(f'end.expect() count must be at least 1 not {count}')
+            # end() may have been called already by a callback the test started first
+            with self._lock:
+                self.remaining = count - self.calls
+                done = self.remaining <= 0
+            if done:
+                self.set()
+            elif self.failure is None:
+                self.reset()
         end.fail = fail
+        end.expect = expect
         return end
 
+    def count_down(self) -> None:
+        with self._lock:
+            self.calls += 1
+            self.remaining -= 1
+            done = self.remaining <= 0
+        if done:
+            self.set()
+
+    def set(self) -> None:
+        self.event.set()
+
+    def reset(self) -> None:
+        self.event.clear()
+
+    def _raise_if_failed(self) -> None:
+        if self.failure is not None:
+            raise exceptions.OnEventFailedException(self.failure)
+
+    def _raise_timeout(self) -> None:
+        raise TimeoutError(f"end() time out reached: {self.time_out}s")
+
     def wait(self) -> None:
         in_time = self.event.wait(self.time_out)
         if not in_time:
-            raise TimeoutError(f"end() time out reached: {self.time_out}s")
+            self._raise_timeout()
+        self._raise_if_failed()
+
+    async def wait_async(self) -> None:
+        # Waits in a thread so the event loop is not blocked
+        in_time = await asyncio.get_running_loop().run_in_executor(None, self.event.wait, self.time_out)
+        if not in_time:
+            self._raise_timeout()
+        self._raise_if_failed()
+
+
+class AsyncEnder(Ender):
+    """
+    Ender for coroutine tests; waiting is done with a future on the running loop so
+    other tests on the same loop keep running. end() can be called from any thread
+    """
+    def __init__(self, time_out: float = 15.0) -> None:
+        super().__init__(time_out)
+        self._done = False
+        self._loop = None
+        self._future = None
+
+    def create(self) -> Callable:
+        self._done = False
+        self._loop = None
+        self._future = None
+        return super().create()
+
+    def set(self) -> None:
+        with self._lock:
+            self._done = True
+            loop, future = self._loop, self._future
+        self.event.set()
+        if future is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._resolve, future)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._done = False
+        self.event.clear()
+
+    @staticmethod
+    def _resolve(future: asyncio.Future) -> None:
+        if not future.done():
+            future.set_result(None)
+
+    def wait(self) -> None:
+        raise exceptions.TestCodeException(f'{self.__class__.__name__} can only be awaited; use wait_async()')
+
+    async def wait_async(self) -> None:
+        with self._lock:
+            if not self._done:
+                self._loop = asyncio.get_running_loop()
+                self._future = self._loop.create_future()
+            future = self._future
+        if future is not None:
+            try:
+                await asyncio.wait_for(future, self.time_out)
+            except asyncio.TimeoutError:
+                self._raise_timeout()
+        self._raise_if_failed()
 
 
 class ParametersResolver:
-    def __init__(self, test_parameters_func: Callable, package_object, time_out: float = 15.0) -> None:
+    def __init__(self, test_parameters_func: Callable, package_object, time_out: float = 15.0
+                 , test_timeout: float = 0.0) -> None:
         self._package_object = package_object
         self._test_parameters_func = test_parameters_func
         self.time_out = time_out
+        self.test_timeout = test_timeout
+
+    def time_limited(self, method: Callable) -> Callable:
+        """
+        Wraps method so it fails once its @metadata(timeout=...) or else --test-timeout
+        is reached; a timeout of 0 or less means no time limit
+        """
+        timeout = getattr(method, 'metadata', {}).get('timeout', self.test_timeout)
+        if not timeout or timeout <= 0:
+            return method
+        return with_timeout(method, timeout)
 
-    def resolve(self, method: Callable, logger: Logger, extra_args: tuple = None) -> tuple:
-        args, kwargs = self._test_parameters_func(logger, self._package_object)
+    @contextmanager
+    def resolved(self, method: Callable, logger: Logger, extra_args: tuple = None
+                 , fixture_values: FixtureValues = None) -> Iterator[tuple]:
+        """
+        Same as resolve but pooled test parameters are checked out for as long as the block runs
+        """
+        if not isinstance(self._test_parameters_func, TestParametersPool):
+            yield self.resolve(method, logger, extra_args, fixture_values=fixture_values)
+            return
+        parameters = self._test_parameters_func.acquire(logger, self._package_object)
+        try:
+            yield self.resolve(method, logger, extra_args, parameters, fixture_values)
+        finally:
+            self._test_parameters_func.release(parameters, self._package_object)
+
+    def resolve(self, method: Callable, logger: Logger, extra_args: tuple = None
+                , parameters: Tuple[tuple, dict] = None, fixture_values: FixtureValues = None
+                , within: FixtureValues = None) -> tuple:
+        args, kwargs = parameters or self._test_parameters_func(logger, self._package_object)
+        # Pooled kwargs are shared with later tests so reserved words can't be added to them
+        kwargs = dict(kwargs)
         if extra_args:
             args += extra_args
-        kwonlyargs = dict.fromkeys(inspect.getfullargspec(method).kwonlyargs, True)
+        reserved_words = get_reserved_words(method)
         ender = None
-        if kwonlyargs:
-            if kwonlyargs.pop(ReservedWords.END.value, False):
-                ender = Ender(self.time_out)
+        if reserved_words:
+            if ReservedWords.END.value in reserved_words:
+                ender = AsyncEnder(self.time_out) if inspect.iscoroutinefunction(method) else Ender(self.time_out)
                 kwargs[ReservedWords.END.value] = ender.create()
-            if kwonlyargs.pop(ReservedWords.LOGGER.value, False):
+            if ReservedWords.LOGGER.value in reserved_words:
                 kwargs[ReservedWords.LOGGER.value] = logger
-            if kwonlyargs.pop(ReservedWords.PACKAGE_OBJECT.value, False):
+            if ReservedWords.PACKAGE_OBJECT.value in reserved_words:
                 kwargs[ReservedWords.PACKAGE_OBJECT.value] = self._package_object
-            if kwonlyargs.pop(ReservedWords.STEP.value, False):
+            if ReservedWords.STEP.value in reserved_words:
                 kwargs[ReservedWords.STEP.value] = True
-            if kwonlyargs:
-                raise exceptions.TestCodeException(f"Unknown reserved words found or possibly typos: {list(kwonlyargs.keys())}"
-                                                   f"\npossible reserved keywords: {[[x.name for x in ReservedWords]]}")
+        for name in get_fixture_names(method):
+            # A fixture that fails, fails whoever asked for it once it is called
+            try:
+                if fixture_values is None:
+                    raise exceptions.TestCodeException(f'No fixture named {name}')
+                kwargs[name] = fixture_values.get(name, functools.partial(self._create_fixture_value, logger, fixture_values), within)
+            except Exception as e:
+                kwargs[name] = FailedFixture(e)
         return args, kwargs, ender
 
+    def _create_fixture_value(self, logger: Logger, fixture_values: FixtureValues, fixture: Callable, owner: FixtureValues):
+        parameters = None
+        if isinstance(self._test_parameters_func, TestParametersPool):
+            parameters = self._test_parameters_func.acquire(logger, self._package_object)
+            # Added before the fixture is so they are only given back once the fixture is finalized
+            owner.add_finalizer(fixture.__name__, functools.partial(
+                self._test_parameters_func.release, parameters, self._package_object
+            ))
+        args, kwargs, _ = self.resolve(fixture, logger, parameters=parameters, fixture_values=fixture_values, within=owner)
+        raise_failed_fixtures(kwargs)
+        return fixture(*args, **kwargs)
+
 
 class TestMethodRun:
     def __init__(self, test_method: TestMethod, parameters_resolver: ParametersResolver
-                 , log_manager: SuiteLogManager, module_name: str) -> None:
+                 , log_manager: SuiteLogManager, module_name: str, resources: Set[str] = None
+                 , key: str = None, fixture_values: FixtureValues = None) -> None:
         self.test_method = test_method
+        self.key = key or test_method.name
+        self.resources = resources or set()
+        self.started = False
         self.parameters_resolver = parameters_resolver
         self.log_manager = log_manager
         self.module_name = module_name
+        self.group_fixture_values = fixture_values or FixtureValues(FixtureScope.GROUP)
+        self.fixture_values: FixtureValues = None
 
     def run(self) -> TestMethodResult:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        self.started = True
+        self.fixture_values = self.group_fixture_values.child(FixtureScope.TEST)
+        try:
+            return self._run()
+        finally:
+            self.fixture_values.close(self.log_manager.logger)
+
+    def _run(self) -> TestMethodResult:
         if inspect.iscoroutinefunction(self.test_method.setup_func):
-            setup_result = loop.run_until_complete(
+            setup_result = get_event_loop().run_until_complete(
                 self._intialize_args_and_setup_async()
             )
         else:
@@ -401,26 +1110,33 @@ class TestMethodRun:
         result = self._intialize_args_and_run()
         if result.status is Status.FAILED and hasattr(self.test_method.func, 'on_test_failure'):
             logger = self.log_manager.get_test_logger(self.module_name, self.test_method.name)
-            args, kwargs, ender = self.parameters_resolver.resolve(self.test_method.func.on_test_failure, logger)
-            if inspect.iscoroutinefunction(self.test_method.func.on_test_failure):
-                loop.run_until_complete(
-                    run_async_test_func(self.log_manager.logger, ender, self.test_method.func.on_test_failure, *args, **kwargs)
-                )
-            else:
-                run_test_func(self.log_manager.logger, ender, self.test_method.func.on_test_failure, *args, **kwargs)
+            with self.parameters_resolver.resolved(self.test_method.func.on_test_failure, logger, fixture_values=self.fixture_values) as (args, kwargs, ender):
+                if inspect.iscoroutinefunction(self.test_method.func.on_test_failure):
+                    get_event_loop().run_until_complete(
+                        run_async_test_func(self.log_manager.logger, ender, self.test_method.func.on_test_failure, *args, **kwargs)
+                    )
+                else:
+                    run_test_func(self.log_manager.logger, ender, self.test_method.func.on_test_failure, *args, **kwargs)
 
         if inspect.iscoroutinefunction(self.test_method.teardown_func):
-            teardown_result = loop.run_until_complete(
+            teardown_result = get_event_loop().run_until_complete(
                 self._intialize_args_and_teardown_async()
             )
         else:
             teardown_result = self._intialize_args_and_teardown()
         result.setup_result = setup_result
         result.teardown_result = teardown_result
-        loop.close()
         return result
 
     async def run_async(self) -> TestMethodResult:
+        self.started = True
+        self.fixture_values = self.group_fixture_values.child(FixtureScope.TEST)
+        try:
+            return await self._run_async()
+        finally:
+            self.fixture_values.close(self.log_manager.logger)
+
+    async def _run_async(self) -> TestMethodResult:
         if inspect.iscoroutinefunction(self.test_method.setup_func):
             setup_result = await self._intialize_args_and_setup_async()
         else:
@@ -429,11 +1145,11 @@ class TestMethodRun:
         result = await self._intialize_args_and_run_async()
         if result.status is Status.FAILED and hasattr(self.test_method.func, 'on_test_failure'):
             logger = self.log_manager.get_test_logger(self.module_name, self.test_method.name)
-            args, kwargs, ender = self.parameters_resolver.resolve(self.test_method.func.on_test_failure, logger)
-            if inspect.iscoroutinefunction(self.test_method.func.on_test_failure):
-                await run_async_test_func(self.log_manager.logger, ender, self.test_method.func.on_test_failure, *args, **kwargs)
-            else:
-                run_test_func(self.log_manager.logger, ender, self.test_method.func.on_test_failure, *args, **kwargs)
+            with self.parameters_resolver.resolved(self.test_method.func.on_test_failure, logger, fixture_values=self.fixture_values) as (args, kwargs, ender):
+                if inspect.iscoroutinefunction(self.test_method.func.on_test_failure):
+                    await run_async_test_func(self.log_manager.logger, ender, self.test_method.func.on_test_failure, *args, **kwargs)
+                else:
+                    run_test_func(self.log_manager.logger, ender, self.test_method.func.on_test_failure, *args, **kwargs)
 
         if inspect.iscoroutinefunction(self.test_method.teardown_func):
             teardown_result = await self._intialize_args_and_teardown_async()
@@ -445,45 +1161,47 @@ class TestMethodRun:
 
     def _intialize_args_and_setup(self) -> Result:
         logger = self.log_manager.get_setup_test_logger(self.module_name, self.test_method.name)
-        args, kwargs, ender = self.parameters_resolver.resolve(self.test_method.setup_func, logger)
-        result = run_test_func(logger, ender, self.test_method.setup_func, *args, **kwargs)
+        with self.parameters_resolver.resolved(self.test_method.setup_func, logger, fixture_values=self.fixture_values) as (args, kwargs, ender):
+            result = run_test_func(logger, ender, self.parameters_resolver.time_limited(self.test_method.setup_func), *args, **kwargs)
         self.log_manager.on_setup_test_done(self.module_name, self.test_method.name, result.to_base())
         return result
 
     async def _intialize_args_and_setup_async(self) -> Result:
         logger = self.log_manager.get_setup_test_logger(self.module_name, self.test_method.name)
-        args, kwargs, ender = self.parameters_resolver.resolve(self.test_method.setup_func, logger)
-        result = await run_async_test_func(logger, ender, self.test_method.setup_func, *args, **kwargs)
+        with self.parameters_resolver.resolved(self.test_method.setup_func, logger, fixture_values=self.fixture_values) as (args, kwargs, ender):
+            result = await run_async_test_func(logger, ender, self.parameters_resolver.time_limited(self.test_method.setup_func), *args, **kwargs)
         self.log_manager.on_setup_test_done(self.module_name, self.test_method.name, result.to_base())
         return result
 
     def _intialize_args_and_teardown(self) -> Result:
         logger = self.log_manager.get_teardown_test_logger(self.module_name, self.test_method.name)
-        args, kwargs, ender = self.parameters_resolver.resolve(self.test_method.teardown_func, logger)
-        result = run_test_func(logger, ender, self.test_method.teardown_func, *args, **kwargs)
+        with self.parameters_resolver.resolved(self.test_method.teardown_func, logger, fixture_values=self.fixture_values) as (args, kwargs, ender):
+            result = run_test_func(logger, ender, self.parameters_resolver.time_limited(self.test_method.teardown_func), *args, **kwargs)
         self.log_manager.on_teardown_test_done(self.module_name, self.test_method.name, result.to_base())
         return result
 
     async def _intialize_args_and_teardown_async(self) -> Result:
         logger = self.log_manager.get_teardown_test_logger(self.module_name, self.test_method.name)
-        args, kwargs, ender = self.parameters_resolver.resolve(self.test_method.teardown_func, logger)
-        result = await run_async_test_func(logger, ender, self.test_method.teardown_func, *args, **kwargs)
+        with self.parameters_resolver.resolved(self.test_method.teardown_func, logger, fixture_values=self.fixture_values) as (args, kwargs, ender):
+            result = await run_async_test_func(logger, ender, self.parameters_resolver.time_limited(self.test_method.teardown_func), *args, **kwargs)
         self.log_manager.on_teardown_test_done(self.module_name, self.test_method.name, result.to_base())
         return result
 
     def _intialize_args_and_run(self) -> TestMethodResult:
         logger = self.log_manager.get_test_logger(self.module_name, self.test_method.name)
-        args, kwargs, ender = self.parameters_resolver.resolve(self.test_method.func, logger, self.test_method.parameterized_tuple)
-        result = run_test_func(logger, ender, self.test_method.func, *args, **kwargs)
+        with self.parameters_resolver.resolved(self.test_method.func, logger, self.test_method.parameterized_tuple, fixture_values=self.fixture_values) as (args, kwargs, ender):
+            result = run_test_func(logger, ender, self.parameters_resolver.time_limited(self.test_method.func), *args, **kwargs)
         result.metadata = self.test_method.metadata
+        result.key = self.key
         self.log_manager.on_test_done(self.module_name, result)
         return result
 
     async def _intialize_args_and_run_async(self) -> TestMethodResult:
         logger = self.log_manager.get_test_logger(self.module_name, self.test_method.name)
-        args, kwargs, ender = self.parameters_resolver.resolve(self.test_method.func, logger, self.test_method.parameterized_tuple)
-        result = await run_async_test_func(logger, ender, self.test_method.func, *args, **kwargs)
+        with self.parameters_resolver.resolved(self.test_method.func, logger, self.test_method.parameterized_tuple, fixture_values=self.fixture_values) as (args, kwargs, ender):
+            result = await run_async_test_func(logger, ender, self.parameters_resolver.time_limited(self.test_method.func), *args, **kwargs)
         result.metadata = self.test_method.metadata
+        result.key = self.key
         self.log_manager.on_test_done(self.module_name, result)
         return result
 
@@ -519,12 +1237,49 @@ class TestStepsRun:
             return return_value
 
 
+def with_timeout(func: Callable, timeout: float) -> Callable:
+    """
+    Coroutine functions are cancelled with asyncio.wait_for. Other functions run on their own daemon
+    thread which is abandoned if it is still running after timeout so a hung test does not hold on
+    to a pool worker
+    """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            try:
+                return await asyncio.wait_for(func(*args, **kwargs), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f'{func.__name__} timed out after {timeout}s') from None
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        outcome = {}
+
+        def target():
+            try:
+                outcome['return'] = func(*args, **kwargs)
+            except BaseException as e:
+                outcome['error'] = e
+
+        thread = threading.Thread(target=target, name=f'end2-timeout-{func.__name__}', daemon=True)
+        thread.start()
+        thread.join(timeout)
+        if thread.is_alive():
+            raise TimeoutError(f'{func.__name__} timed out after {timeout}s')
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome.get('return')
+    return wrapper
+
+
 def run_test_func(logger: Logger, ender: Ender, func: Callable, *args, **kwargs) -> TestMethodResult:
     result = TestMethodResult(func.__name__, status=Status.FAILED)
     steps = TestStepsRun(logger)
     if kwargs.get(ReservedWords.STEP.value):
         kwargs[ReservedWords.STEP.value] = steps.step
     try:
+        raise_failed_fixtures(kwargs)
         func(*args, **kwargs)
         if ender:
             ender.wait()
@@ -558,9 +1313,10 @@ async def run_async_test_func(logger: Logger, ender: Ender, func: Callable, *arg
     if kwargs.get(ReservedWords.STEP.value):
         kwargs[ReservedWords.STEP.value] = steps.step_async
     try:
+        raise_failed_fixtures(kwargs)
         await func(*args, **kwargs)
         if ender:
-            ender.wait()
+            await ender.wait_async()
         result.status = Status.PASSED
         result.steps = steps.steps
     except AssertionError as ae:
@@ -0,0 +1,209 @@
+from collections import Counter
+import json
+import os
+from typing import (
+    Dict,
+    List,
+    Tuple
+)
+
+from end2.constants import Status
+from end2.models.result import TestSuiteResult
+from end2.models.testing_containers import (
+    TestGroups,
+    TestModule,
+    TestPackage,
+    TestPackageTree
+)
+from end2.resource_profile import RunHistory
+
+
+# Used for modules and tests that have no history
+DEFAULT_TEST_SECONDS = 1.0
+
+
+class ShardUnit:
+    """
+    A piece of work that can only run on 1 shard: a whole module or 1 test of a big parallel module
+    """
+    def __init__(self, module: TestModule, seconds: float, group: TestGroups = None, test_key: str = None) -> None:
+        self.module = module
+        self.seconds = seconds
+        self.group = group
+        self.test_key = test_key
+        self.name = module.name if test_key is None else f'{module.name}::{group.name}::{test_key}'
+
+
+class Shard:
+    def __init__(self, index: int, count: int, units: List[ShardUnit], total_units: List[str], seconds: float) -> None:
+        self.index = index
+        self.count = count
+        self.units = units
+        self.total_units = total_units
+        self.seconds = seconds
+
+    @property
+    def unit_names(self) -> List[str]:
+        return [unit.name for unit in self.units]
+
+
+def _walk_groups(group: TestGroups):
+    yield group
+    for child in group.children:
+        yield from _walk_groups(child)
+
+
+def _walk_modules(package: TestPackage):
+    yield from package.sequential_modules
+    yield from package.parallel_modules
+    for sub_package in package.sub_packages:
+        yield from _walk_modules(sub_package)
+
+
+def _test_seconds(module: TestModule, test_name: str, history: RunHistory, test_count: int) -> float:
+    seconds = history.test_seconds(module.name, test_name)
+    if seconds is None:
+        module_seconds = history.module_seconds(module.name)
+        seconds = module_seconds / test_count if module_seconds is not None else DEFAULT_TEST_SECONDS
+    return seconds
+
+
+def create_units(modules: List[TestModule], shard_count: int, history: RunHistory) -> List[ShardUnit]:
+    module_units = []
+    for module in modules:
+        tests = [(group, key, test) for group in _walk_groups(module.groups) for key, test in group.tests.items()]
+        test_units = [
+            ShardUnit(module, _test_seconds(module, test.name, history, len(tests)), group, key)
+            for group, key, test in tests
+        ]
+        module_seconds = history.module_seconds(module.name)
+        if module_seconds is None:
+            module_seconds = sum(unit.seconds for unit in test_units)
+        module_units.append((ShardUnit(module, module_seconds), test_units))
+    target_seconds = sum(unit.seconds for unit, _ in module_units) / shard_count
+    units = []
+    for module_unit, test_units in module_units:
+        # Sequential modules are always kept whole; a parallel module is only split
+        # when it alone is bigger than what a shard should get
+        if module_unit.module.is_parallel and len(test_units) > 1 and module_unit.seconds > target_seconds:
+            units.extend(test_units)
+        else:
+            units.append(module_unit)
+    return units
+
+
+def assign_units(units: List[ShardUnit], shard_count: int) -> Tuple[List[List[ShardUnit]], List[float]]:
+    # Longest processing time first; sorting by name as well so every node comes up with the same shards
+    shards = [[] for _ in range(shard_count)]
+    loads = [0.0] * shard_count
+    for unit in sorted(units, key=lambda x: (-x.seconds, x.name)):
+        index = min(range(shard_count), key=lambda i: (loads[i], i))
+        shards[index].append(unit)
+        loads[index] += unit.seconds
+    return shards, loads
+
+
+def load_shard_history(path: str = None) -> RunHistory:
+    """
+    Every node has to balance by the same durations to come up with the same shards. Each node's
+    own history only gets the durations of the shard it ran so without a shared file no durations
+    are used and shards only depend on the tests there are
+    """
+    if not path:
+        return RunHistory(None)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+    return RunHistory.load(path)
+
+
+def shard_package_tree(package_tree: TestPackageTree, shard_index: int, shard_count: int, history: RunHistory) -> Shard:
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError(f'--shard-index must be from 0 to {shard_count - 1} and --shard-count must be at least 1')
+    modules = sorted((module for package in package_tree.packages for module in _walk_modules(package)), key=lambda x: x.name)
+    units = create_units(modules, shard_count, history)
+    shards, loads = assign_units(units, shard_count)
+    shard = Shard(shard_index, shard_count, shards[shard_index], sorted(unit.name for unit in units), loads[shard_index])
+    _filter_package_tree(package_tree, shard)
+    return shard
+
+
+def _filter_package_tree(package_tree: TestPackageTree, shard: Shard) -> None:
+    whole_modules = {unit.module.name for unit in shard.units if unit.test_key is None}
+    kept_tests: Dict[str, set] = {}
+    for unit in shard.units:
+        if unit.test_key is not None:
+            kept_tests.setdefault(unit.module.name, set()).add((id(unit.group), unit.test_key))
+
+    def keep_module(module: TestModule) -> bool:
+        if module.name in whole_modules:
+            return True
+        if module.name in kept_tests:
+            for group in _walk_groups(module.groups):
+                group.tests = {k: v for k, v in group.tests.items() if (id(group), k) in kept_tests[module.name]}
+            return True
+        return False
+
+    def filter_package(package: TestPackage) -> bool:
+        package.sequential_modules = {x for x in package.sequential_modules if keep_module(x)}
+        package.parallel_modules = {x for x in package.parallel_modules if keep_module(x)}
+        package.sub_packages = [x for x in package.sub_packages if filter_package(x)]
+        return bool(package.sequential_modules or package.parallel_modules or package.sub_packages)
+
+    package_tree.packages = [x for x in package_tree.packages if filter_package(x)]
+
+
+def write_shard_report(folder: str, shard: Shard, results: TestSuiteResult) -> str:
+    path = os.path.join(folder, f'shard_{shard.index}_of_{shard.count}.json')
+    report = {
+        'shard_index': shard.index,
+        'shard_count': shard.count,
+        'estimated_seconds': shard.seconds,
+        'units': shard.unit_names,
+        'all_units': shard.total_units,
+        'status': results.status.value if results.status else None,
+        'duration': results.total_seconds,
+        'modules': [
+            {
+                'name': module.name,
+                'file_name': module.file_name,
+                'status': module.status.value if module.status else None,
+                'duration': module.total_seconds,
+                'tests': [
+                    {'name': test.name, 'status': test.status.value if test.status else None,
+                     'duration': test.total_seconds, 'record': test.record}
+                    for test in module
+                ]
+            }
+            for module in results
+        ]
+    }
+    with open(path, 'w') as report_file:
+        json.dump(report, report_file, indent=1)
+    return path
+
+
+def combine_shard_reports(paths: List[str]) -> dict:
+    """
+    Combines the reports of every shard of a run; missing or doubled shards are reported in 'missing_units'
+    """
+    reports = []
+    for path in paths:
+        with open(path) as report_file:
+            reports.append(json.load(report_file))
+    ran_units = Counter(unit for report in reports for unit in report['units'])
+    all_units = set(unit for report in reports for unit in report['all_units'])
+    modules = [module for report in reports for module in report['modules']]
+    tests = [test for module in modules for test in module['tests']]
+    counts = {status.value: 0 for status in (Status.PASSED, Status.FAILED, Status.SKIPPED)}
+    for test in tests:
+        if test['status'] in counts:
+            counts[test['status']] += 1
+    passed = counts[Status.PASSED.value] > 0 and counts[Status.FAILED.value] == 0 and counts[Status.SKIPPED.value] == 0
+    return {
+        'shard_indexes': sorted(report['shard_index'] for report in reports),
+        'missing_units': sorted(all_units - set(ran_units)),
+        'duplicated_units': sorted(unit for unit, count in ran_units.items() if count > 1),
+        'status': Status.PASSED.value if passed else Status.FAILED.value,
+        'counts': counts,
+        'modules': modules
+    }
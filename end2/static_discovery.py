@@ -0,0 +1,273 @@
+"""
+    Static discovery: reads what discovery needs (test names, groups, __run_mode__, __tags__,
+    __resources__ and @metadata) out of a test module's source with ast instead of importing it.
+    Anything that can only be known by running the module makes parse_test_module return None
+    so the module is imported like it normally is. DiscoveryIndex keeps what was read on disk so
+    files that didn't change aren't read again
+"""
+import ast
+import hashlib
+import json
+import os
+from typing import (
+    Dict,
+    List,
+    Optional
+)
+
+from end2.constants import (
+    RESOURCES,
+    RunMode,
+    TAGS
+)
+
+
+RUN_MODE = '__run_mode__'
+# Decorators whose effect on which tests a module has can be read from the source
+_TEST_DECORATORS = {'metadata', 'on_test_failure', 'parameterize', 'staticmethod'}
+_FIXTURE_DECORATORS = {
+    'setup', 'setup_test', 'teardown', 'teardown_test', 'setup_module', 'teardown_module',
+    'on_failures_in_module', 'package_test_parameters', 'fixture'
+}
+_DYNAMIC_CALLS = {'exec', 'globals', 'locals', 'setattr', 'vars'}
+
+
+class DynamicModuleException(Exception):
+    pass
+
+
+class StaticTest:
+    def __init__(self, name: str, description: str = None, metadata: dict = None
+                 , parameterized_count: int = None) -> None:
+        self.name = name
+        self.description = description
+        self.metadata = metadata
+        # Number of cases of a test using @parameterize with a list or tuple
+        self.parameterized_count = parameterized_count
+
+    def to_dict(self) -> dict:
+        # repr so literals JSON doesn't have (tuples, sets) come back the same
+        return {
+            'name': self.name,
+            'description': self.description,
+            'metadata': None if self.metadata is None else repr(self.metadata),
+            'parameterized_count': self.parameterized_count
+        }
+
+    @classmethod
+    def from_dict(cls, dict_: dict) -> 'StaticTest':
+        metadata = None if dict_['metadata'] is None else ast.literal_eval(dict_['metadata'])
+        return cls(dict_['name'], dict_['description'], metadata, dict_['parameterized_count'])
+
+
+class StaticGroup:
+    def __init__(self, name: str, tests: List[StaticTest], children: List['StaticGroup']) -> None:
+        self.name = name
+        self.tests = tests
+        self.children = children
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'tests': [x.to_dict() for x in self.tests],
+            'children': [x.to_dict() for x in self.children]
+        }
+
+    @classmethod
+    def from_dict(cls, dict_: dict) -> 'StaticGroup':
+        return cls(dict_['name'], [StaticTest.from_dict(x) for x in dict_['tests']]
+                   , [cls.from_dict(x) for x in dict_['children']])
+
+
+class StaticModule:
+    def __init__(self, run_mode: RunMode, description: str, groups: StaticGroup, tags: list = None
+                 , resources: list = None) -> None:
+        self.run_mode = run_mode
+        self.description = description
+        self.groups = groups
+        self.tags = tags
+        self.resources = resources
+
+    def to_dict(self) -> dict:
+        return {
+            'run_mode': self.run_mode.value,
+            'description': self.description,
+            'groups': self.groups.to_dict(),
+            'tags': None if self.tags is None else repr(self.tags),
+            'resources': None if self.resources is None else repr(self.resources)
+        }
+
+    @classmethod
+    def from_dict(cls, dict_: dict) -> 'StaticModule':
+        tags = None if dict_['tags'] is None else ast.literal_eval(dict_['tags'])
+        resources = None if dict_['resources'] is None else ast.literal_eval(dict_['resources'])
+        return cls(RunMode(dict_['run_mode']), dict_['description'], StaticGroup.from_dict(dict_['groups']), tags, resources)
+
+
+class DiscoveryIndex:
+    """
+    What parse_test_module read out of each file by path. An entry is used as long as the file
+    has the same size and modification time or, when those changed, the same content hash
+    """
+    VERSION = 1
+
+    def __init__(self, path: str = None) -> None:
+        self.path = path
+        self.files: Dict[str, dict] = {}
+        self.changed = False
+
+    @classmethod
+    def load(cls, path: str) -> 'DiscoveryIndex':
+        index = cls(path)
+        try:
+            with open(path) as index_file:
+                dict_ = json.load(index_file)
+            if dict_.get('version') == cls.VERSION:
+                index.files = dict_.get('files', {})
+        except (OSError, ValueError, AttributeError):
+            # A missing or corrupted index just means every file is read again
+            index.files = {}
+        return index
+
+    def save(self) -> None:
+        if not self.changed or not self.path:
+            return
+        files = {k: v for k, v in self.files.items() if os.path.isfile(k)}
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'w') as index_file:
+            json.dump({'version': self.VERSION, 'files': files}, index_file)
+        self.changed = False
+
+    def parse_test_module(self, file_path: str, module_name: str) -> Optional[StaticModule]:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        entry = self.files.get(file_path)
+        if entry is None or (entry['size'], entry['mtime']) != (stat.st_size, stat.st_mtime_ns):
+            with open(file_path, 'rb') as f:
+                source = f.read()
+            hash_ = hashlib.sha256(source).hexdigest()
+            if entry is None or entry['hash'] != hash_:
+                static_module = _parse_source(source, file_path, module_name)
+                entry = {'hash': hash_, 'module': None if static_module is None else static_module.to_dict()}
+            entry.update(size=stat.st_size, mtime=stat.st_mtime_ns)
+            self.files[file_path] = entry
+            self.changed = True
+        # None is kept too so modules that have to be imported aren't read again either
+        return None if entry['module'] is None else StaticModule.from_dict(entry['module'])
+
+
+def parse_test_module(file_path: str, module_name: str) -> Optional[StaticModule]:
+    try:
+        with open(file_path, 'rb') as f:
+            source = f.read()
+    except OSError:
+        return None
+    return _parse_source(source, file_path, module_name)
+
+
+def _parse_source(source: bytes, file_path: str, module_name: str) -> Optional[StaticModule]:
+    try:
+        return _parse_module(ast.parse(source, file_path), module_name)
+    except (DynamicModuleException, SyntaxError, TypeError, ValueError):
+        return None
+
+
+def _parse_module(tree: ast.Module, module_name: str) -> StaticModule:
+    values = {}
+    for node in tree.body:
+        for name in _check_statement(node):
+            if name in (RUN_MODE, TAGS, RESOURCES):
+                values[name] = node.value
+    if RUN_MODE not in values:
+        # Importing reports a missing __run_mode__ the usual way
+        raise DynamicModuleException(module_name)
+    tags = ast.literal_eval(values[TAGS]) if TAGS in values else None
+    resources = ast.literal_eval(values[RESOURCES]) if RESOURCES in values else None
+    return StaticModule(_parse_run_mode(values[RUN_MODE]), ast.get_docstring(tree, clean=False)
+                        , _parse_group(tree.body, module_name), tags, resources)
+
+
+def _check_statement(node: ast.stmt) -> List[str]:
+    """
+    Raises DynamicModuleException if the statement could add, remove or rename tests or groups
+    and returns the names it assigns
+    """
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        # Tests and groups defined here are read by _parse_group
+        names = [node.name] if node.name == '__getattr__' else []
+    elif isinstance(node, (ast.Import, ast.ImportFrom)):
+        names = [x.asname or x.name.split('.')[0] for x in node.names]
+    else:
+        names = [x.id for x in ast.walk(node) if isinstance(x, ast.Name) and isinstance(x.ctx, (ast.Store, ast.Del))]
+        for child in ast.walk(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                # Defined depending on something only known at import (if, for, try, with)
+                names.append(child.name)
+            elif isinstance(child, ast.Call) and getattr(child.func, 'id', None) in _DYNAMIC_CALLS:
+                raise DynamicModuleException(child.func.id)
+    for name in names:
+        if name.startswith(('test_', 'Group')) or name == '__getattr__' or name == '*':
+            raise DynamicModuleException(name)
+    return names if isinstance(node, (ast.Assign, ast.AnnAssign)) else []
+
+
+def _parse_run_mode(node: ast.expr) -> RunMode:
+    # RunMode.PARALLEL, end2.RunMode.PARALLEL or PARALLEL from `from end2 import PARALLEL`
+    name = node.attr if isinstance(node, ast.Attribute) else getattr(node, 'id', None)
+    if name not in RunMode.__members__:
+        raise DynamicModuleException(name)
+    return RunMode[name]
+
+
+def _parse_group(body: List[ast.stmt], name: str) -> StaticGroup:
+    tests: Dict[str, StaticTest] = {}
+    children: Dict[str, StaticGroup] = {}
+    for node in body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            # Redefining a name replaces the earlier 1 just like it does at import
+            tests.pop(node.name, None)
+            children.pop(node.name, None)
+            test = _parse_func(node)
+            if test is not None:
+                tests[node.name] = test
+        elif isinstance(node, ast.ClassDef) and node.name.startswith('Group'):
+            if node.bases or node.keywords or node.decorator_list:
+                raise DynamicModuleException(node.name)
+            tests.pop(node.name, None)
+            children[node.name] = _parse_group(node.body, node.name)
+        else:
+            _check_statement(node)
+    return StaticGroup(name, list(tests.values()), list(children.values()))
+
+
+def _parse_func(node: ast.FunctionDef) -> Optional[StaticTest]:
+    metadata = parameterized_count = None
+    is_fixture = False
+    for decorator in node.decorator_list:
+        func = decorator.func if isinstance(decorator, ast.Call) else decorator
+        name = func.attr if isinstance(func, ast.Attribute) else getattr(func, 'id', None)
+        if name in _FIXTURE_DECORATORS:
+            is_fixture |= name == 'fixture'
+        elif name not in _TEST_DECORATORS:
+            # Decorators end2 doesn't know can change the test
+            raise DynamicModuleException(node.name)
+        elif name == 'metadata':
+            if not isinstance(decorator, ast.Call) or decorator.args or any(x.arg is None for x in decorator.keywords):
+                raise DynamicModuleException(node.name)
+            metadata = {x.arg: ast.literal_eval(x.value) for x in decorator.keywords}
+        elif name == 'parameterize':
+            parameterized_count = _parse_parameterized_count(decorator)
+    if is_fixture or not node.name.startswith('test_'):
+        return None
+    return StaticTest(node.name, ast.get_docstring(node, clean=False), metadata, parameterized_count)
+
+
+def _parse_parameterized_count(decorator: ast.expr) -> int:
+    # Only a list or tuple written out in place has a known length; the cases don't have to be literals
+    if not isinstance(decorator, ast.Call) or not decorator.args \
+            or not isinstance(decorator.args[0], (ast.List, ast.Tuple)) \
+            or any(isinstance(x, ast.Starred) for x in decorator.args[0].elts):
+        raise DynamicModuleException('parameterize')
+    return len(decorator.args[0].elts)
@@ -1,4 +1,7 @@
 import os
+import socket
+import subprocess
+import sys
 from time import sleep
 import unittest
 
@@ -41,6 +44,45 @@ class TestStartRun(unittest.TestCase):
                             and result.duration is not None
                             for result in results))
 
+    @unittest.skipUnless(runner.can_fork(), 'fork is required for the process executor')
+    def test_integration_process_executor(self):
+        arg_list=['--suite', os.path.join('examples', 'simple', 'smoke'), '--executor', 'process']
+        args = arg_parser.default_parser().parse_args(arg_list)
+
+        def test_parameters(logger_, package_object):
+            return (logger_,), {}
+
+        results, _ = runner.start_test_run(args, test_parameters)
+        self.assertGreater(len(results.test_modules), 0)
+        self.assertTrue(all(result.status is not None
+                            and result.end_time is not None
+                            and result.total_count > 0
+                            for result in results))
+
+    def test_integration_coordinator_and_workers(self):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            address = f'127.0.0.1:{s.getsockname()[1]}'
+        suite = os.path.join('examples', 'simple', 'smoke')
+        workers = [
+            subprocess.Popen([sys.executable, '-m', 'examples.simple.run', '--suite', suite, '--worker', address],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            for _ in range(2)
+        ]
+        try:
+            args = arg_parser.default_parser().parse_args(['--suite', suite, '--coordinator', address])
+
+            def test_parameters(logger_, package_object):
+                return (logger_,), {}
+
+            results, _ = runner.start_test_run(args, test_parameters)
+        finally:
+            for worker in workers:
+                worker.wait(timeout=60)
+        self.assertEqual(sorted(x.name for x in results),
+                         ['examples.simple.smoke.ignored_module', 'examples.simple.smoke.sample1', 'examples.simple.smoke.sample2'])
+        self.assertTrue(all(result.total_count > 0 for result in results))
+
     def test_integration_package_object(self):
         arg_list=['--suite', os.path.join('examples', 'package_objects', 'package1')]
         args = arg_parser.default_parser().parse_args(arg_list)
@@ -53,6 +95,7 @@ class TestStartRun(unittest.TestCase):
                             and result.end_time is not None
                             and result.duration is not None
                             for result in results))
+        self.assertTrue(all(result.status is Status.PASSED for result in results))
 
     def test_integration_end(self):
         timeout = 2.0
@@ -0,0 +1,62 @@
+from datetime import timedelta
+import unittest
+
+from end2.concurrency import AdaptiveConcurrency
+from end2.constants import Status
+from end2.logger import empty_logger
+from end2.models.result import TestMethodResult
+
+
+def create_result(status: Status = Status.PASSED, name: str = 'test_1') -> TestMethodResult:
+    return TestMethodResult(name, status=status).end()
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    def _finish(self, controller: AdaptiveConcurrency, result: TestMethodResult) -> None:
+        self.assertTrue(controller.try_acquire())
+        controller.release('module', result)
+
+    def test_starts_at_min_and_caps_in_flight(self):
+        controller = AdaptiveConcurrency(2, 10, empty_logger)
+        self.assertTrue(controller.try_acquire())
+        self.assertTrue(controller.try_acquire())
+        self.assertFalse(controller.try_acquire())
+
+    def test_grows_additively_to_max(self):
+        controller = AdaptiveConcurrency(1, 3, empty_logger)
+        # 1 round of healthy tests at each limit grows it by 1
+        for expected in (2, 3):
+            for _ in range(controller.current_limit):
+                self._finish(controller, create_result())
+            self.assertEqual(controller.current_limit, expected)
+        for _ in range(10):
+            self._finish(controller, create_result())
+        self.assertEqual(controller.current_limit, 3)
+        self.assertEqual([limit for _, limit in controller.history], [1, 2, 3])
+
+    def test_halves_when_too_many_unhealthy(self):
+        controller = AdaptiveConcurrency(2, 16, empty_logger, window=4, unhealthy_ratio=0.5)
+        controller.limit = 16.0
+        for status in (Status.PASSED, Status.FAILED, Status.PASSED, Status.FAILED):
+            self._finish(controller, create_result(status))
+        self.assertEqual(controller.current_limit, 8)
+        for _ in range(8):
+            self._finish(controller, create_result(Status.FAILED))
+        self.assertEqual(controller.current_limit, 2)
+
+    def test_slow_tests_are_unhealthy(self):
+        expected = {'test_1': 0.5, 'test_2': 5.0}
+        controller = AdaptiveConcurrency(1, 4, empty_logger, expected_seconds=lambda module, test: expected.get(test))
+        result = create_result()
+        result.duration = timedelta(seconds=2)
+        self.assertTrue(controller._is_unhealthy('module', result))
+        result.name = 'test_2'
+        self.assertFalse(controller._is_unhealthy('module', result))
+        result.name = 'test_without_history'
+        self.assertFalse(controller._is_unhealthy('module', result))
+
+    def test_skipped_tests_do_not_change_limit(self):
+        controller = AdaptiveConcurrency(1, 4, empty_logger)
+        for _ in range(5):
+            self._finish(controller, create_result(Status.SKIPPED))
+        self.assertEqual(controller.current_limit, 1)
@@ -1,11 +1,26 @@
 import os
+import sys
+import types
 import unittest
 
 from end2.pattern_matchers import (
     DefaultModulePatternMatcher,
     DefaultTestCasePatternMatcher
 )
-from end2.models.testing_containers import TestPackage
+from end2.constants import RunMode
+from end2.exceptions import TestCodeException
+from end2.fixtures import (
+    fixture,
+    setup,
+    setup_test,
+    teardown,
+    teardown_test
+)
+from end2.models.testing_containers import (
+    TestModule,
+    TestPackage,
+    get_reserved_words
+)
 from end2 import discovery
 
 from examples.simple.smoke import sample1
@@ -27,6 +42,122 @@ class TestDiscoverModule(unittest.TestCase):
         self.assertNotEqual(error_str, '')
 
 
+class TestDiscoverModuleStatically(unittest.TestCase):
+    def test_module_imported_when_loaded(self):
+        module_matcher = DefaultModulePatternMatcher([], '', True)
+        test_matcher = DefaultTestCasePatternMatcher(['test_3'], '', False)
+        sys.modules.pop('examples.simple.regression.sample3', None)
+        module, error_str = discovery.discover_module_statically(
+            os.path.join('examples', 'simple', 'regression', 'sample3.py'), module_matcher, test_matcher)
+        self.assertEqual(error_str, '')
+        self.assertNotIn('examples.simple.regression.sample3', sys.modules)
+        group3 = next(x for x in module.groups.children[0].children if x.name == 'Group3')
+        self.assertEqual(list(group3.tests), ['test_33'])
+        module.load()
+        self.assertIs(module.module, sys.modules['examples.simple.regression.sample3'])
+        self.assertIs(group3.tests['test_33'].func, module.module.Group1.Group3.test_33)
+        self.assertIs(group3.setup_func, module.module.Group1.Group3.my_setup)
+        self.assertEqual(list(group3.tests), ['test_33'])
+
+    def test_same_tests_as_importing(self):
+        module_matcher = DefaultModulePatternMatcher([], '', True)
+        test_matcher = DefaultTestCasePatternMatcher([], '', True)
+        importable = os.path.join('examples', 'simple', 'regression', 'sample4.py')
+        static_module, _ = discovery.discover_module_statically(importable, module_matcher, test_matcher)
+        module, _ = discovery.discover_module(importable, module_matcher, test_matcher)
+        self.assertIsNotNone(static_module.loader)
+        self.assertEqual(sorted(static_module.groups.tests), sorted(module.groups.tests))
+
+
+class TestReservedWords(unittest.TestCase):
+    def test_reserved_words_found_once(self):
+        def test_(*, logger, end):
+            pass
+        self.assertEqual(get_reserved_words(test_), {'logger', 'end'})
+        self.assertIs(get_reserved_words(test_), get_reserved_words(test_))
+
+    @staticmethod
+    def _create_test_module(**attributes) -> TestModule:
+        module = types.ModuleType('fake_reserved_words')
+        module.__file__ = __file__
+        module.__run_mode__ = RunMode.SEQUENTIAL
+        for k, v in attributes.items():
+            setattr(module, k, v)
+        return TestModule(module, discovery.discover_groups(module, DefaultTestCasePatternMatcher([], '', True)))
+
+    def test_typo_fails_at_discovery(self):
+        def test_1(*, loger):
+            pass
+        self.assertRaises(TestCodeException, self._create_test_module, test_1=test_1)
+
+    def test_typo_in_fixture_fails_at_discovery(self):
+        def test_1():
+            pass
+
+        @setup_test
+        def setup_test_(*, ender):
+            pass
+        self.assertRaises(TestCodeException, self._create_test_module, test_1=test_1, setup_test_=setup_test_)
+
+    def test_fixture_names_are_not_typos(self):
+        @fixture(scope='module')
+        def test_tenant():
+            pass
+
+        def test_1(*, test_tenant):
+            pass
+        test_module = self._create_test_module(test_1=test_1, test_tenant=test_tenant)
+        self.assertEqual(list(test_module.groups.tests), ['test_1'])
+        self.assertEqual(list(test_module.groups.fixtures), ['test_tenant'])
+
+    def test_group_fixtures_only_seen_in_group(self):
+        class Group1:
+            @fixture()
+            def tenant():
+                pass
+
+        def test_1(*, tenant):
+            pass
+        self.assertRaises(TestCodeException, self._create_test_module, test_1=test_1, Group1=Group1)
+
+
+class TestDiscoverGroups(unittest.TestCase):
+    def test_setup_and_teardown(self):
+        @setup
+        def my_setup():
+            pass
+
+        @setup_test
+        def my_setup_test():
+            pass
+
+        @teardown
+        def my_teardown():
+            pass
+
+        @teardown_test
+        def my_teardown_test():
+            pass
+
+        class Group1:
+            group_setup = staticmethod(setup(lambda: None))
+            group_teardown = staticmethod(teardown(lambda: None))
+
+            @staticmethod
+            def test_1():
+                pass
+        module = types.ModuleType('fake_group_fixtures')
+        module.__dict__.update(
+            my_setup=my_setup, my_setup_test=my_setup_test, my_teardown=my_teardown,
+            my_teardown_test=my_teardown_test, Group1=Group1
+        )
+        group = discovery.discover_groups(module, DefaultTestCasePatternMatcher([], '', True))
+        self.assertIs(group.setup_func, my_setup)
+        self.assertIs(group.teardown_func, my_teardown)
+        self.assertIs(group.children[0].setup_func, Group1.group_setup)
+        self.assertIs(group.children[0].teardown_func, Group1.group_teardown)
+
+
 class TestDiscoverTests(unittest.TestCase):
     def test_discovered(self):
         matcher = DefaultTestCasePatternMatcher([], '', True)
@@ -73,3 +204,23 @@ class TestDiscoverParameterizedTestRange(unittest.TestCase):
 
     def test_brackets_in_wrong_order(self):
         self.assertEqual(discovery.discover_parameterized_test_range('test_1][', self.x), range(0, 0))
+
+
+class TestDiscoverParameterizedTestSlice(unittest.TestCase):
+    def test_no_selection_defaults_to_all(self):
+        self.assertEqual(discovery.discover_parameterized_test_slice('test_1'), slice(None))
+
+    def test_single_element(self):
+        self.assertEqual(discovery.discover_parameterized_test_slice('test_1[2]'), slice(2, 3))
+
+    def test_start_stop_step(self):
+        self.assertEqual(discovery.discover_parameterized_test_slice('test_1[2:6:2]'), slice(2, 6, 2))
+        self.assertEqual(discovery.discover_parameterized_test_slice('test_1[:6]'), slice(None, 6))
+
+    def test_from_the_end_selects_nothing(self):
+        self.assertEqual(discovery.discover_parameterized_test_slice('test_1[-1:]'), slice(0))
+
+    def test_invalid_selection_selects_nothing(self):
+        for name in ('test_1[]', 'test_1[', 'test_1[a]', 'test_1[::0]', 'test_1[1:2:3:4]'):
+            self.assertEqual(discovery.discover_parameterized_test_slice(name), slice(0), name)
+
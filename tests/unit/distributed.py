@@ -0,0 +1,88 @@
+import logging
+import os
+import types
+import unittest
+
+from end2 import distributed
+from end2.constants import (
+    RunMode,
+    Status
+)
+from end2.exceptions import StopTestRunException
+from end2.models.result import (
+    TestMethodResult,
+    TestModuleResult
+)
+from end2.models.testing_containers import (
+    TestGroups,
+    TestModule,
+    TestPackage,
+    TestPackageTree
+)
+
+
+class TestParseAddress(unittest.TestCase):
+    def test_tcp_address(self):
+        self.assertEqual(distributed.parse_address('127.0.0.1:8765'), ('127.0.0.1', 8765))
+
+    def test_unix_socket_path(self):
+        self.assertEqual(distributed.parse_address('/tmp/end2.sock'), '/tmp/end2.sock')
+
+    def test_no_port_is_a_path(self):
+        self.assertEqual(distributed.parse_address('localhost:'), 'localhost:')
+
+
+class TestGetAuthkey(unittest.TestCase):
+    def tearDown(self) -> None:
+        os.environ.pop(distributed.AUTHKEY_ENV, None)
+        return super().tearDown()
+
+    def test_default(self):
+        os.environ.pop(distributed.AUTHKEY_ENV, None)
+        self.assertTrue(distributed.get_authkey())
+        self.assertTrue(distributed.get_authkey(('127.0.0.1', 8765)))
+        self.assertTrue(distributed.get_authkey('/tmp/end2.sock'))
+
+    def test_required_when_not_local(self):
+        os.environ.pop(distributed.AUTHKEY_ENV, None)
+        with self.assertRaises(StopTestRunException):
+            distributed.get_authkey(('10.0.0.5', 8765))
+        os.environ[distributed.AUTHKEY_ENV] = 'secret'
+        self.assertEqual(distributed.get_authkey(('10.0.0.5', 8765)), b'secret')
+
+    def test_from_environment(self):
+        os.environ[distributed.AUTHKEY_ENV] = 'secret'
+        self.assertEqual(distributed.get_authkey(), b'secret')
+
+
+class TestCoordinator(unittest.TestCase):
+    @staticmethod
+    def create_test_module(name: str) -> TestModule:
+        module = types.ModuleType(name)
+        module.__file__ = __file__
+        module.__run_mode__ = RunMode.PARALLEL
+        return TestModule(module, TestGroups(name, {}))
+
+    def create_coordinator(self, module_count: int) -> distributed.Coordinator:
+        package = TestPackage(types.ModuleType('fake_package'))
+        for i in range(module_count):
+            package.append_module(self.create_test_module(f'fake_module_{i}'))
+        test_packages = TestPackageTree()
+        test_packages.packages.append(package)
+        suite_run = types.SimpleNamespace(test_packages=test_packages, order=None, run_history=None
+                                          , logger=logging.getLogger('unit_coordinator'), parsed_args=types.SimpleNamespace(stop_on_fail=True))
+        return distributed.Coordinator(suite_run, '/tmp/end2_unit.sock')
+
+    def finish_job(self, coordinator: distributed.Coordinator, *statuses: Status) -> None:
+        _, module_name = coordinator._next_job()
+        result = TestModuleResult(self.create_test_module(module_name)
+                                  , test_results=[TestMethodResult(f'test_{i}', status=x) for i, x in enumerate(statuses)])
+        coordinator._finish_job(module_name, result.end())
+
+    def test_stop_on_fail_ignores_skipped_tests(self):
+        coordinator = self.create_coordinator(3)
+        self.finish_job(coordinator, Status.PASSED, Status.SKIPPED)
+        self.assertEqual(len(coordinator.queue), 2)
+        self.finish_job(coordinator, Status.FAILED)
+        self.assertEqual(len(coordinator.queue), 0)
+        self.assertTrue(coordinator.done)
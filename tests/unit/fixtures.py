@@ -1,7 +1,14 @@
+import types
 import unittest
 
 import end2
-from end2.fixtures import package_test_parameters
+from end2.exceptions import MoreThan1SameFixtureException
+from end2.fixtures import (
+    empty_func,
+    get_namespace_contents,
+    iter_parameters,
+    package_test_parameters
+)
 
 
 class TestFixtures(unittest.TestCase):
@@ -32,6 +39,10 @@ class TestFixtures(unittest.TestCase):
     def parameterize_(self):
         pass
 
+    @end2.parameterize(lambda: (('a', i) for i in range(3)), first_arg_is_name=True)
+    def lazy_parameterize_(self):
+        pass
+
     @end2.on_failures_in_module
     def on_failures_in_module_(self):
         pass
@@ -65,6 +76,11 @@ class TestFixtures(unittest.TestCase):
         self.assertEqual(len(self.parameterize_.names), 2)
         self.assertEqual(len(self.parameterize_.parameterized_list), 2)
 
+    def test_lazy_parameterize(self):
+        self.assertFalse(hasattr(self.lazy_parameterize_, 'parameterized_list'))
+        self.assertEqual(list(iter_parameters(self.lazy_parameterize_)), [(0, (0,)), (1, (1,)), (2, (2,))])
+        self.assertEqual(list(iter_parameters(self.lazy_parameterize_, slice(1, None))), [(1, (1,)), (2, (2,))])
+
     def test_on_failures_in_module(self):
         self.assertTrue(hasattr(self.on_failures_in_module_, 'on_failures_in_module'))
 
@@ -77,3 +93,28 @@ class TestFixtures(unittest.TestCase):
 
     def test_on_test_failure(self):
         self.assertTrue(hasattr(self.package_test_parameters_, 'package_test_parameters'))
+
+
+class TestNamespaceContents(unittest.TestCase):
+    def test_sorted_out_in_1_pass(self):
+        module = types.ModuleType('fake_namespace')
+        module.test_1 = lambda logger: None
+        module.test_fixture = end2.fixture('module')(lambda logger: None)
+        module.my_setup = end2.setup(lambda logger: None)
+        module.helper = lambda: None
+        module.Group1 = type('Group1', (), {})
+        module.NotAGroup = type('NotAGroup', (), {})
+        contents = get_namespace_contents(module)
+        self.assertIs(get_namespace_contents(module), contents)
+        self.assertEqual(list(contents.tests), ['test_1'])
+        self.assertEqual(list(contents.scoped_fixtures), ['test_fixture'])
+        self.assertEqual(list(contents.groups), ['Group1'])
+        self.assertIs(contents.get_fixture('setup'), module.my_setup)
+        self.assertIs(contents.get_fixture('teardown'), empty_func)
+
+    def test_more_than_1_same_fixture(self):
+        module = types.ModuleType('fake_namespace')
+        module.setup_1 = end2.setup(lambda logger: None)
+        module.setup_2 = end2.setup(lambda logger: None)
+        with self.assertRaises(MoreThan1SameFixtureException):
+            get_namespace_contents(module).get_fixture('setup')
@@ -0,0 +1,72 @@
+import unittest
+
+from end2 import ordering
+from end2.constants import Order
+from end2.resource_profile import RunHistory
+
+
+class TestOrderLongestFirst(unittest.TestCase):
+    def test_longest_tier_first(self):
+        durations = {'a': 0.1, 'b': 30.0, 'c': 5.0, 'd': 600.0}
+        self.assertEqual(ordering.order_longest_first(list(durations), durations.get), ['d', 'b', 'c', 'a'])
+
+    def test_unknown_durations_go_first(self):
+        durations = {'a': 0.1, 'b': 30.0}
+        self.assertEqual(ordering.order_longest_first(['a', 'b', 'new'], durations.get), ['new', 'b', 'a'])
+
+    def test_same_tier_is_shuffled(self):
+        items = list(range(20))
+        orders = {tuple(ordering.order_longest_first(items, lambda _: 0.5)) for _ in range(10)}
+        self.assertGreater(len(orders), 1)
+        self.assertTrue(all(sorted(order) == items for order in orders))
+
+
+class TestOrderTests(unittest.TestCase):
+    class _Test:
+        def __init__(self, name: str) -> None:
+            self.name = name
+
+    def setUp(self) -> None:
+        self.history = RunHistory('unused')
+        self.history.modules = {'module': {'duration': 9.0, 'tests': {'test_1': 0.2, 'test_2': 8.0}}}
+        self.tests = {'test_1': self._Test('test_1'), 'test_2': self._Test('test_2')}
+        return super().setUp()
+
+    def test_longest_first(self):
+        ordered = ordering.order_tests('module', self.tests, Order.LONGEST_FIRST, self.history)
+        self.assertEqual(list(ordered), ['test_2', 'test_1'])
+
+    def test_fast_feedback_recently_failed_first(self):
+        self.history.modules['module']['failures'] = {'test_2': 1}
+        for _ in range(5):
+            ordered = ordering.order_tests('module', self.tests, Order.FAST_FEEDBACK, self.history)
+            self.assertEqual(list(ordered)[0], 'test_2')
+
+    def test_random_keeps_discovered_order(self):
+        ordered = ordering.order_tests('module', self.tests, Order.RANDOM, self.history)
+        self.assertEqual(list(ordered), ['test_1', 'test_2'])
+
+
+class TestOrderModulesFastFeedback(unittest.TestCase):
+    class _Module:
+        def __init__(self, name: str, last_modified: float) -> None:
+            self.name = name
+            self.last_modified = last_modified
+            self.is_parallel = True
+
+    def test_failed_then_modified_then_rest(self):
+        history = RunHistory('unused')
+        history.modules = {
+            'failed_long_ago': {'failures': {'test_1': 3}, 'last_modified': 1.0},
+            'failed_last_run': {'failures': {'test_1': 0}, 'last_modified': 1.0},
+            'unchanged': {'failures': {}, 'last_modified': 1.0},
+            'modified': {'failures': {}, 'last_modified': 1.0}
+        }
+        modules = [
+            self._Module('unchanged', 1.0), self._Module('new', 1.0), self._Module('modified', 2.0),
+            self._Module('failed_long_ago', 1.0), self._Module('failed_last_run', 1.0)
+        ]
+        ordered = [x.name for x in ordering.order_modules(modules, Order.FAST_FEEDBACK, history)]
+        self.assertEqual(ordered[:2], ['failed_last_run', 'failed_long_ago'])
+        self.assertEqual(sorted(ordered[2:4]), ['modified', 'new'])
+        self.assertEqual(ordered[4], 'unchanged')
@@ -1,6 +1,27 @@
+import os
+import re
+import tempfile
+import threading
+import types
 import unittest
+from unittest import mock
 
+from end2.pattern_matchers import (
+    GlobModulePatternMatcher,
+    RegexModulePatternMatcher,
+    TagModulePatternMatcher,
+    TagTestCasePatternMatcher
+)
+from end2.pattern_matchers import (
+    file_index,
+    glob_
+)
 from end2.pattern_matchers.default import PatternMatcherBase
+from end2.pattern_matchers.file_index import FileIndex
+from end2.pattern_matchers.tag import (
+    TagExpression,
+    TagIndex
+)
 
 
 class TestPatternMatcherBase(unittest.TestCase):
@@ -33,3 +54,127 @@ class TestPatternMatcherBase(unittest.TestCase):
         matcher_exclude = PatternMatcherBase(['a'], 'a', False)
         self.assertTrue(matcher_exclude.included('b'))
         self.assertFalse(matcher_exclude.excluded('b'))
+
+
+class TestFileIndex(unittest.TestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        cwd = os.getcwd()
+        os.chdir(folder.name)
+        self.addCleanup(os.chdir, cwd)
+        paths = [
+            os.path.join('suite', '__init__.py'), os.path.join('suite', 'test_a.py'), os.path.join('suite', 'deep', 'test_b.py'),
+            os.path.join('suite', 'build', 'test_c.py'), os.path.join('suite', 'test_d.log'), os.path.join('.hidden', 'test_e.py'),
+            os.path.join('node_modules', 'test_f.py'), os.path.join('venv', 'pyvenv.cfg'), os.path.join('venv', 'test_g.py'),
+            os.path.join('suite', '__pycache__', 'test_h.py')
+        ]
+        for path in paths:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'w').close()
+        with open('.gitignore', 'w') as f:
+            f.write('# comment\nbuild/\n*.log\n')
+
+    def test_ignored_paths_are_left_out(self):
+        self.assertEqual(FileIndex().files, [os.path.join('suite', '__init__.py'), os.path.join('suite', 'deep', 'test_b.py'),
+                                             os.path.join('suite', 'test_a.py')])
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), 'needs symlinks')
+    def test_links_to_folders_followed(self):
+        os.symlink(os.path.abspath(os.path.join('suite', 'deep')), os.path.join('suite', 'link'))
+        # A link back to a folder it is in is only listed, not scanned again
+        os.symlink(os.path.abspath('suite'), os.path.join('suite', 'deep', 'loop'))
+        self.assertEqual(FileIndex().files, [os.path.join('suite', '__init__.py'), os.path.join('suite', 'deep', 'test_b.py'),
+                                             os.path.join('suite', 'link', 'test_b.py'), os.path.join('suite', 'test_a.py')])
+
+    def test_forward_slashes_with_windows_separators(self):
+        with mock.patch.object(os, 'sep', '\\'), mock.patch.object(os, 'altsep', '/'), \
+                mock.patch.object(file_index, '_SEP', re.escape('\\')):
+            _, _, regex = glob_._to_index_regex('suite/**/*.py')
+        self.assertTrue(regex.fullmatch('suite\\deep\\test_b.py'))
+        self.assertFalse(regex.fullmatch('suite/deep/test_b.py'))
+
+    def test_regex_patterns_matched_in_1_pass(self):
+        matchers = RegexModulePatternMatcher.parse_strs(['.*test_a', '.*deep', 'nothing'])
+        self.assertEqual(matchers[0].included_items, [os.path.join('.', 'suite', 'test_a.py')])
+        self.assertEqual(matchers[1].included_items, [os.path.join('.', 'suite', 'deep', 'test_b.py')])
+        self.assertEqual(matchers[2].included_items, [])
+
+    def test_glob_patterns(self):
+        matchers = GlobModulePatternMatcher.parse_strs([os.path.join('**', 'test_?.py'), os.path.join('.', 'suite', '*'),
+                                                        os.path.join('suite', 'test_d.log')])
+        self.assertEqual(matchers[0].included_items, [os.path.join('suite', 'deep', 'test_b.py'), os.path.join('suite', 'test_a.py')])
+        self.assertEqual(matchers[1].included_items, [os.path.join('.', 'suite', x) for x in ('__init__.py', 'deep', 'test_a.py')])
+        # Paths without wildcards are looked for like before
+        self.assertEqual(matchers[2].included_items, [os.path.join('suite', 'test_d.log')])
+
+
+class TestTagPatternMatchers(unittest.TestCase):
+    @staticmethod
+    def create_func(module_name: str, name: str, tags: list = None):
+        def func():
+            pass
+        func.__module__ = module_name
+        func.__name__ = func.__qualname__ = name
+        if tags is not None:
+            func.metadata = {'tags': tags}
+        return func
+
+    def create_matchers(self, pattern: str):
+        paths_str, _, tests_str = pattern.partition('::')
+        module_matcher = TagModulePatternMatcher.parse_str(paths_str)
+        test_matcher = TagTestCasePatternMatcher.parse_str(tests_str)
+        module_matcher.bind(test_matcher)
+        return module_matcher, test_matcher
+
+    def selected(self, pattern: str, module_tags: list, func_tags: dict) -> list:
+        module_matcher, test_matcher = self.create_matchers(pattern)
+        module = types.ModuleType('module')
+        module.__tags__ = module_tags
+        self.assertTrue(module_matcher.module_included(module))
+        return [name for name, tags in func_tags.items()
+                if test_matcher.func_included(self.create_func('module', name, tags))]
+
+    def test_comma_separated_tags(self):
+        func_tags = {'test_1': ['a'], 'test_2': ['b'], 'test_3': None}
+        self.assertEqual(self.selected(os.path.join('package', 'a,'), [], func_tags), ['test_1'])
+        self.assertEqual(self.selected(os.path.join('package', '!a,b'), [], func_tags), ['test_3'])
+        self.assertEqual(self.selected(os.path.join('package', 'a,'), ['a'], func_tags), list(func_tags))
+        self.assertEqual(self.selected('module.py::a,b', [], func_tags), ['test_1', 'test_2'])
+
+    def test_boolean_expression(self):
+        func_tags = {'test_1': ['a'], 'test_2': ['a', 'slow'], 'test_3': ['b', 'c'], 'test_4': ['c']}
+        self.assertEqual(self.selected(os.path.join('package', '(a or b) and not slow'), [], func_tags), ['test_1', 'test_3'])
+        self.assertEqual(self.selected(os.path.join('package', 'a and slow or b and c'), [], func_tags), ['test_2', 'test_3'])
+        self.assertEqual(self.selected(os.path.join('package', 'c') + '::not b', [], func_tags), ['test_1', 'test_2', 'test_4'])
+
+    def test_folder_is_not_a_tag_expression(self):
+        module_matcher, _ = self.create_matchers(os.path.join('package', 'product'))
+        self.assertIsNone(module_matcher.tag_expression)
+        self.assertEqual(module_matcher.included_items, [os.path.join('package', 'product')])
+
+    def test_invalid_expression(self):
+        for pattern in ('a and', '(a or b', 'a)', 'not'):
+            with self.assertRaises(ValueError):
+                TagExpression(pattern)
+
+    def test_index_keeps_module_tags(self):
+        index = TagIndex()
+        index.add('module', ['a', 'b'])
+        index.add('module', ['c'])
+        self.assertEqual(index.tags('module'), {'c'})
+        self.assertEqual(index.tags('other'), frozenset())
+
+    def test_suites_selected_concurrently(self):
+        patterns = {'a,': ['test_0'], 'b,': ['test_1'], 'a or b': ['test_0', 'test_1']}
+        results = {}
+
+        def select(pattern):
+            results[pattern] = self.selected(os.path.join('package', pattern), [], {f'test_{i}': [('a', 'b', 'c')[i % 3]] for i in range(3)})
+
+        threads = [threading.Thread(target=select, args=(x,)) for x in patterns]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, patterns)
@@ -0,0 +1,53 @@
+import unittest
+
+from end2.logger import empty_logger
+from end2.pooling import TestParametersPool
+
+
+class Client:
+    def __init__(self, logger) -> None:
+        self.logger = logger
+        self.closed = False
+
+
+class TestTestParametersPool(unittest.TestCase):
+    def setUp(self) -> None:
+        self.pool = TestParametersPool(lambda logger, package_object: ((Client(logger),), {}), size=1
+                                       , on_close=lambda client: setattr(client, 'closed', True))
+        return super().setUp()
+
+    def test_released_parameters_are_reused(self):
+        parameters = self.pool.acquire(empty_logger, None)
+        self.pool.release(parameters, None)
+        self.assertIs(self.pool.acquire(empty_logger, None), parameters)
+        self.assertEqual(self.pool.created, 1)
+
+    def test_new_parameters_when_all_checked_out(self):
+        parameters1 = self.pool.acquire(empty_logger, None)
+        parameters2 = self.pool.acquire(empty_logger, None)
+        self.assertIsNot(parameters1, parameters2)
+        self.assertEqual(self.pool.created, 2)
+
+    def test_extra_parameters_closed(self):
+        parameters1 = self.pool.acquire(empty_logger, None)
+        parameters2 = self.pool.acquire(empty_logger, None)
+        self.pool.release(parameters1, None)
+        self.pool.release(parameters2, None)
+        self.assertFalse(parameters1[0][0].closed)
+        self.assertTrue(parameters2[0][0].closed)
+        self.pool.close()
+        self.assertTrue(parameters1[0][0].closed)
+
+    def test_not_shared_between_package_objects(self):
+        parameters = self.pool.acquire(empty_logger, 'package1')
+        self.pool.release(parameters, 'package1')
+        self.assertIsNot(self.pool.acquire(empty_logger, 'package2'), parameters)
+
+    def test_failed_release_closes_parameters(self):
+        def on_release(client):
+            raise ConnectionError()
+        self.pool.on_release = on_release
+        parameters = self.pool.acquire(empty_logger, None)
+        self.pool.release(parameters, None)
+        self.assertTrue(parameters[0][0].closed)
+        self.assertIsNot(self.pool.acquire(empty_logger, None), parameters)
@@ -0,0 +1,84 @@
+from datetime import timedelta
+import os
+import tempfile
+import types
+import unittest
+
+from end2.constants import Status
+from end2.models.result import (
+    TestMethodResult,
+    TestModuleResult,
+    TestSuiteResult
+)
+from end2.resource_profile import RunHistory
+
+
+def create_suite_result(module_seconds: float, test_seconds: float, status: Status = Status.PASSED) -> TestSuiteResult:
+    module = types.SimpleNamespace(name='module', file_name='module.py', description='', last_modified=1.0)
+    module_result = TestModuleResult(module)
+    test_result = TestMethodResult('test_1', status=status)
+    test_result.end()
+    test_result.duration = timedelta(seconds=test_seconds)
+    module_result.append(test_result)
+    module_result.end()
+    module_result.duration = timedelta(seconds=module_seconds)
+    return TestSuiteResult('suite', [module_result])
+
+
+class TestRunHistory(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'history')
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.folder.cleanup()
+        return super().tearDown()
+
+    def test_missing_history_is_empty(self):
+        history = RunHistory.load(self.path)
+        self.assertIsNone(history.module_seconds('module'))
+
+    def test_corrupted_history_is_empty(self):
+        with open(self.path, 'w') as f:
+            f.write('{not json')
+        self.assertEqual(RunHistory.load(self.path).modules, {})
+
+    def test_save_and_load(self):
+        history = RunHistory(self.path)
+        history.update(create_suite_result(4.0, 3.0))
+        history.save()
+        loaded = RunHistory.load(self.path)
+        self.assertEqual(loaded.module_seconds('module'), 4.0)
+        self.assertEqual(loaded.test_seconds('module', 'test_1'), 3.0)
+
+    def test_update_smooths_durations(self):
+        history = RunHistory(self.path)
+        history.update(create_suite_result(4.0, 2.0))
+        history.update(create_suite_result(8.0, 4.0))
+        self.assertEqual(history.module_seconds('module'), 6.0)
+        self.assertEqual(history.test_seconds('module', 'test_1'), 3.0)
+
+    def test_recent_failures_expire(self):
+        history = RunHistory(self.path)
+        history.update(create_suite_result(1.0, 1.0, Status.FAILED))
+        self.assertEqual(history.recent_failures('module'), {'test_1': 0})
+        history.update(create_suite_result(1.0, 1.0))
+        self.assertEqual(history.recent_failures('module'), {'test_1': 1})
+        for _ in range(RunHistory.RECENT_RUNS):
+            history.update(create_suite_result(1.0, 1.0))
+        self.assertEqual(history.recent_failures('module'), {})
+
+    def test_recent_failures_count_skipped_runs(self):
+        history = RunHistory(self.path)
+        history.update(create_suite_result(1.0, 1.0, Status.FAILED))
+        history.update(create_suite_result(1.0, 1.0, Status.SKIPPED))
+        history.update(create_suite_result(1.0, 1.0))
+        self.assertEqual(history.recent_failures('module'), {'test_1': 2})
+
+    def test_module_modified(self):
+        history = RunHistory(self.path)
+        self.assertTrue(history.module_modified('module', 1.0))
+        history.update(create_suite_result(1.0, 1.0))
+        self.assertFalse(history.module_modified('module', 1.0))
+        self.assertTrue(history.module_modified('module', 2.0))
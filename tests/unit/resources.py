@@ -0,0 +1,49 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from end2.resources import ResourcePool
+
+
+class TestResourcePool(unittest.TestCase):
+    def test_unlimited_resources_are_always_free(self):
+        pool = ResourcePool({'payments': 1})
+        self.assertTrue(pool.try_acquire(['search']))
+        self.assertTrue(pool.try_acquire(['search']))
+        self.assertTrue(pool)
+        self.assertFalse(ResourcePool())
+
+    def test_acquire_is_all_or_nothing(self):
+        pool = ResourcePool({'payments': 1, 'search': 1})
+        self.assertTrue(pool.try_acquire(['payments']))
+        self.assertFalse(pool.try_acquire(['search', 'payments']))
+        self.assertTrue(pool.try_acquire(['search']))
+        pool.release(['payments'])
+        self.assertFalse(pool.try_acquire(['search', 'payments']))
+        pool.release(['search'])
+        self.assertTrue(pool.try_acquire(['search', 'payments']))
+
+    def test_acquire_waits_for_release(self):
+        pool = ResourcePool({'payments': 1})
+        pool.acquire(['payments'])
+        threading.Timer(0.2, pool.release, args=(['payments'],)).start()
+        start = time.monotonic()
+        pool.acquire(['payments'])
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+    def test_acquire_async_does_not_block_loop(self):
+        pool = ResourcePool({'payments': 1})
+        pool.acquire(['payments'])
+        ticks = []
+
+        async def ticker():
+            for _ in range(3):
+                ticks.append(True)
+                await asyncio.sleep(0.05)
+            pool.release(['payments'])
+
+        async def run_both():
+            await asyncio.gather(pool.acquire_async(['payments']), ticker())
+        asyncio.run(run_both())
+        self.assertEqual(len(ticks), 3)
@@ -1,10 +1,108 @@
 import asyncio
+import concurrent.futures
+import sys
+import tempfile
+import threading
+import time
+import types
 import unittest
+from unittest import mock
 
-from end2 import runner
-from end2.constants import Status
-from end2.logger import empty_logger
-from end2 import exceptions
+from end2 import (
+    arg_parser,
+    discovery,
+    exceptions,
+    fixtures,
+    runner
+)
+from end2.constants import (
+    RunMode,
+    Status
+)
+from end2.logger import (
+    empty_logger,
+    SuiteLogManager
+)
+from end2.models.result import TestSuiteResult
+from end2.models.testing_containers import (
+    TestModule,
+    TestPackage
+)
+from end2.pattern_matchers import DefaultTestCasePatternMatcher
+from end2.pooling import pooled_test_parameters
+from end2.resources import ResourcePool
+
+
+def create_fake_module(name: str, run_mode: RunMode, **attributes) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__file__ = __file__
+    module.__run_mode__ = run_mode
+    for k, v in attributes.items():
+        setattr(module, k, v)
+    return module
+
+
+def create_fake_test_module(name: str, run_mode: RunMode, **attributes) -> TestModule:
+    module = create_fake_module(name, run_mode, **attributes)
+    return TestModule(module, discovery.discover_groups(module, DefaultTestCasePatternMatcher([], '', True)))
+
+
+def sleepy_test(seconds: float = 0.5):
+    def test_1(logger):
+        time.sleep(seconds)
+    return test_1
+
+
+class TestTimeouts(unittest.TestCase):
+    def test_hung_sync_test_fails_without_holding_caller(self):
+        hang = threading.Event()
+
+        def test_1():
+            hang.wait(10)
+        start = time.monotonic()
+        result = runner.run_test_func(empty_logger, None, runner.with_timeout(test_1, 0.2))
+        hang.set()
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(result.status, Status.FAILED)
+        self.assertIn('TimeoutError', result.record)
+        self.assertEqual(result.name, 'test_1')
+
+    def test_sync_test_under_timeout_keeps_its_outcome(self):
+        def test_1(a):
+            assert a == 2, 'not 2'
+        result = runner.run_test_func(empty_logger, None, runner.with_timeout(test_1, 1.0), 1)
+        self.assertEqual(result.status, Status.FAILED)
+        self.assertEqual(result.record, 'not 2')
+
+    def test_hung_async_test_is_cancelled(self):
+        cancelled = []
+
+        async def test_1():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+        result = asyncio.run(runner.run_async_test_func(empty_logger, None, runner.with_timeout(test_1, 0.2)))
+        self.assertEqual(result.status, Status.FAILED)
+        self.assertIn('TimeoutError', result.record)
+        self.assertEqual(cancelled, [True])
+
+    def test_metadata_timeout_overrides_default(self):
+        resolver = runner.ParametersResolver(lambda *_: ((), {}), None, test_timeout=0.0)
+
+        def test_1():
+            pass
+
+        @fixtures.metadata(timeout=1)
+        def test_2():
+            pass
+        self.assertIs(resolver.time_limited(test_1), test_1)
+        self.assertIsNot(resolver.time_limited(test_2), test_2)
+        resolver.test_timeout = 5
+        test_2.metadata['timeout'] = 0
+        self.assertIsNot(resolver.time_limited(test_1), test_1)
+        self.assertIs(resolver.time_limited(test_2), test_2)
 
 
 class TestRunMethod(unittest.TestCase):
@@ -64,6 +162,16 @@ class TestRunMethod(unittest.TestCase):
         self.assertEqual(result.status, Status.FAILED)
         self.assertIn(expected_record, result.record)
 
+    def test_method_end_counts_ends_before_expect(self):
+        def test_4(*, end):
+            end()
+            end.expect(2)
+        ender = runner.Ender(0.5)
+        end = ender.create()
+        result = runner.run_test_func(empty_logger, ender, test_4, end=end)
+        self.assertEqual(result.status, Status.FAILED)
+        self.assertIn('time out', result.record)
+
     def test_method_end_callback_timeout(self):
         expected_timeout = 1.0
         def test_4(*, end):
@@ -150,3 +258,671 @@ class TestRunMethodAsync(unittest.TestCase):
         result = asyncio.run(runner.run_async_test_func(empty_logger, ender, test_4, end=end))
         self.assertEqual(result.status, Status.FAILED)
         self.assertIn(str(expected_timeout), result.record)
+
+
+    def test_async_ender_does_not_block_loop(self):
+        ticks = []
+
+        async def ticker():
+            for _ in range(5):
+                ticks.append(True)
+                await asyncio.sleep(0.1)
+
+        async def test_4(*, end):
+            asyncio.get_running_loop().call_later(0.6, end)
+
+        async def run_both():
+            ender = runner.AsyncEnder(2.0)
+            end = ender.create()
+            ticker_task = asyncio.ensure_future(ticker())
+            result = await runner.run_async_test_func(empty_logger, ender, test_4, end=end)
+            await ticker_task
+            return result
+        result = asyncio.run(run_both())
+        self.assertEqual(result.status, Status.PASSED)
+        self.assertEqual(len(ticks), 5)
+
+    def test_async_ender_count_down(self):
+        async def test_4(*, end):
+            end.expect(3)
+            loop = asyncio.get_running_loop()
+            for delay in (0.1, 0.2, 0.3):
+                loop.call_later(delay, end)
+        ender = runner.AsyncEnder(2.0)
+        end = ender.create()
+        result = asyncio.run(runner.run_async_test_func(empty_logger, ender, test_4, end=end))
+        self.assertEqual(result.status, Status.PASSED)
+        self.assertEqual(ender.remaining, 0)
+
+    def test_async_ender_counts_ends_before_expect(self):
+        async def test_4(*, end):
+            end()
+            end.expect(3)
+            loop = asyncio.get_running_loop()
+            for delay in (0.1, 0.2):
+                loop.call_later(delay, end)
+        ender = runner.AsyncEnder(2.0)
+        end = ender.create()
+        start = time.monotonic()
+        result = asyncio.run(runner.run_async_test_func(empty_logger, ender, test_4, end=end))
+        self.assertEqual(result.status, Status.PASSED)
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertEqual(ender.remaining, 0)
+
+    def test_async_ender_count_down_timeout(self):
+        expected_timeout = 0.5
+        async def test_4(*, end):
+            end.expect(2)
+            end()
+        ender = runner.AsyncEnder(expected_timeout)
+        end = ender.create()
+        result = asyncio.run(runner.run_async_test_func(empty_logger, ender, test_4, end=end))
+        self.assertEqual(result.status, Status.FAILED)
+        self.assertIn(str(expected_timeout), result.record)
+
+    def test_async_ender_called_from_other_thread(self):
+        expected_record = "i fail from a thread"
+        async def test_4(*, end):
+            def handler():
+                try:
+                    end.fail(expected_record)
+                except exceptions.OnEventFailedException:
+                    pass
+            threading.Timer(0.1, handler).start()
+        ender = runner.AsyncEnder(2.0)
+        end = ender.create()
+        result = asyncio.run(runner.run_async_test_func(empty_logger, ender, test_4, end=end))
+        self.assertEqual(result.status, Status.FAILED)
+        self.assertIn(expected_record, result.record)
+
+
+class TestRunTestsAsync(unittest.TestCase):
+    def setUp(self) -> None:
+        self.module = create_fake_module('fake_async_module', RunMode.PARALLEL)
+        self.log_folder = tempfile.TemporaryDirectory()
+        self.log_manager = SuiteLogManager('unit_run_tests_async', base_folder=self.log_folder.name)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.executor.shutdown()
+        self.log_manager.close()
+        self.log_folder.cleanup()
+        runner.close_event_loops()
+        return super().tearDown()
+
+    def _create_module_run(self, *arg_list, test_parameters_func=runner.default_test_parameters) -> runner.TestModuleRun:
+        args = arg_parser.default_parser().parse_args(list(arg_list))
+        groups = discovery.discover_groups(self.module, DefaultTestCasePatternMatcher([], '', True))
+        test_module = TestModule(self.module, groups)
+        return runner.TestModuleRun(test_parameters_func, test_module, self.log_manager, None, args, self.executor)
+
+    def test_coroutines_run_concurrently(self):
+        async def test_1(logger):
+            await asyncio.sleep(0.5)
+
+        async def test_2(logger):
+            await asyncio.sleep(0.5)
+
+        async def test_3(logger):
+            await asyncio.sleep(0.5)
+        self.module.test_1, self.module.test_2, self.module.test_3 = test_1, test_2, test_3
+        module_run = self._create_module_run()
+        start = time.monotonic()
+        results = module_run.run_tests(module_run.module.groups)
+        self.assertLess(time.monotonic() - start, 1.4)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(result.status is Status.PASSED for result in results))
+
+    def test_coroutines_capped_by_max_async_tasks(self):
+        in_flight, max_in_flight = 0, 0
+
+        async def test_1(logger):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.1)
+            in_flight -= 1
+        for i in range(6):
+            setattr(self.module, f'test_{i}', types.FunctionType(test_1.__code__, test_1.__globals__, f'test_{i}', None, test_1.__closure__))
+        module_run = self._create_module_run('--max-async-tasks', '2')
+        results = module_run.run_tests(module_run.module.groups)
+        self.assertEqual(len(results), 6)
+        self.assertEqual(max_in_flight, 2)
+
+    def test_stop_on_fail_cancels_remaining_coroutines(self):
+        finished = []
+
+        async def test_1(logger):
+            assert False
+
+        async def test_2(logger):
+            await asyncio.sleep(2)
+            finished.append(True)
+        self.module.test_1, self.module.test_2 = test_1, test_2
+        module_run = self._create_module_run('--stop-on-fail')
+        results = module_run.run_tests(module_run.module.groups)
+        self.assertEqual(finished, [])
+        self.assertTrue(module_run.cancellation.cancelled)
+        self.assertEqual(sorted(x.status.name for x in results), ['FAILED', 'SKIPPED'])
+
+    def test_pooled_test_parameters_reused_and_rebound(self):
+        class Client:
+            logger = None
+
+        @pooled_test_parameters(size=2, on_acquire=lambda logger, client: setattr(client, 'logger', logger))
+        def test_parameters(logger, package_object):
+            return (Client(),), {}
+        loggers = []
+
+        async def test_1(client):
+            loggers.append(client.logger)
+            await asyncio.sleep(0.1)
+        for i in range(6):
+            setattr(self.module, f'test_{i}', types.FunctionType(test_1.__code__, test_1.__globals__, f'test_{i}', None, test_1.__closure__))
+        module_run = self._create_module_run('--max-async-tasks', '2', test_parameters_func=test_parameters)
+        results = module_run.run_tests(module_run.module.groups)
+        self.assertTrue(all(result.status is Status.PASSED for result in results))
+        # Rebound to each test's own logger
+        self.assertEqual(len(set(loggers)), 6)
+        self.assertEqual(test_parameters.created, 2)
+
+
+class TestEventLoops(unittest.TestCase):
+    def tearDown(self) -> None:
+        runner.close_event_loops()
+        return super().tearDown()
+
+    def test_same_loop_reused_on_same_thread(self):
+        self.assertIs(runner.get_event_loop(), runner.get_event_loop())
+
+    def test_different_loop_per_thread(self):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            other_loop = executor.submit(runner.get_event_loop).result()
+        self.assertIsNot(runner.get_event_loop(), other_loop)
+
+    def test_close_event_loops(self):
+        loop = runner.get_event_loop()
+        task = loop.create_task(asyncio.sleep(60))
+        runner.close_event_loops()
+        self.assertTrue(loop.is_closed())
+        self.assertTrue(task.cancelled())
+        self.assertIsNot(runner.get_event_loop(), loop)
+
+
+    def test_event_loops_only_close_their_own_loops(self):
+        event_loops, other_event_loops = runner.EventLoops(), runner.EventLoops()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1, initializer=event_loops.use) as executor, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=1, initializer=other_event_loops.use) as other_executor:
+            loop = executor.submit(runner.get_event_loop).result()
+            other_loop = other_executor.submit(runner.get_event_loop).result()
+        event_loops.close()
+        self.assertTrue(loop.is_closed())
+        self.assertFalse(other_loop.is_closed())
+        other_event_loops.close()
+        self.assertTrue(other_loop.is_closed())
+
+    def test_running_loop_closed_once_done(self):
+        started = threading.Event()
+
+        async def wait():
+            started.set()
+            await asyncio.sleep(0.2)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            loop = executor.submit(runner.get_event_loop).result()
+            future = executor.submit(loop.run_until_complete, wait())
+            started.wait()
+            runner.close_event_loops()
+            self.assertFalse(loop.is_closed())
+            future.result()
+        runner.close_event_loops()
+        self.assertTrue(loop.is_closed())
+
+
+class TestSuiteRunModules(unittest.TestCase):
+    def setUp(self) -> None:
+        self.log_folder = tempfile.TemporaryDirectory()
+        self.log_manager = SuiteLogManager('unit_suite_run_modules', base_folder=self.log_folder.name)
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.log_manager.close()
+        self.log_folder.cleanup()
+        runner.close_event_loops()
+        return super().tearDown()
+
+    def _create_suite_run(self, *arg_list) -> runner.SuiteRun:
+        args = arg_parser.default_parser().parse_args(list(arg_list))
+        return runner.SuiteRun(args, runner.default_test_parameters, None, self.log_manager)
+
+    def test_sequential_modules_run_concurrently(self):
+        package = TestPackage(create_fake_module('fake_package', None))
+        for i in range(3):
+            package.append_module(create_fake_test_module(f'fake_sequential_{i}', RunMode.SEQUENTIAL, test_1=sleepy_test()))
+        package.append_module(create_fake_test_module('fake_parallel', RunMode.PARALLEL, test_1=sleepy_test()))
+        start = time.monotonic()
+        results = self._create_suite_run().run_packages([package])
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result.status is Status.PASSED for result in results))
+
+    def test_sequential_module_tests_stay_in_order(self):
+        running, overlapped = [], []
+
+        def create_test(name):
+            def test(logger):
+                if running:
+                    overlapped.append(name)
+                running.append(name)
+                time.sleep(0.1)
+                running.remove(name)
+            test.__name__ = name
+            return test
+        package = TestPackage(create_fake_module('fake_package', None))
+        package.append_module(create_fake_test_module('fake_sequential', RunMode.SEQUENTIAL, **{f'test_{i}': create_test(f'test_{i}') for i in range(4)}))
+        results = self._create_suite_run().run_packages([package])
+        self.assertEqual(results[0].total_count, 4)
+        self.assertEqual(overlapped, [])
+
+    def test_no_concurrency(self):
+        package = TestPackage(create_fake_module('fake_package', None))
+        package.append_module(create_fake_test_module('fake_sequential', RunMode.SEQUENTIAL, test_1=sleepy_test(0.1)))
+        package.append_module(create_fake_test_module('fake_parallel', RunMode.PARALLEL, test_1=sleepy_test(0.1)))
+        results = self._create_suite_run('--no-concurrency').run_packages([package])
+        self.assertEqual(len(results), 2)
+
+    def test_sibling_packages_run_concurrently(self):
+        events = []
+
+        def create_package(name):
+            @fixtures.setup
+            def setup_package(package_object):
+                events.append(f'setup {name}')
+
+            @fixtures.teardown
+            def teardown_package(package_object):
+                events.append(f'teardown {name}')
+            return create_fake_module(name, None, setup_package=setup_package, teardown_package=teardown_package)
+        package = TestPackage(create_fake_module('fake_package', None))
+        for i in range(3):
+            package.append(create_package(f'fake_package.sub_{i}'))
+            package.sub_packages[-1].append_module(create_fake_test_module(f'fake_package.sub_{i}.module', RunMode.SEQUENTIAL, test_1=sleepy_test()))
+        package.sub_packages[0].append(create_package('fake_package.sub_0.sub'))
+        package.sub_packages[0].sub_packages[0].append_module(create_fake_test_module('fake_package.sub_0.sub.module', RunMode.PARALLEL, test_1=sleepy_test()))
+        start = time.monotonic()
+        results = self._create_suite_run().run_packages([package])
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(len(results), 4)
+        self.assertLess(events.index('setup fake_package.sub_0'), events.index('setup fake_package.sub_0.sub'))
+        self.assertLess(events.index('teardown fake_package.sub_0.sub'), events.index('teardown fake_package.sub_0'))
+
+    def test_more_parallel_modules_than_workers_does_not_stall(self):
+        package = TestPackage(create_fake_module('fake_package', None))
+        for i in range(4):
+            package.append_module(create_fake_test_module(f'fake_stall_parallel_{i}', RunMode.PARALLEL
+                                                          , **{f'test_{j}': sleepy_test(0.05) for j in range(3)}))
+        package.append_module(create_fake_test_module('fake_stall_sequential', RunMode.SEQUENTIAL, test_1=sleepy_test(0.05)))
+        suite_run = self._create_suite_run('--max-workers', '2')
+        results = []
+        # Module runs used to take every pool thread and wait on tests that could never get 1
+        thread = threading.Thread(target=lambda: results.extend(suite_run.run_packages([package])), daemon=True)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result.status is Status.PASSED for module_result in results for result in module_result))
+
+    def test_module_coordinators_capped_by_max_workers(self):
+        lock = threading.Lock()
+        running, peak = [0], [0]
+
+        @fixtures.setup
+        def setup(logger):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+
+        package = TestPackage(create_fake_module('fake_package', None))
+        for i in range(6):
+            package.append_module(create_fake_test_module(f'fake_capped_parallel_{i}', RunMode.PARALLEL, setup=setup, test_1=sleepy_test(0)))
+        results = self._create_suite_run('--max-workers', '2').run_packages([package])
+        self.assertEqual(len(results), 6)
+        self.assertLessEqual(peak[0], 2)
+
+    def test_package_tree_deeper_than_max_workers_does_not_stall(self):
+        package = TestPackage(create_fake_module('fake_deep', None))
+        sub_package = package
+        for i in range(4):
+            sub_package.append(create_fake_module(f'{sub_package.name}.sub_{i}', None))
+            sub_package = sub_package.sub_packages[-1]
+            sub_package.append_module(create_fake_test_module(f'{sub_package.name}.module', RunMode.PARALLEL, test_1=sleepy_test(0)))
+        suite_run = self._create_suite_run('--max-workers', '1')
+        results = []
+        thread = threading.Thread(target=lambda: results.extend(suite_run.run_packages([package])), daemon=True)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(results), 4)
+
+    def test_resource_limit_caps_tests_across_modules(self):
+        lock = threading.Lock()
+        running, peak = [0], [0]
+
+        @fixtures.metadata(resources=['payments'])
+        def test_1(logger):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.1)
+            with lock:
+                running[0] -= 1
+
+        package = TestPackage(create_fake_module('fake_package', None))
+        package.append_module(create_fake_test_module('fake_resource_parallel', RunMode.PARALLEL, test_1=test_1, test_2=sleepy_test(0.1)))
+        package.append_module(create_fake_test_module('fake_resource_module', RunMode.PARALLEL, __resources__=['payments']
+                                                      , test_1=sleepy_test(0.1), test_2=sleepy_test(0.1)))
+        suite_run = self._create_suite_run()
+        suite_run.resource_pool = ResourcePool({'payments': 1})
+        results = suite_run.run_packages([package])
+        self.assertTrue(all(result.status is Status.PASSED for result in results))
+        self.assertEqual(peak[0], 1)
+
+    def test_sequential_and_parallel_modules_sharing_a_resource_do_not_stall(self):
+        package = TestPackage(create_fake_module('fake_package', None))
+        for i in range(2):
+            package.append_module(create_fake_test_module(f'fake_shared_sequential_{i}', RunMode.SEQUENTIAL, __resources__=['payments']
+                                                          , **{f'test_{j}': sleepy_test(0.02) for j in range(3)}))
+        package.append_module(create_fake_test_module('fake_shared_parallel', RunMode.PARALLEL, __resources__=['payments']
+                                                      , **{f'test_{j}': sleepy_test(0.02) for j in range(3)}))
+        suite_run = self._create_suite_run('--max-workers', '2')
+        suite_run.resource_pool = ResourcePool({'payments': 1})
+        results = []
+        # Sequential modules used to block pool threads on slots held by parallel tests still queued in the pool
+        thread = threading.Thread(target=lambda: results.extend(suite_run.run_packages([package])), daemon=True)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(sum(result.passed_count for result in results), 9)
+
+    def test_scoped_fixture_values(self):
+        events = []
+
+        @fixtures.fixture(scope='package')
+        def tenant(logger):
+            events.append('create tenant')
+            yield 'tenant'
+            events.append('delete tenant')
+
+        @fixtures.fixture(scope='module')
+        def token(logger, *, tenant):
+            events.append('create token')
+            return f'{tenant} token'
+
+        @fixtures.fixture()
+        def order(logger, *, token):
+            events.append('create order')
+            return f'{token} order'
+
+        def test_1(logger, *, order, tenant):
+            assert order == 'tenant token order' and tenant == 'tenant'
+
+        fake_package = create_fake_module('fake_fixture_package', None, tenant=tenant)
+        with mock.patch.dict(sys.modules, {fake_package.__name__: fake_package}):
+            package = TestPackage(fake_package)
+            for i in range(2):
+                package.append_module(create_fake_test_module(f'fake_fixture_package.module_{i}', RunMode.PARALLEL
+                                                              , token=token, order=order, test_1=test_1, test_2=test_1))
+        suite_run = self._create_suite_run()
+        results = suite_run.run_packages([package])
+        self.assertTrue(all(result.status is Status.PASSED for module_result in results for result in module_result))
+        self.assertEqual(events.count('create tenant'), 1)
+        self.assertEqual(events.count('create token'), 2)
+        self.assertEqual(events.count('create order'), 4)
+        self.assertEqual(events[-1], 'delete tenant')
+
+    def test_fixtures_check_out_pooled_test_parameters(self):
+        events = []
+
+        @pooled_test_parameters(size=2, on_release=lambda client: events.append(f'release {client}'))
+        def test_parameters(logger, package_object):
+            return ('client',), {}
+
+        @fixtures.fixture(scope='module')
+        def token(client):
+            events.append('create token')
+            yield 'token'
+            events.append('delete token')
+
+        def test_1(client, *, token):
+            assert token == 'token'
+
+        package = TestPackage(create_fake_module('fake_package', None))
+        package.append_module(create_fake_test_module('fake_pooled_fixture', RunMode.SEQUENTIAL, token=token, test_1=test_1, test_2=test_1))
+        args = arg_parser.default_parser().parse_args([])
+        results = runner.SuiteRun(args, test_parameters, None, self.log_manager).run_packages([package])
+        self.assertTrue(all(result.status is Status.PASSED for module_result in results for result in module_result))
+        # 1 checked out by the fixture for the whole module and 1 reused by the tests
+        self.assertEqual(test_parameters.created, 2)
+        self.assertEqual(events[-2:], ['delete token', 'release client'])
+
+    def test_failed_fixture_fails_test(self):
+        @fixtures.fixture(scope='module')
+        def tenant(logger):
+            raise ConnectionError('no tenant')
+
+        def test_1(logger, *, tenant):
+            pass
+
+        package = TestPackage(create_fake_module('fake_package', None))
+        package.append_module(create_fake_test_module('fake_failed_fixture', RunMode.PARALLEL, tenant=tenant, test_1=test_1))
+        results = self._create_suite_run().run_packages([package])
+        self.assertEqual(results[0].test_results[0].status, Status.FAILED)
+        self.assertIn('no tenant', results[0].test_results[0].record)
+
+    def test_wider_fixture_can_not_use_narrower_fixture(self):
+        @fixtures.fixture()
+        def order(logger):
+            return 'order'
+
+        @fixtures.fixture(scope='module')
+        def token(logger, *, order):
+            return 'token'
+
+        def test_1(logger, *, token):
+            pass
+
+        package = TestPackage(create_fake_module('fake_package', None))
+        package.append_module(create_fake_test_module('fake_scope_mismatch', RunMode.PARALLEL, order=order, token=token, test_1=test_1))
+        results = self._create_suite_run().run_packages([package])
+        self.assertEqual(results[0].test_results[0].status, Status.FAILED)
+        self.assertIn('module scoped fixtures can not use order', results[0].test_results[0].record)
+
+    def test_adaptive_concurrency(self):
+        package = TestPackage(create_fake_module('fake_package', None))
+        package.append_module(create_fake_test_module('fake_adaptive_parallel', RunMode.PARALLEL
+                                                      , **{f'test_{i}': sleepy_test(0.05) for i in range(6)}))
+        package.append_module(create_fake_test_module('fake_adaptive_sequential', RunMode.SEQUENTIAL
+                                                      , **{f'test_{i}': sleepy_test(0.05) for i in range(2)}))
+        suite_run = self._create_suite_run('--adaptive-concurrency', '--min-workers', '1', '--max-workers', '4')
+        results = suite_run.run_packages([package])
+        self.assertTrue(all(result.status is Status.PASSED for result in results))
+        self.assertEqual(suite_run.concurrency.in_flight, 0)
+        self.assertGreater(suite_run.concurrency.current_limit, 1)
+
+    def test_stop_on_fail_cancels_other_modules(self):
+        def test_fail(logger):
+            time.sleep(0.1)
+            assert False
+        package = TestPackage(create_fake_module('fake_package', None))
+        package.append_module(create_fake_test_module('fake_cancel_failing', RunMode.PARALLEL, test_1=test_fail))
+        # Only 1 test at a time so the rest of the parallel module is still waiting when the run is cancelled
+        package.append_module(create_fake_test_module('fake_cancel_parallel', RunMode.PARALLEL, __resources__=['payments']
+                                                      , **{f'test_{i}': sleepy_test(1) for i in range(3)}))
+        package.append_module(create_fake_test_module('fake_cancel_sequential', RunMode.SEQUENTIAL
+                                                      , **{f'test_{i}': sleepy_test(1) for i in range(3)}))
+        suite_run = self._create_suite_run('--stop-on-fail')
+        suite_run.resource_pool = ResourcePool({'payments': 1})
+        start = time.monotonic()
+        results = suite_run.run_packages([package])
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertTrue(suite_run.cancellation.cancelled)
+        self.assertEqual(sum(result.total_count for result in results), 7)
+        self.assertEqual(sum(result.failed_count for result in results), 1)
+        self.assertEqual(sum(result.skipped_count for result in results), 4)
+
+    def test_cancelled_tests_give_back_their_slots(self):
+        def test_fail(logger):
+            time.sleep(0.1)
+            assert False
+        package = TestPackage(create_fake_module('fake_package', None))
+        # Modules start in random order so each has a failing test to cancel the run in whichever starts first
+        for i in range(4):
+            package.append_module(create_fake_test_module(f'fake_release_parallel_{i}', RunMode.PARALLEL, __resources__=['payments']
+                                                          , test_fail=test_fail, **{f'test_{j}': sleepy_test(0.2) for j in range(4)}))
+        suite_run = self._create_suite_run('--stop-on-fail', '--max-workers', '2')
+        # More slots than pool threads so tests are queued in the pool holding slots when the run is cancelled
+        suite_run.resource_pool = ResourcePool({'payments': 10})
+        results = suite_run.run_packages([package])
+        self.assertTrue(suite_run.cancellation.cancelled)
+        self.assertGreater(sum(result.skipped_count for result in results), 0)
+        # Watch mode reuses these so anything still held would be lost for every later run
+        self.assertEqual(+suite_run.resource_pool._in_use, {})
+
+    @unittest.skipUnless(runner.can_fork(), 'needs fork')
+    def test_stop_on_fail_shared_with_worker_processes(self):
+        def test_fail(logger):
+            time.sleep(0.2)
+            assert False
+        package = TestPackage(create_fake_module('fake_package', None))
+        package.append_module(create_fake_test_module('fake_forked_failing', RunMode.PARALLEL, test_1=test_fail))
+        package.append_module(create_fake_test_module('fake_forked_sequential', RunMode.SEQUENTIAL
+                                                      , **{f'test_{i}': sleepy_test(0.2) for i in range(10)}))
+        suite_run = self._create_suite_run('--executor', 'process', '--stop-on-fail', '--max-workers', '2')
+        results = suite_run.run_packages([package])
+        self.assertTrue(suite_run.cancellation.cancelled)
+        self.assertIn('fake_forked_failing', suite_run.cancellation.reason)
+        # Running in another worker when the failing module stopped the run
+        sequential_result = next(x for x in results if x.name == 'fake_forked_sequential')
+        self.assertGreater(sequential_result.skipped_count, 0)
+
+    def test_module_that_fails_to_load_fails_its_tests(self):
+        def loader():
+            raise ImportError('No module named sdk')
+        test_module = create_fake_test_module('fake_load_fails', RunMode.PARALLEL, test_1=sleepy_test(0), test_2=sleepy_test(0))
+        test_module.loader = loader
+        package = TestPackage(create_fake_module('fake_package', None))
+        package.append_module(test_module)
+        results = self._create_suite_run().run_packages([package])
+        self.assertEqual(results[0].failed_count, 2)
+        self.assertTrue(all('No module named sdk' in x.record for x in results[0].test_results))
+
+    def test_tests_failed_by_load_are_rerun(self):
+        calls = []
+
+        class Group1:
+            @staticmethod
+            def test_1(logger):
+                calls.append('Group1 test_1')
+
+        class Group2:
+            @staticmethod
+            def test_1(logger):
+                calls.append('Group2 test_1')
+
+        def loader():
+            raise ImportError('No module named sdk')
+        test_module = create_fake_test_module('fake_load_rerun', RunMode.SEQUENTIAL, Group1=Group1, Group2=Group2)
+        # Only the 1st load fails
+        test_module.loader = loader
+        package = TestPackage(create_fake_module('fake_package', None))
+        package.append_module(test_module)
+        suite_run = self._create_suite_run('--reruns', '1')
+        suite_run.results = TestSuiteResult(suite_run.name)
+        suite_run.results.extend(suite_run.run_packages([package]))
+        suite_run.rerun_failed_tests([package])
+        statuses = {x.key: (x.status, len(x.attempts)) for x in suite_run.results.test_modules[0]}
+        self.assertEqual(statuses, {'fake_load_rerun.Group1::test_1': (Status.PASSED, 1), 'fake_load_rerun.Group2::test_1': (Status.PASSED, 1)})
+        self.assertEqual(sorted(calls), ['Group1 test_1', 'Group2 test_1'])
+
+    def test_reruns_only_failed_tests_with_their_group(self):
+        calls = []
+
+        def test_flaky(logger):
+            calls.append('test_flaky')
+            assert calls.count('test_flaky') > 1
+
+        def test_passes(logger):
+            calls.append('test_passes')
+
+        @fixtures.parameterize([(1,), (2,), (3,)])
+        def test_param(logger, x):
+            calls.append(f'test_param {x}')
+            assert x != 2
+
+        class Group1:
+            @staticmethod
+            @fixtures.setup
+            def setup_group(logger):
+                calls.append('setup Group1')
+
+            @staticmethod
+            def test_in_group(logger):
+                calls.append('test_in_group')
+                assert calls.count('test_in_group') > 2
+        package = TestPackage(create_fake_module('fake_package', None))
+        package.append_module(create_fake_test_module('fake_rerun', RunMode.PARALLEL, test_flaky=test_flaky, test_passes=test_passes
+                                                      , test_param=test_param, Group1=Group1))
+        suite_run = self._create_suite_run('--reruns', '2')
+        suite_run.results = TestSuiteResult(suite_run.name)
+        suite_run.results.extend(suite_run.run_packages([package]))
+        suite_run.rerun_failed_tests([package])
+        module_result = suite_run.results.test_modules[0]
+        statuses = {x.key: (x.status, len(x.attempts)) for x in module_result}
+        self.assertEqual(statuses, {
+            'fake_rerun::test_flaky': (Status.PASSED, 1),
+            'fake_rerun::test_passes': (Status.PASSED, 0),
+            'fake_rerun::test_param[0]': (Status.PASSED, 0),
+            'fake_rerun::test_param[1]': (Status.FAILED, 2),
+            'fake_rerun::test_param[2]': (Status.PASSED, 0),
+            'fake_rerun.Group1::test_in_group': (Status.PASSED, 2),
+        })
+        self.assertEqual(calls.count('test_passes'), 1)
+        self.assertEqual(calls.count('test_param 2'), 3)
+        self.assertEqual(calls.count('setup Group1'), 3)
+        self.assertEqual((module_result.passed_count, module_result.failed_count), (5, 1))
+
+    def test_lazy_parameters_are_pulled_as_tests_run(self):
+        pulled, finished = [], []
+        lock = threading.Lock()
+        rerunning = False
+
+        def cases():
+            for i in range(40):
+                with lock:
+                    # Never more than --max-workers cases waiting or running at once
+                    if not rerunning:
+                        self.assertLessEqual(len(pulled) - len(finished), 4)
+                    pulled.append(i)
+                yield i, i % 10 != 3
+
+        @fixtures.parameterize(cases)
+        def test_1(logger, i, passes):
+            time.sleep(0.01)
+            with lock:
+                finished.append(i)
+            assert passes
+        package = TestPackage(create_fake_module('fake_package', None))
+        package.append_module(create_fake_test_module('fake_lazy', RunMode.PARALLEL, test_1=test_1))
+        suite_run = self._create_suite_run('--max-workers', '4', '--reruns', '1')
+        suite_run.results = TestSuiteResult(suite_run.name)
+        suite_run.results.extend(suite_run.run_packages([package]))
+        self.assertEqual(sorted(finished), list(range(40)))
+        module_result = suite_run.results.test_modules[0]
+        self.assertEqual((module_result.passed_count, module_result.failed_count), (36, 4))
+        # Reruns go through the source once to find the failed cases
+        rerunning = True
+        suite_run.rerun_failed_tests([package])
+        self.assertEqual(sorted(x.key for x in module_result if x.attempts), sorted(f'fake_lazy::test_1[{i}]' for i in (3, 13, 23, 33)))
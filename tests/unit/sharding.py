@@ -0,0 +1,137 @@
+import os
+import random
+import tempfile
+import types
+import unittest
+
+from end2 import (
+    discovery,
+    sharding
+)
+from end2.constants import (
+    RunMode,
+    Status
+)
+from end2.models.result import (
+    TestMethodResult,
+    TestModuleResult,
+    TestSuiteResult
+)
+from end2.models.testing_containers import (
+    TestModule,
+    TestPackage,
+    TestPackageTree
+)
+from end2.pattern_matchers import DefaultTestCasePatternMatcher
+from end2.resource_profile import RunHistory
+
+
+def create_test_module(name: str, run_mode: RunMode, test_count: int) -> TestModule:
+    module = types.ModuleType(name)
+    module.__file__ = __file__
+    module.__run_mode__ = run_mode
+    for i in range(test_count):
+        def test(logger):
+            pass
+        test.__name__ = f'test_{i}'
+        setattr(module, test.__name__, test)
+    return TestModule(module, discovery.discover_groups(module, DefaultTestCasePatternMatcher([], '', True)))
+
+
+def create_package_tree(modules: list) -> TestPackageTree:
+    package_tree = TestPackageTree()
+    package = TestPackage(types.ModuleType('fake_package'))
+    shuffled = modules[:]
+    random.shuffle(shuffled)
+    for module in shuffled:
+        package.append_module(module)
+    package_tree.packages.append(package)
+    return package_tree
+
+
+class TestShardPackageTree(unittest.TestCase):
+    def setUp(self) -> None:
+        self.history = RunHistory('unused')
+        self.history.modules = {
+            'sequential_big': {'duration': 100.0, 'tests': {}},
+            'parallel_big': {'duration': 100.0, 'tests': {f'test_{i}': 25.0 for i in range(4)}},
+            'parallel_small': {'duration': 10.0, 'tests': {}},
+        }
+        return super().setUp()
+
+    def _create_modules(self) -> list:
+        return [
+            create_test_module('sequential_big', RunMode.SEQUENTIAL, 4),
+            create_test_module('parallel_big', RunMode.PARALLEL, 4),
+            create_test_module('parallel_small', RunMode.PARALLEL, 2),
+            create_test_module('new_module', RunMode.SEQUENTIAL, 3),
+        ]
+
+    def _shard(self, index: int, count: int):
+        package_tree = create_package_tree(self._create_modules())
+        return package_tree, sharding.shard_package_tree(package_tree, index, count, self.history)
+
+    def test_every_unit_in_exactly_1_shard(self):
+        shards = [self._shard(i, 3)[1] for i in range(3)]
+        unit_names = [name for shard in shards for name in shard.unit_names]
+        self.assertEqual(sorted(unit_names), shards[0].total_units)
+
+    def test_deterministic(self):
+        self.assertEqual(self._shard(1, 3)[1].unit_names, self._shard(1, 3)[1].unit_names)
+
+    def test_sequential_module_kept_whole(self):
+        shards = [self._shard(i, 3)[1] for i in range(3)]
+        self.assertIn('sequential_big', [name for shard in shards for name in shard.unit_names])
+
+    def test_big_parallel_module_split(self):
+        shard = self._shard(0, 3)[1]
+        self.assertFalse(any(name == 'parallel_big' for name in shard.total_units))
+        self.assertEqual(len([name for name in shard.total_units if name.startswith('parallel_big::')]), 4)
+
+    def test_balanced(self):
+        loads = [self._shard(i, 2)[1].seconds for i in range(2)]
+        self.assertLessEqual(abs(loads[0] - loads[1]), 25.0)
+
+    def test_package_tree_filtered(self):
+        package_tree, shard = self._shard(0, 3)
+        modules = package_tree.packages[0].sequential_modules | package_tree.packages[0].parallel_modules if package_tree.packages else set()
+        test_count = sum(len(module.groups.tests) for module in modules)
+        whole_module_tests = {'sequential_big': 4, 'parallel_big': 4, 'parallel_small': 2, 'new_module': 3}
+        expected = sum(whole_module_tests[name] if name in whole_module_tests else 1 for name in shard.unit_names)
+        self.assertEqual(test_count, expected)
+
+    def test_invalid_index(self):
+        with self.assertRaises(ValueError):
+            self._shard(3, 3)
+
+
+class TestLoadShardHistory(unittest.TestCase):
+    def test_no_durations_without_a_shared_file(self):
+        self.assertEqual(sharding.load_shard_history(None).modules, {})
+
+    def test_shared_file(self):
+        with tempfile.TemporaryDirectory() as folder:
+            history = RunHistory(os.path.join(folder, '.end2history'))
+            history.modules = {'module': {'duration': 5.0, 'tests': {}}}
+            history.save()
+            self.assertEqual(sharding.load_shard_history(history.path).module_seconds('module'), 5.0)
+
+    def test_missing_file(self):
+        with self.assertRaises(FileNotFoundError):
+            sharding.load_shard_history(os.path.join('missing', '.end2history'))
+
+
+class TestCombineShardReports(unittest.TestCase):
+    def test_combine(self):
+        module_result = TestModuleResult(types.SimpleNamespace(name='module', file_name='module.py', description=''))
+        module_result.append(TestMethodResult('test_1', status=Status.PASSED).end())
+        suite_result = TestSuiteResult('suite', [module_result.end()]).end()
+        with tempfile.TemporaryDirectory() as folder:
+            shard = sharding.Shard(0, 2, [], ['module', 'other_module'], 1.0)
+            shard.units = [sharding.ShardUnit(types.SimpleNamespace(name='module'), 1.0)]
+            path = sharding.write_shard_report(folder, shard, suite_result)
+            self.assertTrue(os.path.exists(path))
+            combined = sharding.combine_shard_reports([path])
+        self.assertEqual(combined['missing_units'], ['other_module'])
+        self.assertEqual(combined['counts'][Status.PASSED.value], 1)
+        self.assertEqual(combined['status'], Status.PASSED.value)
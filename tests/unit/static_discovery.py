@@ -0,0 +1,134 @@
+import os
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+from end2 import static_discovery
+from end2.constants import RunMode
+from end2.static_discovery import (
+    DiscoveryIndex,
+    parse_test_module
+)
+
+
+class TestParseTestModule(unittest.TestCase):
+    def _parse(self, source: str):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'fake_static.py')
+            with open(path, 'w') as f:
+                f.write(textwrap.dedent(source))
+            return parse_test_module(path, 'fake_static')
+
+    def test_groups_tests_and_module_attributes(self):
+        module = self._parse('''
+            """My module"""
+            from end2 import RunMode, fixture, metadata, parameterize, setup
+
+            __run_mode__ = RunMode.SEQUENTIAL
+            __tags__ = ['smoke']
+            __resources__ = ('payments',)
+
+            @fixture(scope='module')
+            def test_like_fixture(logger):
+                pass
+
+            @metadata(tags=['fast'])
+            def test_1(logger):
+                """Doc"""
+
+            @parameterize([(1, 2), (object(), 3)])
+            def test_params(logger, a, b):
+                pass
+
+            async def test_2(logger):
+                pass
+
+            class Group1:
+                @staticmethod
+                @setup
+                def my_setup(logger):
+                    pass
+
+                def test_3(logger):
+                    pass
+
+                class Group2:
+                    def test_4(logger):
+                        pass
+        ''')
+        self.assertEqual(module.run_mode, RunMode.SEQUENTIAL)
+        self.assertEqual(module.description, 'My module')
+        self.assertEqual(module.tags, ['smoke'])
+        self.assertEqual(module.resources, ('payments',))
+        self.assertEqual([x.name for x in module.groups.tests], ['test_1', 'test_params', 'test_2'])
+        self.assertEqual(module.groups.tests[1].parameterized_count, 2)
+        self.assertEqual(module.groups.tests[0].metadata, {'tags': ['fast']})
+        self.assertEqual(module.groups.tests[0].description, 'Doc')
+        group1 = module.groups.children[0]
+        self.assertEqual((group1.name, [x.name for x in group1.tests]), ('Group1', ['test_3']))
+        self.assertEqual([x.name for x in group1.children[0].tests], ['test_4'])
+
+    def test_dynamic_modules_are_not_parsed(self):
+        header = 'from end2 import RunMode, parameterize\n__run_mode__ = RunMode.PARALLEL\n'
+        dynamic_sources = [
+            '@parameterize(cases)\ndef test_1(logger, x):\n    pass\n',
+            'from helpers import test_shared\n',
+            'for i in range(2):\n    def test_1(logger):\n        pass\n',
+            "globals()['test_1'] = lambda logger: None\n",
+            'class Group1(Base):\n    pass\n',
+            '__tags__ = get_tags()\n',
+            'def __getattr__(name):\n    pass\n'
+        ]
+        for source in dynamic_sources:
+            self.assertIsNone(self._parse(header + source), source)
+        self.assertIsNone(self._parse('def test_1(logger):\n    pass\n'))
+        self.assertIsNone(self._parse('__run_mode__ = get_run_mode()\n'))
+        self.assertIsNone(self._parse('def test_1(:\n'))
+
+
+class TestDiscoveryIndex(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.folder.name, 'fake_indexed.py')
+        self.index_path = os.path.join(self.folder.name, 'index')
+        self._write('__run_mode__ = PARALLEL\n__tags__ = {"smoke"}\ndef test_1(logger):\n    pass\n')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def _write(self, source: str, mtime_ns: int = 1) -> None:
+        with open(self.file_path, 'w') as f:
+            f.write(source)
+        os.utime(self.file_path, ns=(mtime_ns, mtime_ns))
+
+    def _parse(self):
+        index = DiscoveryIndex.load(self.index_path)
+        with mock.patch.object(static_discovery, '_parse_source', wraps=static_discovery._parse_source) as parse_source:
+            static_module = index.parse_test_module(self.file_path, 'fake_indexed')
+        index.save()
+        return static_module, parse_source.call_count
+
+    def test_unchanged_file_is_not_read_again(self):
+        self.assertEqual(self._parse()[1], 1)
+        static_module, parse_count = self._parse()
+        self.assertEqual(parse_count, 0)
+        self.assertEqual(static_module.tags, {'smoke'})
+        self.assertEqual([x.name for x in static_module.groups.tests], ['test_1'])
+
+    def test_touched_file_with_same_content_is_not_parsed_again(self):
+        self._parse()
+        os.utime(self.file_path, ns=(2, 2))
+        self.assertEqual(self._parse()[1], 0)
+
+    def test_changed_file_is_read_again(self):
+        self._parse()
+        self._write('__run_mode__ = PARALLEL\ndef test_2(logger):\n    pass\n')
+        static_module, parse_count = self._parse()
+        self.assertEqual(parse_count, 1)
+        self.assertEqual([x.name for x in static_module.groups.tests], ['test_2'])
+
+    def test_dynamic_module_is_remembered(self):
+        self._write('__run_mode__ = PARALLEL\nfrom helpers import test_1\n')
+        self.assertEqual(self._parse(), (None, 1))
+        self.assertEqual(self._parse(), (None, 0))